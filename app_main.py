@@ -1,9 +1,14 @@
 from __future__ import annotations
 
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Awaitable, Dict, List, Optional, Tuple
+import asyncio
+import hmac
 import os
+import time
 from datetime import datetime
+from functools import partial
+from urllib.parse import urlencode
 
 # Load configuration from .env and .env.python if present
 from dotenv import load_dotenv
@@ -11,29 +16,44 @@ ROOT = Path(__file__).resolve().parent
 load_dotenv(ROOT / ".env")
 load_dotenv(ROOT / ".env.python", override=True)
 
-from fastapi import FastAPI, File, Form, Request, UploadFile
+from fastapi import Depends, FastAPI, File, Form, HTTPException, Request, UploadFile
 from motor.motor_asyncio import AsyncIOMotorClient
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 import httpx
 
-from ml.model_utils import BreastCancerModel
-from ml.segmentation_utils import get_segmentor
-from ml.segmentation_utils import get_segmentor
+from ml.model_utils import TTA_VIEW_COUNT, MicroBatchingEngine, get_classifier
+from ml.model_registry import get_model_registry, resolve_model_path
+from ml.db_indexes import INDEXES, USERS_COLLECTION, ensure_all_indexes, ensure_indexes
+from ml.case_store import PENDING_REVIEW, REVIEWED, WORKLIST_PAGE_SIZE, ScanCase, WorklistQuery, get_case_store
+from ml.bulk_analysis import BulkItem, count_bulk_images, iter_bulk_images, next_batch
+from ml.job_queue import JOB_ITEMS_PAGE_SIZE, JOB_POLL_SECONDS, TERMINAL_STATUSES, get_job_queue
+from ml.warmup import ModelWarmup
+from ml.write_behind import get_write_behind
+from ml.image_pipeline import DecodedImage
+from ml.image_store import IMAGE_STORE_URL, ImmutableStaticFiles, get_image_store, render_thumbnail, version_tag
+from ml.inference_executor import InferenceTimeoutError, get_inference_executor
+from ml.lazy import MLDisabledError, ensure_ml_enabled
+from ml.prediction_cache import get_prediction_cache
+from ml.segmentation_utils import SEGMENTATION_MODES
+from ml.uploads import BULK_LIMITS, IMAGE_TYPES, REPORT_TYPES, UploadLimitMiddleware, UploadRejected, ingest_upload, ingest_uploads
 
 # Import patient app router
+from patient_app.auth import users_collection
 from patient_app.router import patient_app_router, set_db
 
 ROOT = Path(__file__).resolve().parent
 TEMPLATES_DIR = ROOT / "templates"
 STATIC_DIR = ROOT / "static"
-UPLOADS_DIR = STATIC_DIR / "uploads"
 
 # API Keys
 GEOAPIFY_API_KEY = os.getenv("GEOAPIFY_API_KEY")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 APP_URL = os.getenv("APP_URL")
+# Bearer token for the model admin routes (/api/model-reload); unset disables them
+MODEL_ADMIN_TOKEN = os.getenv("MODEL_ADMIN_TOKEN", "")
 print(f"DEBUG: GEOAPIFY_API_KEY loaded at startup: {GEOAPIFY_API_KEY[:10] if GEOAPIFY_API_KEY else None}")
 print(f"DEBUG: GEMINI_API_KEY loaded at startup: {GEMINI_API_KEY[:10] if GEMINI_API_KEY else None}")
 print(f"DEBUG: APP_URL loaded at startup: {APP_URL}")
@@ -42,56 +62,240 @@ print(f"DEBUG: APP_URL loaded at startup: {APP_URL}")
 MONGODB_URI = os.getenv("MONGODB_URI")
 mongo_client = AsyncIOMotorClient(MONGODB_URI) if MONGODB_URI else None
 db = mongo_client.get_default_database() if mongo_client is not None else None
-db_cases = db["onco_cases"] if db is not None else None
-db_symptoms = db["onco_patient_symptoms"] if db is not None else None
 
 # Pass the database connection to the patient app router
 if db is not None:
     set_db(db)
 
 app = FastAPI(title="Onco-Navigator AI (No React)")
+# Refuse oversized bodies before they are parsed (UPLOAD_MAX_MB / BULK_MAX_REQUEST_MB)
+app.add_middleware(UploadLimitMiddleware)
+
+
+# The ML stack (TensorFlow, OpenCV, spaCy, scikit-learn) is imported on first
+# use, not at startup. With PORTAL_ONLY=1 it is never imported: the routes that
+# need a model answer 503 and the rest of the app is unaffected.
+@app.exception_handler(MLDisabledError)
+async def ml_disabled(request: Request, exc: MLDisabledError) -> JSONResponse:
+    return JSONResponse({"error": str(exc)}, status_code=503)
+
+
+def require_ml() -> None:
+    ensure_ml_enabled("Image analysis")
+
+
+ML_ROUTE = [Depends(require_ml)]
 
 # Include the patient app router
 app.include_router(patient_app_router, prefix="/patient")
 
+# Uploaded scans and their derivatives: content-addressed, so cached for a
+# year (IMAGE_STORE_DIR); mounted before /static so it takes precedence
+image_store = get_image_store()
+app.mount(IMAGE_STORE_URL, ImmutableStaticFiles(directory=image_store.root), name="images")
+
 # Mount static files if directory exists
 if STATIC_DIR.exists():
     app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
 templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
 
-# Load model once at startup (honour MODEL_PATH if set)
-_model_path_env = os.getenv("MODEL_PATH")
-try:
-    model = BreastCancerModel(Path(_model_path_env)) if _model_path_env else BreastCancerModel()
-    segmentor = get_segmentor() # Initialize segmentation model (will try to load h5)
-    print("✅ Breast cancer model loaded successfully")
-except Exception as e:
-    print(f"⚠️ Warning: Could not load breast cancer model: {e}")
-    print("⚠️ Initializing app without model - image analysis features will be disabled")
-    model = None
-
-# In-memory storage for demo (Mongo is used as a mirror for persistence)
-class ScanCase:
-    def __init__(
-        self,
-        case_id: int,
-        patient_name: str,
-        risk_label: str,
-        risk_score: float,
-        image_url: Optional[str] = None,
-        image_path: Optional[Path] = None,
-    ) -> None:
-        self.case_id = case_id
-        self.patient_name = patient_name
-        self.risk_label = risk_label
-        self.risk_score = risk_score
-        self.status = "PENDING_NCG_REVIEW"  # or REVIEWED
-        self.image_url = image_url
-        self.image_path = image_path
-
-
-SCAN_CASES: List[ScanCase] = []
+# Models are loaded on first use through the registry, not at import time
+# ("classifier" honours MODEL_PATH). They can be hot-reloaded via
+# /api/model-reload, and MODEL_IDLE_UNLOAD_SECONDS unloads idle ones.
+registry = get_model_registry()
+
+# Concurrent uploads are coalesced into batched DenseNet forward passes
+# (tune with INFERENCE_MAX_BATCH_SIZE / INFERENCE_BATCH_WINDOW_MS)
+classifier = MicroBatchingEngine(get_classifier)
+
+# All blocking model work runs here, off the event loop
+# (tune with INFERENCE_WORKERS / INFERENCE_TIMEOUT_SECONDS)
+inference = get_inference_executor()
+
+# Long-running analyses (scanned reports, full-resolution segmentation, bulk
+# uploads) run as persistent jobs; state lives in Mongo when configured,
+# otherwise in a local SQLite file (JOB_WORKERS / JOB_DB_PATH / JOB_DATA_DIR)
+jobs = get_job_queue(db)
+
+@app.on_event("startup")
+async def start_jobs() -> None:
+    # Background threads/tasks start here rather than at import, so a
+    # pre-forking server gets them in every worker, not only in the master
+    registry.start_idle_reaper()
+    await jobs.start()
+
+# Models are loaded and run on dummy inputs at startup; /readyz stays 503 until
+# that is done so the load balancer does not route patients to cold models
+# (WARMUP_ON_STARTUP / WARMUP_MODELS / WARMUP_REQUIRED_MODELS)
+model_warmup = ModelWarmup(registry)
+STARTED_AT = time.time()
+
+@app.on_event("startup")
+async def start_warmup() -> None:
+    if model_warmup.enabled:
+        # In the background: /healthz answers while the models warm up
+        app.state.warmup_task = asyncio.create_task(inference.run(model_warmup.run, timeout=0))
+
+
+@app.on_event("shutdown")
+async def shutdown_inference() -> None:
+    await jobs.stop()
+    classifier.close()
+    inference.shutdown(wait=False)
+
+
+async def load_model(name: str) -> Any:
+    """Fetch a model from the registry, loading it off the event loop on first use."""
+    if registry.peek(name) is not None:
+        return registry.get(name)
+    return await inference.run(registry.get, name, timeout=0)
+
+# Repeated uploads of the same image are served from a content-addressed cache
+# (PREDICTION_CACHE_SIZE / PREDICTION_CACHE_TTL_SECONDS / PREDICTION_CACHE_DIR)
+prediction_cache = get_prediction_cache()
+
+
+async def classify_image(image: DecodedImage, tta: bool = False) -> dict:
+    """
+    Label, score and stage for an upload, served from the cache when possible.
+    With ``tta`` the score is the mean over augmented views and ``score_variance``
+    is their variance; all views go through one batched forward pass.
+    """
+    model = await load_model("classifier")
+    stage = "classification-tta" if tta else "classification"
+    cached = prediction_cache.get(image.sha256, stage, model.version)
+    if cached is not None:
+        return cached
+    if tta:
+        score, variance = await inference.wait(classifier.submit(image, tta=True))
+    else:
+        score, variance = await inference.wait(classifier.submit(image)), None
+    result = {"label": model.label_for(score), "score": score, "stage": model.predict_stage(score)}
+    if tta:
+        result["score_variance"] = variance
+    prediction_cache.set(image.sha256, stage, model.version, result)
+    return result
+
+
+async def timed(stage: str, awaitable: Awaitable[Any], timings: Dict[str, float]) -> Any:
+    """Await ``awaitable`` and record its wall time (ms) under ``stage``."""
+    start = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[stage] = (time.perf_counter() - start) * 1000.0
+
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    return ", ".join(f"{stage};dur={ms:.1f}" for stage, ms in timings.items())
+
+
+async def segment_image(image: DecodedImage, mode: str = "standard", timeout: Optional[float] = None) -> Tuple[Optional[dict], Optional[str]]:
+    """Compact segmentation result (or error) for an upload, served from the cache when possible."""
+    stage = f"segmentation-{mode}"
+    segmentor = await load_model("segmentation")
+    cached = prediction_cache.get(image.sha256, stage, segmentor.version)
+    if cached is not None:
+        return cached, None
+    segmentation, error = await inference.run(segmentor.predict_mask, image, mode, timeout=timeout)
+    if segmentation is not None:
+        prediction_cache.set(image.sha256, stage, segmentor.version, segmentation)
+    return segmentation, error
+
+
+async def segment_images(images: List[DecodedImage], mode: str = "standard") -> List[Tuple[Optional[dict], Optional[str]]]:
+    """segment_image for several uploads: cache hits are reused, the misses share one forward pass."""
+    stage = f"segmentation-{mode}"
+    segmentor = await load_model("segmentation")
+    results = [(prediction_cache.get(image.sha256, stage, segmentor.version), None) for image in images]
+    misses = [i for i, (segmentation, _) in enumerate(results) if segmentation is None]
+    if misses:
+        computed = await inference.run(segmentor.predict_mask_batch, [images[i] for i in misses], mode)
+        for i, (segmentation, error) in zip(misses, computed):
+            results[i] = (segmentation, error)
+            if segmentation is not None:
+                prediction_cache.set(images[i].sha256, stage, segmentor.version, segmentation)
+    return results
+
+
+async def analyze_bulk_batch(batch: List[BulkItem], first_index: int, mode: str, with_segmentation: bool) -> List[dict]:
+    """
+    One NDJSON record per image of a bulk batch. The batch is submitted to the
+    classifier together (one micro-batch) while segmentation runs as one
+    batched call; a failure only marks the records it affects.
+    """
+    records, images = [], []
+    for offset, (filename, data, error) in enumerate(batch):
+        record = {"index": first_index + offset, "filename": filename}
+        if error:
+            record["error"] = error
+        else:
+            images.append((record, DecodedImage(data)))
+        records.append(record)
+    if not images:
+        return records
+
+    stages = [asyncio.gather(*(classify_image(image) for _, image in images), return_exceptions=True)]
+    if with_segmentation:
+        stages.append(segment_images([image for _, image in images], mode))
+    outcomes = await asyncio.gather(*stages, return_exceptions=True)
+
+    predictions = outcomes[0]
+    for k, (record, image) in enumerate(images):
+        record["sha256"] = image.sha256
+        prediction = predictions[k]
+        if isinstance(prediction, BaseException):
+            record["error"] = str(prediction) or type(prediction).__name__
+        else:
+            record.update(prediction)
+        if with_segmentation:
+            segmentations = outcomes[1]
+            if isinstance(segmentations, BaseException):
+                record["segmentation_error"] = str(segmentations) or type(segmentations).__name__
+            else:
+                segmentation, seg_error = segmentations[k]
+                record["segmentation"] = segmentation
+                if seg_error:
+                    record["segmentation_error"] = seg_error
+    return records
+
+# Mongo writes from request handlers that may be lost (reviews, symptom
+# mirrors) are queued and flushed in batches off the request path; drained on shutdown
+# (WRITE_BEHIND_BATCH_SIZE / WRITE_BEHIND_FLUSH_MS / WRITE_BEHIND_MAX_RETRIES)
+writes = get_write_behind(db) if db is not None else None
+
+@app.on_event("startup")
+async def start_write_behind() -> None:
+    if writes is not None:
+        await writes.start()
+
+
+@app.on_event("shutdown")
+async def stop_write_behind() -> None:
+    if writes is not None:
+        await writes.stop()
+
+# Oncologist worklist: indexed by case_id, status and patient email; in MongoDB
+# (onco_cases, ids from an atomic counter) when configured, else in memory
+cases = get_case_store(db)
+
+@app.on_event("startup")
+async def setup_case_store() -> None:
+    try:
+        await cases.setup()
+    except Exception as e:
+        print(f"Case store setup error: {e}")
+
+# Indexes for every collection the app queries, declared in ml.db_indexes;
+# `python -m ml.db_indexes --explain` checks that the hot queries use them
+@app.on_event("startup")
+async def setup_indexes() -> None:
+    if db is None:
+        return
+    await ensure_all_indexes(db, [name for name in INDEXES if name != USERS_COLLECTION])
+    # The patient portal's users live in the database patient_app.auth resolves
+    await ensure_indexes(users_collection)
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -102,22 +306,85 @@ async def index(request: Request) -> HTMLResponse:
 async def model_validation(request: Request) -> HTMLResponse:
     return templates.TemplateResponse("model_validation.html", {"request": request})
 
+@app.get("/healthz")
+async def healthz() -> JSONResponse:
+    """Liveness: the process is up and the event loop is responsive."""
+    health = {"status": "ok", "uptime_seconds": round(time.time() - STARTED_AT, 1)}
+    if writes is not None:
+        # Queued Mongo writes that were given up on after their retries
+        health["write_behind"] = {**writes.stats, "pending": writes.pending, "recent_drops": list(writes.dropped)[-5:]}
+    return JSONResponse(health)
+
+
+@app.get("/readyz")
+async def readyz() -> JSONResponse:
+    """Readiness: 200 once model warm-up has finished, 503 (with progress) before that."""
+    report = model_warmup.report()
+    if model_warmup.ready:
+        return JSONResponse({"status": "ready", "warmup": report})
+    status = "not_ready" if model_warmup.finished else "warming_up"
+    return JSONResponse({"status": status, "warmup": report}, status_code=503)
+
+
 @app.get("/api/model-info")
 async def get_model_info():
-    """Return information about the currently loaded models."""
+    """Return version/checksum information about the models (does not trigger loading)."""
+    model = registry.peek("classifier")
+    segmentor = registry.peek("segmentation")
     return {
         "classification_model": {
-            "loaded": model is not None,
+            **registry.describe("classifier"),
+            "loaded": model is not None and model.model is not None,
             "type": "DenseNet121 (High Accuracy)" if model and getattr(model, "is_new_model", False) else "Legacy/Basic",
-            "path": str(model.model_path) if model else None
         },
         "segmentation_model": {
+            **registry.describe("segmentation"),
             "loaded": segmentor is not None and segmentor.model is not None,
-            "path": str(segmentor.model_path) if segmentor else None
-        }
+        },
+        "image_analysis_model": registry.describe("mobilenet"),
+        "prediction_cache": prediction_cache.stats()
     }
 
 
+def require_model_admin(request: Request) -> None:
+    """Admin bearer token (MODEL_ADMIN_TOKEN); without one configured, admin routes are off."""
+    if not MODEL_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Model administration is disabled (set MODEL_ADMIN_TOKEN)")
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), MODEL_ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Admin token required", headers={"WWW-Authenticate": "Bearer"})
+
+
+@app.post("/api/model-reload", dependencies=[Depends(require_model_admin)] + ML_ROUTE)
+async def api_model_reload(request: Request) -> JSONResponse:
+    """
+    Atomically hot-reload a model, e.g. {"model": "classifier", "path": "ml/new_model.h5"}.
+    In-flight requests finish on the old instance; new requests use the new one.
+    Needs ``Authorization: Bearer $MODEL_ADMIN_TOKEN``; ``path`` must be a
+    model file inside ml/.
+    """
+    try:
+        body = await request.json()
+    except Exception:
+        body = {}
+    name = body.get("model", "classifier")
+    if name not in registry.info():
+        return JSONResponse({"error": f"Unknown model '{name}'"}, status_code=400)
+    path = body.get("path")
+    if path is not None:
+        try:
+            path = resolve_model_path(path)
+        except (TypeError, ValueError) as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+    try:
+        info = await inference.run(registry.reload, name, path, timeout=0)
+        return JSONResponse({"status": "reloaded", "model": name, "info": info})
+    except FileNotFoundError as e:
+        return JSONResponse({"error": str(e)}, status_code=404)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
 # -------------------- PCP: AI-Assisted Triage (The "Scan") --------------------
 
 @app.get("/pcp", response_class=HTMLResponse)
@@ -125,15 +392,24 @@ async def pcp_dashboard(request: Request) -> HTMLResponse:
     return templates.TemplateResponse("pcp_dashboard.html", {"request": request})
 
 
-@app.post("/pcp/upload", response_class=HTMLResponse)
+@app.post("/pcp/upload", response_class=HTMLResponse, dependencies=ML_ROUTE)
 async def pcp_upload(
     request: Request,
     patient_name: str = Form(...),
     patient_email: str = Form(...),
     patient_phone: str = Form(...),
     file: UploadFile = File(...),
+    segmentation_mode: str = Form("standard"),
+    tta: bool = Form(False),
 ) -> HTMLResponse:
-    # Check if model is available
+    if segmentation_mode not in SEGMENTATION_MODES:
+        segmentation_mode = "standard"
+    # Check if model is available (loaded on first use)
+    try:
+        model = await load_model("classifier")
+    except Exception as e:
+        print(f"⚠️ Warning: Could not load breast cancer model: {e}")
+        model = None
     if model is None:
         return templates.TemplateResponse(
             "pcp_result.html",
@@ -148,30 +424,85 @@ async def pcp_upload(
             },
         )
     
-    data = await file.read()
-    label, score = model.predict_label(data)
-    # Get cancer stage based on the probability score
-    stage = model.predict_stage(score) if model else "Unknown"
+    try:
+        upload = await ingest_upload(file)
+    except UploadRejected as e:
+        return templates.TemplateResponse(
+            "pcp_result.html",
+            {
+                "request": request,
+                "patient_name": patient_name,
+                "risk_label": "UPLOAD_REJECTED",
+                "risk_score": 0.0,
+                "case_id": 0,
+                "image_url": None,
+                "error": e.detail,
+            },
+            status_code=e.status_code,
+        )
+    with upload:
+        return await pcp_analyze_upload(request, patient_name, patient_email, patient_phone, upload, segmentation_mode, tta)
+
+
+async def pcp_analyze_upload(
+    request: Request,
+    patient_name: str,
+    patient_email: str,
+    patient_phone: str,
+    upload,
+    segmentation_mode: str,
+    tta: bool,
+) -> HTMLResponse:
+    # Decode once; classifier and segmenter share the derived tensors
+    image = DecodedImage.from_upload(upload)
+    # Classification and segmentation are independent: run them concurrently so
+    # latency tracks the slower model rather than the sum of both
+    timings: Dict[str, float] = {}
+    try:
+        prediction, (segmentation, seg_error) = await timed(
+            "inference",
+            asyncio.gather(
+                timed("classify", classify_image(image, tta), timings),
+                timed("segment", segment_image(image, segmentation_mode), timings),
+            ),
+            timings,
+        )
+        label, score, stage = prediction["label"], prediction["score"], prediction["stage"]
+    except InferenceTimeoutError as e:
+        return templates.TemplateResponse(
+            "pcp_result.html",
+            {
+                "request": request,
+                "patient_name": patient_name,
+                "risk_label": "MODEL_UNAVAILABLE",
+                "risk_score": 0.0,
+                "case_id": 0,
+                "image_url": None,
+                "error": f"Image analysis timed out - please retry. ({e})"
+            },
+            status_code=504,
+        )
     
-    case_id = len(SCAN_CASES) + 1
+    # Unique across workers and never reused after a clear
+    case_id = await cases.next_id()
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-    # Run segmentation
-    segmentation_overlay, seg_error = segmentor.predict_mask(data)
-
-    # Persist uploaded image so it can be previewed in the UI
-    uploads_dir = UPLOADS_DIR
-    uploads_dir.mkdir(parents=True, exist_ok=True)
-    original_suffix = Path(file.filename or "").suffix.lower() or ".jpg"
-    filename = f"case_{case_id}{original_suffix}"
-    image_path = uploads_dir / filename
+    # Content-addressed: a re-uploaded image is stored once, and its thumbnail
+    # and overlay preview are rendered only the first time (from this decode)
+    derivatives = {"thumb": partial(render_thumbnail, image)}
+    if segmentation is not None:
+        segmentor = await load_model("segmentation")
+        overlay = f"overlay-{segmentation_mode}-{version_tag(segmentor.version)}"
+        derivatives[overlay] = partial(segmentor.render_overlay_jpeg, image, segmentation)
     try:
-        image_path.write_bytes(data)
-        image_url = f"/static/uploads/{filename}"
-    except Exception:
+        stored = await run_in_threadpool(image_store.put, upload, f"case_{case_id}", derivatives)
+        image_url, image_path = stored.url, stored.path
+        thumb_url = stored.derivatives.get("thumb")
+        overlay_url = stored.derivatives.get(overlay) if segmentation is not None else None
+    except Exception as e:
         # If saving fails, continue without a preview image
-        image_url = None
-        image_path = None
+        print(f"Could not store image for case {case_id}: {e}")
+        image_url = image_path = thumb_url = overlay_url = None
 
     case = ScanCase(
         case_id=case_id,
@@ -180,29 +511,22 @@ async def pcp_upload(
         risk_score=score,
         image_url=image_url,
         image_path=image_path,
+        patient_email=patient_email,
+        patient_phone=patient_phone,
+        timestamp=timestamp,
+        thumb_url=thumb_url,
+        overlay_url=overlay_url,
     )
-    SCAN_CASES.append(case)
-
-    # Mirror to MongoDB if configured (best-effort; failures do not break the app)
-    if db_cases is not None:
-        try:
-            doc = {
-                "case_id": case_id,
-                "patient_name": patient_name,
-                "patient_email": patient_email,
-                "patient_phone": patient_phone,
-                "risk_label": label,
-                "risk_score": float(score),
-                "status": case.status,
-                "timestamp": timestamp
-            }
-            if image_url:
-                doc["image_url"] = image_url
-            await db_cases.insert_one(doc)
-        except Exception:
-            # For this prototype we silently ignore DB errors and continue with in-memory storage
-            pass
+    try:
+        await cases.add(case)
+    except Exception as e:
+        # The patient still gets their result; the case is just missing from the worklist
+        print(f"ERROR: Could not store case {case_id}: {e}")
+        if image_path is not None and image_store.owns(image_path):
+            await run_in_threadpool(image_store.release, image_path, f"case_{case_id}")
 
+    # Per-stage timings: inference ~= max(classify, segment) when the stages overlap
+    print(f"pcp_upload case {case_id} timings (ms): " + ", ".join(f"{k}={v:.1f}" for k, v in timings.items()))
     return templates.TemplateResponse(
         "pcp_result.html",
         {
@@ -214,57 +538,108 @@ async def pcp_upload(
             "timestamp": timestamp,
             "image_url": image_url,
             "cancer_stage": stage,
-            "segmentation_overlay": segmentation_overlay, # Pass to template
+            "segmentation": segmentation, # Mask is composited over image_url in the template
+            "score_std": prediction["score_variance"] ** 0.5 if tta else None,
+            "tta_views": TTA_VIEW_COUNT,
         },
+        headers={"Server-Timing": server_timing_header(timings)},
     )
 
 
 # -------------------- Oncologist: Tele-Oncology Navigation (The "Help") ------
 
 @app.get("/oncologist", response_class=HTMLResponse)
-async def oncologist_dashboard(request: Request) -> HTMLResponse:
+async def oncologist_dashboard(
+    request: Request,
+    status: Optional[str] = None,
+    risk_label: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    sort: str = "timestamp",
+    order: str = "desc",
+    cursor: Optional[str] = None,
+    limit: int = WORKLIST_PAGE_SIZE,
+) -> HTMLResponse:
+    """One page of the worklist; filtering, sorting and paging happen in the case store."""
+    filters = {
+        "status": status or "",
+        "risk_label": risk_label or "",
+        "date_from": date_from or "",
+        "date_to": date_to or "",
+        "sort": sort,
+        "order": order,
+        "limit": limit,
+    }
+    try:
+        query = WorklistQuery(
+            status=status,
+            risk_label=risk_label,
+            date_from=date_from,
+            date_to=date_to,
+            sort=sort,
+            descending=order != "asc",
+            cursor=cursor,
+            limit=limit,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    page = await cases.worklist(query)
+
+    # Page links keep the filters; only the cursor changes
+    base = {key: value for key, value in filters.items() if value != ""}
+    next_url = f"/oncologist?{urlencode(dict(base, cursor=page.next_cursor))}" if page.next_cursor else None
     return templates.TemplateResponse(
         "oncologist_dashboard.html",
-        {"request": request, "cases": SCAN_CASES},
+        {
+            "request": request,
+            "cases": page.cases,
+            "total": page.total,
+            "filters": filters,
+            "filtered": any(filters[key] for key in ("status", "risk_label", "date_from", "date_to")),
+            "statuses": (PENDING_REVIEW, REVIEWED),
+            "first_url": f"/oncologist?{urlencode(base)}" if cursor else None,
+            "next_url": next_url,
+        },
     )
 
 
 @app.post("/oncologist/case/{case_id}/review")
-async def oncologist_review(case_id: int) -> RedirectResponse:
-    for c in SCAN_CASES:
-        if c.case_id == case_id:
-            c.status = "REVIEWED"
-            if db_cases is not None:
-                try:
-                    # mirror status update to Mongo
-                    await db_cases.update_one({"case_id": case_id}, {"$set": {"status": "REVIEWED"}})
-                except Exception:
-                    pass
-            break
-    return RedirectResponse(url="/oncologist", status_code=303)
+async def oncologist_review(case_id: int, return_to: str = Form("/oncologist")) -> RedirectResponse:
+    try:
+        await cases.set_status(case_id, REVIEWED)
+    except Exception as e:
+        print(f"Could not mark case {case_id} reviewed: {e}")
+    # Back to the same worklist page and filters (local worklist URLs only)
+    if not return_to.startswith("/oncologist"):
+        return_to = "/oncologist"
+    return RedirectResponse(url=return_to, status_code=303)
 
 
 @app.post("/oncologist/clear")
 async def oncologist_clear() -> RedirectResponse:
     """Clear all oncologist worklist cases and associated images.
 
-    This resets the in-memory worklist, removes any persisted cases in MongoDB,
-    and deletes uploaded image files for the current session.
+    This empties the case store (in memory or MongoDB) and releases the
+    removed cases' images; an image (and its derivatives) is deleted once no
+    case refers to it. Case ids are not reused.
     """
-    # Delete associated image files from disk (best-effort)
-    for c in SCAN_CASES:
-        if getattr(c, "image_path", None):
+    try:
+        removed = await cases.clear()
+    except Exception as e:
+        print(f"Could not clear cases: {e}")
+        removed = []
+
+    # Release associated image files (best-effort)
+    for c in removed:
+        if c.image_path:
             try:
-                Path(c.image_path).unlink(missing_ok=True)
+                if image_store.owns(c.image_path):
+                    await run_in_threadpool(image_store.release, c.image_path, f"case_{c.case_id}")
+                else:
+                    # Uploads from before the image store
+                    Path(c.image_path).unlink(missing_ok=True)
             except Exception:
                 pass
-
-    SCAN_CASES.clear()
-    if db_cases is not None:
-        try:
-            await db_cases.delete_many({})
-        except Exception:
-            pass
     return RedirectResponse(url="/oncologist", status_code=303)
 
 
@@ -292,11 +667,8 @@ async def view_patient_symptoms(request: Request) -> HTMLResponse:
 @app.post("/oncologist/patient-symptoms/clear", response_class=HTMLResponse)
 async def clear_patient_symptoms() -> RedirectResponse:
     PATIENT_SYMPTOMS.clear()
-    if db_symptoms is not None:
-        try:
-            await db_symptoms.delete_many({})
-        except Exception:
-            pass
+    if writes is not None:
+        await writes.delete_many("onco_patient_symptoms", {})
     return RedirectResponse(url="/oncologist/patient-symptoms", status_code=303)
 
 
@@ -317,12 +689,9 @@ async def submit_symptoms(
     }
     PATIENT_SYMPTOMS.append(record)
 
-    # Mirror to MongoDB if configured (best-effort)
-    if db_symptoms is not None:
-        try:
-            await db_symptoms.insert_one(record)
-        except Exception:
-            pass
+    # Mirror to MongoDB if configured (queued; retried if Mongo is unavailable)
+    if writes is not None:
+        await writes.insert("onco_patient_symptoms", record)
 
     alert = None
     if max(nausea, fatigue, pain) >= 4:
@@ -542,64 +911,332 @@ def get_mock_hospitals_near_location(user_lat, user_lon):
 
 # AI Diagnostics API Endpoints
 from ml.image_analysis import analyze_image, analyze_breast_image
-from ml.nlp_utils import analyze_report
-from ml.predictive_models import predict_survival, predict_side_effects
+from ml.image_analysis import MODEL_VERSION as image_analysis_version
+
+
+# Report NLP (spaCy, pypdf, Gemini) and the outcome models (scikit-learn,
+# pandas) are imported on first call, in the worker thread that runs it
+def analyze_report(pdf_bytes: bytes) -> dict:
+    from ml.nlp_utils import analyze_report as analyze
+    return analyze(pdf_bytes)
+
+
+def predict_survival(age: int, stage: int, comorbidities: int) -> dict:
+    from ml.predictive_models import predict_survival as predict
+    return predict(age, stage, comorbidities)
+
+
+def predict_side_effects(age: int, chemo_type: int, dosage: float) -> dict:
+    from ml.predictive_models import predict_side_effects as predict
+    return predict(age, chemo_type, dosage)
+
 import json
 
-@app.post("/api/segment-image")
-async def api_segment_image(file: UploadFile = File(...)):
+@app.post("/api/segment-image", dependencies=ML_ROUTE)
+async def api_segment_image(file: UploadFile = File(...), mode: str = "standard", overlay: bool = False):
+    # mode=tiled segments full-resolution studies in overlapping windows;
+    # overlay=true also returns a server-rendered overlay at preview size
+    if mode not in SEGMENTATION_MODES:
+        return JSONResponse({"error": f"mode must be one of {', '.join(SEGMENTATION_MODES)}"}, status_code=400)
+    try:
+        upload = await ingest_upload(file)
+    except UploadRejected as e:
+        return JSONResponse({"error": e.detail}, status_code=e.status_code)
     try:
-        contents = await file.read()
-        overlay_url, error = segmentor.predict_mask(contents)
+        image = DecodedImage.from_upload(upload)
+        segmentation, error = await segment_image(image, mode)
         
         if error:
              return JSONResponse({"error": error}, status_code=500)
              
-        return JSONResponse({
-            "segmentation_overlay": overlay_url,
+        response = {
+            "segmentation": segmentation,
             "status": "success"
-        })
+        }
+        if overlay:
+            segmentor = await load_model("segmentation")
+            response["segmentation_overlay"] = await inference.run(segmentor.render_overlay_preview, image, segmentation)
+        return JSONResponse(response)
+    except InferenceTimeoutError as e:
+        return JSONResponse({"error": str(e)}, status_code=504)
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
+    finally:
+        upload.close()
 
-@app.post("/api/analyze-image")
+@app.post("/api/analyze-image", dependencies=ML_ROUTE)
 async def api_analyze_image(file: UploadFile = File(...)) -> JSONResponse:
     try:
-        data = await file.read()
-        result = analyze_image(data)
+        upload = await ingest_upload(file)
+    except UploadRejected as e:
+        return JSONResponse({"error": e.detail}, status_code=e.status_code)
+    try:
+        result = await inference.run(analyze_image, DecodedImage.from_upload(upload))
         return JSONResponse(result)
+    except InferenceTimeoutError as e:
+        return JSONResponse({"error": str(e)}, status_code=504)
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
+    finally:
+        upload.close()
 
-@app.post("/api/analyze-breast-image")
+@app.post("/api/analyze-breast-image", dependencies=ML_ROUTE)
 async def api_analyze_breast_image(file: UploadFile = File(...)) -> JSONResponse:
     try:
-        data = await file.read()
-        result = analyze_breast_image(data)
+        upload = await ingest_upload(file)
+    except UploadRejected as e:
+        return JSONResponse({"error": e.detail}, status_code=e.status_code)
+    try:
+        image = DecodedImage.from_upload(upload)
+        cached = prediction_cache.get(image.sha256, "breast_analysis", image_analysis_version)
+        if cached is not None:
+            result = dict(cached)
+        else:
+            result = await inference.run(analyze_breast_image, image)
+            if "error" not in result:
+                prediction_cache.set(image.sha256, "breast_analysis", image_analysis_version, dict(result))
         
         # Add segmentation
-        segmentation_overlay, seg_error = segmentor.predict_mask(data)
-        if segmentation_overlay:
-            result["segmentation_overlay"] = segmentation_overlay
+        segmentation, seg_error = await segment_image(image)
+        if segmentation:
+            result["segmentation"] = segmentation
             
         return JSONResponse(result)
+    except InferenceTimeoutError as e:
+        return JSONResponse({"error": str(e)}, status_code=504)
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
+    finally:
+        upload.close()
+
+@app.post("/api/bulk-analyze", dependencies=ML_ROUTE)
+async def api_bulk_analyze(
+    files: List[UploadFile] = File(...),
+    mode: str = "standard",
+    segmentation: bool = True,
+) -> Response:
+    """
+    Screening-camp intake: many images, as separate files and/or zip archives.
+    Streams NDJSON, one line per image as soon as its batch is analysed
+    (BULK_BATCH_SIZE images per batch), followed by a summary line.
+    Only the current batch is held in memory.
+    """
+    if mode not in SEGMENTATION_MODES:
+        return JSONResponse({"error": f"mode must be one of {', '.join(SEGMENTATION_MODES)}"}, status_code=400)
+    # Same per-file size and type checks as single uploads; the spools outlive
+    # the request's own upload files, which are closed once this handler returns
+    try:
+        uploads = await ingest_uploads(files, **BULK_LIMITS)
+    except UploadRejected as e:
+        return JSONResponse({"error": e.detail}, status_code=e.status_code)
+    sources = [(upload.filename, upload.file) for upload in uploads]
+
+    async def results():
+        items = iter_bulk_images(sources)
+        total = failed = 0
+        try:
+            while True:
+                batch = await run_in_threadpool(next_batch, items)
+                if not batch:
+                    break
+                for record in await analyze_bulk_batch(batch, total, mode, segmentation):
+                    failed += "error" in record
+                    yield json.dumps(record) + "\n"
+                total += len(batch)
+            yield json.dumps({"done": True, "images": total, "errors": failed}) + "\n"
+        finally:
+            for upload in uploads:
+                upload.close()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
 
 @app.post("/api/analyze-report")
 async def api_analyze_report(file: UploadFile = File(...)) -> JSONResponse:
     try:
-        data = await file.read()
-        result = analyze_report(data)
+        upload = await ingest_upload(file, allowed=REPORT_TYPES)
+    except UploadRejected as e:
+        return JSONResponse({"error": e.detail}, status_code=e.status_code)
+    try:
+        # The PDF parser and Gemini both need real bytes; reports are capped at UPLOAD_MAX_MB
+        result = await inference.run(analyze_report, bytes(upload.data))
         return JSONResponse(result)
+    except InferenceTimeoutError as e:
+        return JSONResponse({"error": str(e)}, status_code=504)
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
+    finally:
+        upload.close()
+
+# -------------------- Background analysis jobs --------------------
+
+@jobs.handler("report")
+async def run_report_job(job: dict, progress) -> dict:
+    # Inputs passed the upload size limit when the job was submitted
+    data = jobs.input_path(job, job["payload"]["inputs"][0]).read_bytes()
+    await progress(0.1, "Extracting report text")
+    # The job has its own time limit (JOB_TIMEOUT_SECONDS)
+    return await inference.run(analyze_report, data, timeout=0)
+
+
+@jobs.handler("segmentation")
+async def run_segmentation_job(job: dict, progress) -> dict:
+    mode = job["payload"].get("mode", "standard")
+    image = DecodedImage(jobs.input_path(job, job["payload"]["inputs"][0]).read_bytes())
+    await progress(0.1, f"Segmenting ({mode})")
+    segmentation, error = await segment_image(image, mode, timeout=0)
+    if error:
+        raise RuntimeError(error)
+    return {"segmentation": segmentation}
+
+
+@jobs.handler("bulk")
+async def run_bulk_job(job: dict, progress) -> dict:
+    payload = job["payload"]
+    sources = [(entry["filename"], open(jobs.input_path(job, entry), "rb")) for entry in payload["inputs"]]
+    try:
+        expected = max(1, await run_in_threadpool(count_bulk_images, sources))
+        items = iter_bulk_images(sources)
+        analysed = failed = 0
+        while True:
+            batch = await run_in_threadpool(next_batch, items)
+            if not batch:
+                break
+            records = await analyze_bulk_batch(batch, analysed, payload.get("mode", "standard"), payload.get("segmentation", True))
+            # Per-image records (masks included) are stored apart: the job document only gets the counts
+            await jobs.save_items(job["id"], analysed, records)
+            failed += sum("error" in record for record in records)
+            analysed += len(records)
+            await progress(analysed / expected, f"{analysed} of {expected} images analysed")
+    finally:
+        for _, f in sources:
+            f.close()
+    return {"images": analysed, "errors": failed}
+
+
+def job_links(job_id: str) -> dict:
+    return {
+        "status_url": f"/api/jobs/{job_id}",
+        "result_url": f"/api/jobs/{job_id}/result",
+        "events_url": f"/api/jobs/{job_id}/events",
+    }
+
+
+@app.post("/api/jobs/{kind}")
+async def api_submit_job(
+    kind: str,
+    files: List[UploadFile] = File(...),
+    mode: str = "standard",
+    segmentation: bool = True,
+) -> JSONResponse:
+    """
+    Queue a report, segmentation or bulk analysis and return at once (202).
+    Poll the status/result URLs or follow the SSE stream for progress.
+    """
+    if kind not in jobs.handlers:
+        return JSONResponse({"error": f"kind must be one of {', '.join(jobs.handlers)}"}, status_code=404)
+    if kind != "report":
+        require_ml()
+    if mode not in SEGMENTATION_MODES:
+        return JSONResponse({"error": f"mode must be one of {', '.join(SEGMENTATION_MODES)}"}, status_code=400)
+    if kind != "bulk" and len(files) != 1:
+        return JSONResponse({"error": f"{kind} jobs take exactly one file"}, status_code=400)
+
+    limits = {"report": {"allowed": REPORT_TYPES}, "bulk": BULK_LIMITS}.get(kind, {"allowed": IMAGE_TYPES})
+    try:
+        uploads = await ingest_uploads(files, **limits)
+    except UploadRejected as e:
+        return JSONResponse({"error": e.detail}, status_code=e.status_code)
+
+    job_id = jobs.new_job_id()
+    try:
+        inputs = await run_in_threadpool(jobs.save_inputs, job_id, [(u.filename, u.file) for u in uploads])
+        await jobs.submit(kind, {"inputs": inputs, "mode": mode, "segmentation": segmentation}, job_id)
+    except Exception as e:
+        return JSONResponse({"error": f"Could not queue job: {e}"}, status_code=500)
+    finally:
+        for upload in uploads:
+            upload.close()
+    return JSONResponse({"job_id": job_id, "status": "queued", **job_links(job_id)}, status_code=202)
+
+
+@app.get("/api/jobs/{job_id}")
+async def api_job_status(job_id: str) -> JSONResponse:
+    job = await jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    return JSONResponse({**jobs.describe(job), **job_links(job_id)})
+
+
+@app.get("/api/jobs/{job_id}/result")
+async def api_job_result(job_id: str) -> JSONResponse:
+    job = await jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    if job["status"] == "failed":
+        return JSONResponse(jobs.describe(job), status_code=500)
+    if job["status"] != "succeeded":
+        # Not finished yet: same body as the status endpoint
+        return JSONResponse({**jobs.describe(job), **job_links(job_id)}, status_code=202)
+    if job["kind"] == "bulk":
+        return JSONResponse({**job["result"], "items_url": f"/api/jobs/{job_id}/items"})
+    return JSONResponse(job["result"])
+
+
+@app.get("/api/jobs/{job_id}/items")
+async def api_job_items(job_id: str) -> StreamingResponse:
+    """Per-image records of a bulk job as NDJSON, in upload order (those analysed so far while it runs)."""
+    if await jobs.get(job_id) is None:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+
+    async def records():
+        offset = 0
+        while True:
+            page = await jobs.items(job_id, offset, JOB_ITEMS_PAGE_SIZE)
+            for record in page:
+                yield json.dumps(record) + "\n"
+            if len(page) < JOB_ITEMS_PAGE_SIZE:
+                return
+            offset += len(page)
+
+    return StreamingResponse(records(), media_type="application/x-ndjson")
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def api_job_events(job_id: str) -> StreamingResponse:
+    """Server-sent events: a "progress" event per state change, then one "done" event."""
+    async def events():
+        last_state = None
+        last_sent = time.monotonic()
+        while True:
+            job = await jobs.get(job_id)
+            if job is None:
+                yield f"event: error\ndata: {json.dumps({'error': 'Job not found'})}\n\n"
+                return
+            state = jobs.describe(job)
+            finished = job["status"] in TERMINAL_STATUSES
+            if state != last_state:
+                yield f"event: {'done' if finished else 'progress'}\ndata: {json.dumps(state)}\n\n"
+                last_state, last_sent = state, time.monotonic()
+            elif time.monotonic() - last_sent > 15:
+                # Comment line keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            if finished:
+                return
+            # Woken early by updates from this process; polls for other workers
+            await jobs.wait_for_change(job_id, JOB_POLL_SECONDS)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.post("/api/predict-outcome")
 async def api_predict_outcome(request: Request) -> JSONResponse:
     try:
         body = await request.json()
-        result = predict_survival(int(body.get("age", 50)), int(body.get("stage", 1)), int(body.get("comorbidities", 0)))
+        result = await run_in_threadpool(predict_survival, int(body.get("age", 50)), int(body.get("stage", 1)), int(body.get("comorbidities", 0)))
         return JSONResponse(result)
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
@@ -608,7 +1245,7 @@ async def api_predict_outcome(request: Request) -> JSONResponse:
 async def api_predict_side_effects(request: Request) -> JSONResponse:
     try:
         body = await request.json()
-        result = predict_side_effects(int(body.get("age", 50)), int(body.get("chemo_type", 0)), float(body.get("dosage", 0.5)))
+        result = await run_in_threadpool(predict_side_effects, int(body.get("age", 50)), int(body.get("chemo_type", 0)), float(body.get("dosage", 0.5)))
         return JSONResponse(result)
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
@@ -741,9 +1378,18 @@ async def dataset_info(request: Request) -> HTMLResponse:
 
 
 # To run: uvicorn app_main:app --reload
+# Production with several workers: APP_WORKERS=4 python app_main.py (see gunicorn.conf.py)
 if __name__ == "__main__":
+    import sys
     import uvicorn
+    from ml.serving import APP_WORKERS, configure_worker_threads
+
+    if APP_WORKERS > 1:
+        # Pre-forking master: models are preloaded once and workers share them
+        os.chdir(ROOT)
+        os.execvp(sys.executable, [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app_main:app"])
 
+    configure_worker_threads(1)
     host = os.getenv("APP_HOST", "0.0.0.0")
     port = int(os.getenv("APP_PORT", "8000"))
     uvicorn.run("app_main:app", host=host, port=port, reload=False)
@@ -0,0 +1,33 @@
+"""
+Production serving: one master process that preloads the app (and the
+fork-safe models), forking APP_WORKERS uvicorn workers.
+
+    APP_WORKERS=4 python app_main.py
+    # or directly
+    APP_WORKERS=4 gunicorn -c gunicorn.conf.py app_main:app
+
+Per-worker thread pools: TF_INTRA_OP_THREADS / TF_INTER_OP_THREADS (default:
+the CPU cores split evenly between workers).
+"""
+import os
+
+from ml.serving import APP_WORKERS, configure_worker_threads, preload_models
+
+bind = f"{os.getenv('APP_HOST', '0.0.0.0')}:{os.getenv('APP_PORT', '8000')}"
+workers = APP_WORKERS
+worker_class = "uvicorn.workers.UvicornWorker"
+# Import app_main once in the master; workers inherit it (and the preloaded models) via fork
+preload_app = True
+# Model loading and warm-up run in each worker at startup
+timeout = int(os.getenv("APP_WORKER_TIMEOUT", "300"))
+graceful_timeout = 30
+
+
+def when_ready(server):
+    # Runs in the master after the app is imported, before any worker is forked
+    from ml.model_registry import get_model_registry
+    preload_models(get_model_registry())
+
+
+def post_fork(server, worker):
+    configure_worker_threads(workers)
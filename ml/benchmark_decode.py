@@ -0,0 +1,173 @@
+"""
+Benchmark: full-resolution vs reduced-scale JPEG decoding in the shared
+preprocessing layer (ml.image_pipeline.DecodedImage).
+
+For every sample it times building the classifier (224x224 RGB/grayscale,
+also MobileNet's input) and U-Net (256x256 BGR) inputs both ways, reports the
+largest decoded frame (which dominates peak memory per upload) and checks the
+inputs, and the model outputs when the models are available, against
+tolerances.
+
+The classifier views are antialiased (PIL resize), so reduced and full decodes
+must agree directly. The U-Net view uses cv2's bilinear resize, which aliases
+when shrinking a full-resolution frame 10x or more; both paths are therefore
+scored against an area-averaged reference, and the reduced decode must be at
+least as close to it as the full decode.
+
+Usage (from repo root):
+    python -m ml.benchmark_decode                       # JPEGs in the image store or static/uploads, else a synthetic 12 MP scan
+    python -m ml.benchmark_decode --images /data/mammograms --limit 50 --models
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List
+
+import cv2
+import numpy as np
+from PIL import Image
+
+import ml.image_pipeline as pipeline
+from ml.image_pipeline import DecodedImage
+from ml.image_store import SAMPLE_IMAGE_DIRS, is_derivative
+
+CLASSIFIER_SIZE = (224, 224)
+UNET_SIZE = (256, 256)
+
+# Mean absolute difference of the [0, 1]-scaled model inputs, and model output tolerances
+INPUT_TOLERANCE = 0.02
+PROBABILITY_TOLERANCE = 0.02
+MIN_MASK_IOU = 0.95
+
+
+def load_samples(directories: List[Path], limit: int) -> List[bytes]:
+    """JPEGs from the first of ``directories`` that has any."""
+    samples = []
+    for directory in directories:
+        if samples or not directory.exists():
+            continue
+        for path in sorted(directory.rglob("*")):
+            if path.suffix.lower() in (".jpg", ".jpeg") and not is_derivative(path):
+                try:
+                    Image.open(path).verify()
+                except Exception as e:
+                    print(f"Skipping {path}: {e}")
+                    continue
+                samples.append(path.read_bytes())
+            if len(samples) >= limit:
+                break
+    if not samples:
+        print(f"No JPEGs in {', '.join(map(str, directories))}; using a synthetic 4000x3000 scan.")
+        rng = np.random.default_rng(0)
+        y, x = np.mgrid[0:3000, 0:4000]
+        base = (128 + 100 * np.sin(x / 150.0) * np.cos(y / 200.0)).astype(np.float32)
+        gray = np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype(np.uint8)
+        buffer = BytesIO()
+        Image.fromarray(gray).convert("RGB").save(buffer, format="JPEG", quality=92)
+        samples.append(buffer.getvalue())
+    return samples
+
+
+def build_inputs(data: bytes, reduced: bool) -> Dict[str, np.ndarray]:
+    pipeline.REDUCED_DECODE_ENABLED = reduced
+    image = DecodedImage(data)
+    return {
+        "classifier": np.asarray(image.resized_rgb(CLASSIFIER_SIZE), dtype=np.float32) / 255.0,
+        "classifier_gray": np.asarray(image.resized_gray(CLASSIFIER_SIZE), dtype=np.float32) / 255.0,
+        "unet": image.resized_bgr(UNET_SIZE).astype(np.float32) / 255.0,
+        "_image": image,
+    }
+
+
+def largest_frame_mb(image: DecodedImage) -> float:
+    """Size of the biggest decoded frame memoized on the image."""
+    largest = 0
+    for value in image._derived.values():
+        if isinstance(value, Image.Image):
+            largest = max(largest, value.width * value.height * len(value.getbands()))
+        elif isinstance(value, np.ndarray) and value.ndim >= 2:
+            largest = max(largest, value.nbytes)
+    return largest / 1e6
+
+
+def time_inputs(data: bytes, reduced: bool, repeats: int) -> float:
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        build_inputs(data, reduced)
+        samples.append(time.perf_counter() - start)
+    return float(np.median(samples)) * 1000.0
+
+
+def compare_models(samples: List[bytes]) -> bool:
+    from ml.model_utils import BreastCancerModel
+    from ml.segmentation_utils import SegmentationModel
+
+    ok = True
+    classifier = BreastCancerModel()
+    if classifier.model is not None:
+        diffs = []
+        for data in samples:
+            pipeline.REDUCED_DECODE_ENABLED = False
+            full = classifier.predict_proba(DecodedImage(data))
+            pipeline.REDUCED_DECODE_ENABLED = True
+            diffs.append(abs(full - classifier.predict_proba(DecodedImage(data))))
+        passed = max(diffs) <= PROBABILITY_TOLERANCE
+        ok &= passed
+        print(f"classifier: max |dp| {max(diffs):.4f} (tolerance {PROBABILITY_TOLERANCE}) -> {'PASS' if passed else 'FAIL'}")
+
+    segmentor = SegmentationModel()
+    if segmentor.model is not None:
+        ious = []
+        for data in samples:
+            pipeline.REDUCED_DECODE_ENABLED = False
+            full = segmentor.predict_binary_mask(DecodedImage(data)) > 0
+            pipeline.REDUCED_DECODE_ENABLED = True
+            reduced = segmentor.predict_binary_mask(DecodedImage(data)) > 0
+            union = np.logical_or(full, reduced).sum()
+            ious.append(1.0 if union == 0 else np.logical_and(full, reduced).sum() / union)
+        passed = min(ious) >= MIN_MASK_IOU
+        ok &= passed
+        print(f"segmentation: min mask IoU {min(ious):.4f} (required {MIN_MASK_IOU}) -> {'PASS' if passed else 'FAIL'}")
+    return ok
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=Path, help="directory of JPEG samples (default: the image store, else static/uploads)")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=5, help="timed runs per sample and mode")
+    parser.add_argument("--models", action="store_true", help="also compare classifier and U-Net outputs")
+    args = parser.parse_args()
+
+    samples = load_samples([args.images] if args.images else list(SAMPLE_IMAGE_DIRS), args.limit)
+    ok = True
+    print(f"{'sample':>6} {'size':>11} {'scale':>5} {'full ms':>8} {'reduced ms':>10} {'full MB':>8} "
+          f"{'reduced MB':>10} {'cls diff':>8} {'unet err full/reduced':>21}")
+    for i, data in enumerate(samples):
+        full = build_inputs(data, reduced=False)
+        reduced = build_inputs(data, reduced=True)
+        cls_diff = max(float(np.mean(np.abs(full[key] - reduced[key]))) for key in ("classifier", "classifier_gray"))
+        reference = cv2.resize(full["_image"].bgr, UNET_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32) / 255.0
+        unet_full = float(np.mean(np.abs(full["unet"] - reference)))
+        unet_reduced = float(np.mean(np.abs(reduced["unet"] - reference)))
+        ok &= cls_diff <= INPUT_TOLERANCE and unet_reduced <= max(unet_full, INPUT_TOLERANCE)
+        height, width = full["_image"].shape
+        scale = reduced["_image"].reduction_for(CLASSIFIER_SIZE)
+        print(f"{i:>6} {width:>5}x{height:<5} {'1/' + str(scale):>5} "
+              f"{time_inputs(data, False, args.repeats):>8.1f} {time_inputs(data, True, args.repeats):>10.1f} "
+              f"{largest_frame_mb(full['_image']):>8.1f} {largest_frame_mb(reduced['_image']):>10.1f} "
+              f"{cls_diff:>8.4f} {unet_full:>10.4f}/{unet_reduced:<10.4f}")
+    print(f"model inputs within tolerance ({INPUT_TOLERANCE}) -> {'PASS' if ok else 'FAIL'}")
+
+    if args.models:
+        ok &= compare_models(samples)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""
+Latency benchmark: Keras ``model.predict`` vs the compiled tf.function path.
+
+Runs single-sample inference through both paths for the classifier, the
+segmentation U-Net and MobileNetV2, and prints p50/p99 latency per model.
+
+Usage (from repo root):
+    python -m ml.benchmark_inference --runs 200
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    arr = np.asarray(samples) * 1000.0
+    return {"p50": float(np.percentile(arr, 50)), "p99": float(np.percentile(arr, 99))}
+
+
+def _time_calls(fn: Callable[[], object], runs: int) -> List[float]:
+    fn()  # first call is excluded (tracing / allocation)
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def benchmark_model(name: str, keras_model, input_shape, runs: int) -> None:
+    from ml.compiled_inference import CompiledPredictor
+
+    x = np.random.rand(1, *input_shape).astype(np.float32)
+    predictor = CompiledPredictor(keras_model, name, input_shape)
+
+    keras_stats = _percentiles(_time_calls(lambda: keras_model.predict(x, verbose=0), runs))
+    compiled_stats = _percentiles(_time_calls(lambda: predictor(x), runs))
+
+    print(f"\n{name} (batch=1, {runs} runs)")
+    print(f"  model.predict : p50 {keras_stats['p50']:8.2f} ms   p99 {keras_stats['p99']:8.2f} ms")
+    print(f"  tf.function   : p50 {compiled_stats['p50']:8.2f} ms   p99 {compiled_stats['p99']:8.2f} ms")
+    print(f"  speed-up      : p50 x{keras_stats['p50'] / compiled_stats['p50']:.2f}   "
+          f"p99 x{keras_stats['p99'] / compiled_stats['p99']:.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=100, help="timed calls per model and path")
+    args = parser.parse_args()
+
+    from ml.model_utils import BreastCancerModel
+    from ml.segmentation_utils import SegmentationModel
+    from ml import image_analysis
+
+    classifier = BreastCancerModel()
+    if classifier.model is not None:
+        benchmark_model("classifier", classifier.model, classifier.model.input_shape[1:], args.runs)
+
+    segmentor = SegmentationModel()
+    if segmentor.model is not None:
+        benchmark_model("segmentation", segmentor.model, (segmentor.img_size, segmentor.img_size, 3), args.runs)
+
+    analyzer = image_analysis.MobileNetAnalyzer()
+    if analyzer.model is not None:
+        benchmark_model("MobileNetV2", analyzer.model, (224, 224, 3), args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Throughput benchmark for the pre-forking server: starts the app with 1, 2, 4...
+workers, fires concurrent uploads at one endpoint and reports requests/s,
+p50/p99 latency and scaling relative to a single worker.
+
+The prediction cache is disabled for the server under test so every request
+runs the models.
+
+Usage (from repo root, Linux):
+    python -m ml.benchmark_serving --image static/images/ab/cd/<sha256>.jpg --workers 1 2 4
+    python -m ml.benchmark_serving --image scan.png --endpoint /api/segment-image --requests 400
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import requests
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def wait_until_ready(base_url: str, workers: int, timeout: float) -> None:
+    """Poll /readyz until enough consecutive successes that every worker has likely warmed up."""
+    deadline = time.monotonic() + timeout
+    streak = 0
+    while time.monotonic() < deadline:
+        try:
+            ok = requests.get(f"{base_url}/readyz", timeout=5).status_code == 200
+        except requests.RequestException:
+            ok = False
+        streak = streak + 1 if ok else 0
+        if streak >= 4 * workers:
+            return
+        time.sleep(0.25 if ok else 1.0)
+    raise TimeoutError(f"server not ready after {timeout:.0f}s")
+
+
+def start_server(workers: int, port: int, threads: int) -> subprocess.Popen:
+    env = dict(os.environ, APP_WORKERS=str(workers), APP_PORT=str(port), APP_HOST="127.0.0.1",
+               PREDICTION_CACHE_SIZE="0", PREDICTION_CACHE_DIR="")
+    if threads:
+        env["TF_INTRA_OP_THREADS"] = str(threads)
+    # Same server for every count (workers=1 included) so only the process count varies
+    cmd = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app_main:app"]
+    return subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def stop_server(proc: subprocess.Popen) -> None:
+    proc.send_signal(signal.SIGTERM)
+    try:
+        proc.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def run_load(url: str, field: str, image: bytes, filename: str, total: int, concurrency: int) -> Dict[str, float]:
+    def one(_: int) -> float:
+        start = time.perf_counter()
+        resp = requests.post(url, files={field: (filename, image)}, timeout=300)
+        resp.raise_for_status()
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(concurrency)))  # not timed: connection setup, per-worker first calls
+        start = time.perf_counter()
+        latencies: List[float] = list(pool.map(one, range(total)))
+        elapsed = time.perf_counter() - start
+    ms = np.asarray(latencies) * 1000.0
+    return {"rps": total / elapsed, "p50": float(np.percentile(ms, 50)), "p99": float(np.percentile(ms, 99))}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image", type=Path, required=True, help="image uploaded on every request")
+    parser.add_argument("--endpoint", default="/api/bulk-analyze?segmentation=false",
+                        help="upload endpoint to load (default: classification only)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=200, help="timed requests per worker count")
+    parser.add_argument("--concurrency", type=int, default=0, help="parallel clients (default: 4 per worker)")
+    parser.add_argument("--threads", type=int, default=0, help="TF intra-op threads per worker (default: cores / workers)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--startup-timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    image = args.image.read_bytes()
+    url = f"http://127.0.0.1:{args.port}{args.endpoint}"
+    # The bulk endpoint takes "files"; the single-image ones take "file"
+    field = "files" if "bulk-analyze" in args.endpoint else "file"
+    results = []
+    for workers in args.workers:
+        proc = start_server(workers, args.port, args.threads)
+        try:
+            wait_until_ready(f"http://127.0.0.1:{args.port}", workers, args.startup_timeout)
+            concurrency = args.concurrency or 4 * workers
+            stats = run_load(url, field, image, args.image.name, args.requests, concurrency)
+        finally:
+            stop_server(proc)
+        results.append((workers, concurrency, stats))
+        print(f"{workers} worker(s): {stats['rps']:7.2f} req/s   p50 {stats['p50']:8.1f} ms   p99 {stats['p99']:8.1f} ms")
+
+    base = results[0][2]["rps"] / results[0][0]
+    print(f"\n{'workers':>7} {'clients':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'speed-up':>8} {'efficiency':>10}")
+    for workers, concurrency, stats in results:
+        speedup = stats["rps"] / results[0][2]["rps"]
+        print(f"{workers:>7} {concurrency:>7} {stats['rps']:>8.2f} {stats['p50']:>8.1f} {stats['p99']:>8.1f} "
+              f"{speedup:>7.2f}x {stats['rps'] / (base * workers):>9.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import itertools
+import os
+import zipfile
+from pathlib import PurePosixPath
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple
+
+from ml.uploads import IMAGE_TYPES, sniff_mime
+
+# Images analysed together (one classifier batch / one segmentation forward pass)
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "8"))
+# Upper bound on images per request, across all files and archive members
+BULK_MAX_IMAGES = int(os.getenv("BULK_MAX_IMAGES", "1000"))
+# Larger images (or archive members claiming to be) are reported, not decoded
+BULK_MAX_IMAGE_MB = float(os.getenv("BULK_MAX_IMAGE_MB", "25"))
+
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff"}
+
+# (filename, image bytes or None, error or None)
+BulkItem = Tuple[str, Optional[bytes], Optional[str]]
+
+
+def iter_bulk_images(sources: Iterable[Tuple[str, BinaryIO]]) -> Iterator[BulkItem]:
+    """
+    Yield the images in a bulk upload one at a time.
+
+    Each source is a plain image or a zip archive; archive members are read
+    lazily, so at most one image is held in memory here. Oversized images and
+    unreadable archives produce an error item instead of aborting the stream.
+    """
+    max_bytes = int(BULK_MAX_IMAGE_MB * 1024 * 1024)
+    count = 0
+    for filename, fileobj in sources:
+        for item in _iter_source(filename, fileobj, max_bytes):
+            if count >= BULK_MAX_IMAGES:
+                yield filename, None, f"Image limit reached ({BULK_MAX_IMAGES} per request); remaining images skipped"
+                return
+            count += 1
+            yield item
+
+
+def count_bulk_images(sources: Iterable[Tuple[str, BinaryIO]]) -> int:
+    """Number of images iter_bulk_images will yield (archives are only listed, not read)."""
+    count = 0
+    for _, fileobj in sources:
+        fileobj.seek(0)
+        if zipfile.is_zipfile(fileobj):
+            fileobj.seek(0)
+            try:
+                with zipfile.ZipFile(fileobj) as archive:
+                    count += sum(1 for _ in _image_members(archive.infolist()))
+            except zipfile.BadZipFile:
+                count += 1
+        else:
+            count += 1
+    return min(count, BULK_MAX_IMAGES)
+
+
+def _iter_source(filename: str, fileobj: BinaryIO, max_bytes: int) -> Iterator[BulkItem]:
+    fileobj.seek(0)
+    if not zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        data = fileobj.read(max_bytes + 1)
+        if len(data) > max_bytes:
+            yield filename, None, f"Image exceeds {BULK_MAX_IMAGE_MB:g} MB"
+        else:
+            yield filename, data, None
+        return
+
+    fileobj.seek(0)
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile as e:
+        yield filename, None, f"Unreadable zip archive: {e}"
+        return
+    with archive:
+        for member in _image_members(archive.infolist()):
+            name = f"{filename}/{member.filename}"
+            if member.file_size > max_bytes:
+                yield name, None, f"Image exceeds {BULK_MAX_IMAGE_MB:g} MB"
+                continue
+            try:
+                with archive.open(member) as f:
+                    # Never trust the declared size: read at most the limit
+                    data = f.read(max_bytes + 1)
+            except Exception as e:
+                yield name, None, f"Could not extract image: {e}"
+                continue
+            if len(data) > max_bytes:
+                yield name, None, f"Image exceeds {BULK_MAX_IMAGE_MB:g} MB"
+            elif sniff_mime(data[:16]) not in IMAGE_TYPES:
+                # Top-level files are checked on upload; archive members only here
+                yield name, None, "Not a supported image file"
+            else:
+                yield name, data, None
+
+
+def _image_members(members: List[zipfile.ZipInfo]) -> Iterator[zipfile.ZipInfo]:
+    for member in members:
+        path = PurePosixPath(member.filename)
+        if member.is_dir() or path.name.startswith(".") or "__MACOSX" in path.parts:
+            continue
+        if path.suffix.lower() in IMAGE_SUFFIXES:
+            yield member
+
+
+def next_batch(items: Iterator[BulkItem], size: int = BULK_BATCH_SIZE) -> List[BulkItem]:
+    """Pull up to ``size`` items; an empty list means the upload is exhausted."""
+    return list(itertools.islice(items, max(1, size)))
@@ -0,0 +1,439 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import binascii
+import json
+import os
+from bisect import bisect_left, bisect_right, insort
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ml.write_behind import get_write_behind
+
+PENDING_REVIEW = "PENDING_NCG_REVIEW"
+REVIEWED = "REVIEWED"
+
+# Oncologist worklist paging
+WORKLIST_PAGE_SIZE = int(os.getenv("WORKLIST_PAGE_SIZE", "50"))
+WORKLIST_MAX_PAGE_SIZE = 200
+WORKLIST_SORTS = ("timestamp", "risk_score")
+
+# Case ids reserved per counter round trip (per process)
+CASE_ID_BLOCK_SIZE = int(os.getenv("CASE_ID_BLOCK_SIZE", "20"))
+
+
+class ScanCase:
+    """One triaged scan on the oncologist worklist."""
+
+    __slots__ = ("case_id", "patient_name", "patient_email", "patient_phone", "risk_label",
+                 "risk_score", "status", "timestamp", "image_url", "image_path", "thumb_url", "overlay_url")
+
+    def __init__(
+        self,
+        case_id: int,
+        patient_name: str,
+        risk_label: str,
+        risk_score: float,
+        image_url: Optional[str] = None,
+        image_path: Optional[Path] = None,
+        patient_email: Optional[str] = None,
+        patient_phone: Optional[str] = None,
+        status: str = PENDING_REVIEW,  # or REVIEWED
+        timestamp: Optional[str] = None,
+        thumb_url: Optional[str] = None,
+        overlay_url: Optional[str] = None,
+    ) -> None:
+        self.case_id = case_id
+        self.patient_name = patient_name
+        self.patient_email = patient_email
+        self.patient_phone = patient_phone
+        self.risk_label = risk_label
+        self.risk_score = float(risk_score)
+        self.status = status
+        self.timestamp = timestamp
+        self.image_url = image_url
+        self.image_path = image_path
+        self.thumb_url = thumb_url
+        self.overlay_url = overlay_url
+
+    def to_doc(self) -> Dict[str, Any]:
+        """Mongo document (the onco_cases schema the patient portal also reads)."""
+        doc = {name: getattr(self, name) for name in self.__slots__}
+        doc["image_path"] = str(self.image_path) if self.image_path else None
+        return {key: value for key, value in doc.items() if value is not None}
+
+    @classmethod
+    def from_doc(cls, doc: Dict[str, Any]) -> "ScanCase":
+        return cls(
+            case_id=int(doc["case_id"]),
+            patient_name=doc.get("patient_name", ""),
+            risk_label=doc.get("risk_label", ""),
+            risk_score=doc.get("risk_score", 0.0),
+            image_url=doc.get("image_url"),
+            image_path=Path(doc["image_path"]) if doc.get("image_path") else None,
+            patient_email=doc.get("patient_email"),
+            patient_phone=doc.get("patient_phone"),
+            status=doc.get("status", PENDING_REVIEW),
+            timestamp=doc.get("timestamp"),
+            thumb_url=doc.get("thumb_url"),
+            overlay_url=doc.get("overlay_url"),
+        )
+
+
+def _sort_value(case: ScanCase, field: str) -> Any:
+    # Timestamps are "%Y-%m-%d %H:%M:%S" strings, so they sort chronologically
+    return case.risk_score if field == "risk_score" else (case.timestamp or "")
+
+
+def encode_cursor(value: Any, case_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([value, case_id]).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, int]:
+    try:
+        value, case_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return value, int(case_id)
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise ValueError(f"Invalid worklist cursor: {cursor!r}") from e
+
+
+class WorklistQuery:
+    """
+    One page of the oncologist worklist: optional filters on status, risk
+    label and upload date (inclusive ``YYYY-MM-DD`` bounds), a sort on
+    ``timestamp`` or ``risk_score`` with ``case_id`` as the tie-breaker, and
+    an opaque keyset cursor (the sort key of the last case on the previous
+    page), so every page is a range read on an index rather than a skip.
+    """
+
+    def __init__(
+        self,
+        status: Optional[str] = None,
+        risk_label: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        sort: str = "timestamp",
+        descending: bool = True,
+        cursor: Optional[str] = None,
+        limit: int = WORKLIST_PAGE_SIZE,
+    ) -> None:
+        if sort not in WORKLIST_SORTS:
+            raise ValueError(f"Unknown worklist sort {sort!r}; expected one of {WORKLIST_SORTS}")
+        self.status = status or None
+        self.risk_label = risk_label or None
+        self.sort = sort
+        self.descending = descending
+        self.limit = max(1, min(int(limit), WORKLIST_MAX_PAGE_SIZE))
+        self.after = decode_cursor(cursor) if cursor else None
+        if self.after is not None and not isinstance(self.after[0], (int, float) if sort == "risk_score" else str):
+            raise ValueError(f"Worklist cursor does not match sort {sort!r}")
+        # Timestamp bounds: since <= timestamp < until
+        self.since = date.fromisoformat(date_from).isoformat() if date_from else None
+        self.until = (date.fromisoformat(date_to) + timedelta(days=1)).isoformat() if date_to else None
+
+    def matches(self, case: ScanCase) -> bool:
+        if self.status is not None and case.status != self.status:
+            return False
+        if self.risk_label is not None and case.risk_label != self.risk_label:
+            return False
+        timestamp = case.timestamp or ""
+        if self.since is not None and timestamp < self.since:
+            return False
+        return self.until is None or timestamp < self.until
+
+    def mongo_filter(self, with_cursor: bool = True) -> Dict[str, Any]:
+        query: Dict[str, Any] = {}
+        if self.status is not None:
+            query["status"] = self.status
+        if self.risk_label is not None:
+            query["risk_label"] = self.risk_label
+        if self.since is not None or self.until is not None:
+            query["timestamp"] = {}
+            if self.since is not None:
+                query["timestamp"]["$gte"] = self.since
+            if self.until is not None:
+                query["timestamp"]["$lt"] = self.until
+        if with_cursor and self.after is not None:
+            value, case_id = self.after
+            op = "$lt" if self.descending else "$gt"
+            query["$or"] = [{self.sort: {op: value}}, {self.sort: value, "case_id": {op: case_id}}]
+        return query
+
+    def mongo_sort(self) -> List[Tuple[str, int]]:
+        direction = -1 if self.descending else 1
+        return [(self.sort, direction), ("case_id", direction)]
+
+
+class WorklistPage:
+    """The cases on one worklist page, the cursor of the next page and the filtered total."""
+
+    def __init__(self, cases: List[ScanCase], next_cursor: Optional[str], total: int) -> None:
+        self.cases = cases
+        self.next_cursor = next_cursor
+        self.total = total
+
+
+def _page(query: WorklistQuery, cases: List[ScanCase], total: int) -> WorklistPage:
+    """``cases`` holds up to ``limit + 1`` matches; the extra one only signals a next page."""
+    next_cursor = None
+    if len(cases) > query.limit:
+        cases = cases[:query.limit]
+        last = cases[-1]
+        next_cursor = encode_cursor(_sort_value(last, query.sort), last.case_id)
+    return WorklistPage(cases, next_cursor, total)
+
+
+class InMemoryCaseStore:
+    """
+    Process-local store, used when MongoDB is not configured.
+
+    Cases are indexed by ``case_id`` (primary), status and patient email;
+    the secondary indexes are insertion-ordered dicts used as sets, so
+    adding, reviewing and removing a case are O(1) and listing a status or a
+    patient's cases never scans the whole backlog. For the worklist, the
+    ``(sort value, case_id)`` keys of every sortable field are also kept in
+    sorted lists per combination of status and risk label filter (either may
+    be "any"), so a page starts with a bisect at the cursor and the filtered
+    total is two bisects on the date range of the timestamp list. Ids come
+    from a counter that is never reset, so they are not reused after a clear.
+    """
+
+    def __init__(self) -> None:
+        self._by_id: Dict[int, ScanCase] = {}
+        self._by_status: Dict[str, Dict[int, None]] = {}
+        self._by_email: Dict[str, Dict[int, None]] = {}
+        # (status or None, risk label or None, sort field) -> ascending [(value, case_id)]
+        self._sorted: Dict[Tuple[Optional[str], Optional[str], str], List[Tuple[Any, int]]] = {}
+        self._last_id = 0
+
+    async def setup(self) -> None:
+        pass
+
+    async def next_id(self) -> int:
+        self._last_id += 1
+        return self._last_id
+
+    async def add(self, case: ScanCase) -> None:
+        self._by_id[case.case_id] = case
+        self._last_id = max(self._last_id, case.case_id)
+        self._index(case)
+
+    async def get(self, case_id: int) -> Optional[ScanCase]:
+        return self._by_id.get(case_id)
+
+    async def set_status(self, case_id: int, status: str) -> bool:
+        case = self._by_id.get(case_id)
+        if case is None:
+            return False
+        self._unindex(case)
+        case.status = status
+        self._index(case)
+        return True
+
+    async def by_status(self, status: str, limit: Optional[int] = None) -> List[ScanCase]:
+        return self._cases(self._by_status.get(status, {}), limit)
+
+    async def by_email(self, email: str, limit: Optional[int] = None) -> List[ScanCase]:
+        return self._cases(self._by_email.get(email, {}), limit)
+
+    async def all(self, limit: Optional[int] = None) -> List[ScanCase]:
+        return self._cases(self._by_id, limit)
+
+    async def count(self, status: Optional[str] = None) -> int:
+        return len(self._by_id) if status is None else len(self._by_status.get(status, {}))
+
+    async def worklist(self, query: WorklistQuery) -> WorklistPage:
+        # The date range is a key range of the timestamp order
+        by_time = self._sorted.get((query.status, query.risk_label, "timestamp"), [])
+        since, until = self._date_range(by_time, query)
+        total = max(until - since, 0)
+
+        keys = self._sorted.get((query.status, query.risk_label, query.sort), [])
+        lo, hi = (since, until) if query.sort == "timestamp" else (0, len(keys))
+
+        if query.after is not None:
+            if query.descending:
+                hi = min(hi, bisect_left(keys, query.after))
+            else:
+                lo = max(lo, bisect_right(keys, query.after))
+        positions = range(hi - 1, lo - 1, -1) if query.descending else range(lo, hi)
+        page: List[ScanCase] = []
+        for i in positions:
+            case = self._by_id[keys[i][1]]
+            if query.matches(case):
+                page.append(case)
+                if len(page) > query.limit:
+                    break
+        return _page(query, page, total)
+
+    async def clear(self) -> List[ScanCase]:
+        """Remove every case; returns them (e.g. to delete their images)."""
+        removed = list(self._by_id.values())
+        self._by_id.clear()
+        self._by_status.clear()
+        self._by_email.clear()
+        self._sorted.clear()
+        return removed
+
+    @staticmethod
+    def _date_range(keys: List[Tuple[Any, int]], query: WorklistQuery) -> Tuple[int, int]:
+        lo = bisect_left(keys, (query.since,)) if query.since is not None else 0
+        hi = bisect_left(keys, (query.until,)) if query.until is not None else len(keys)
+        return lo, hi
+
+    def _cases(self, ids: Iterable[int], limit: Optional[int]) -> List[ScanCase]:
+        cases = []
+        for case_id in ids:
+            if limit is not None and len(cases) >= limit:
+                break
+            cases.append(self._by_id[case_id])
+        return cases
+
+    def _index(self, case: ScanCase) -> None:
+        self._by_status.setdefault(case.status, {})[case.case_id] = None
+        if case.patient_email:
+            self._by_email.setdefault(case.patient_email, {})[case.case_id] = None
+        for index, key in self._sort_keys(case):
+            insort(self._sorted.setdefault(index, []), key)
+
+    def _unindex(self, case: ScanCase) -> None:
+        for index, key in ((self._by_status, case.status), (self._by_email, case.patient_email)):
+            ids = index.get(key)
+            if ids is not None:
+                ids.pop(case.case_id, None)
+                if not ids:
+                    del index[key]
+        for index, key in self._sort_keys(case):
+            keys = self._sorted.get(index)
+            if keys is not None:
+                i = bisect_left(keys, key)
+                if i < len(keys) and keys[i] == key:
+                    del keys[i]
+
+    @staticmethod
+    def _sort_keys(case: ScanCase) -> Iterable[Tuple[Tuple[Optional[str], Optional[str], str], Tuple[Any, int]]]:
+        """(sorted list, key) for every filter combination the case belongs to."""
+        for field in WORKLIST_SORTS:
+            key = (_sort_value(case, field), case.case_id)
+            for status in (None, case.status):
+                for label in (None, case.risk_label):
+                    yield (status, label, field), key
+
+
+class MongoCaseStore:
+    """
+    Cases in the ``onco_cases`` collection, shared by every worker. Ids come
+    from an atomic ``$inc`` on a counter document, which reserves a block of
+    CASE_ID_BLOCK_SIZE ids at a time, so concurrent uploads in different
+    processes never get the same id and most uploads need no round trip
+    for one (ids stay unique, but are only roughly in upload order across
+    processes). New cases are inserted directly, so a failed insert is an
+    error for the upload that made it; status changes (idempotent, and
+    retried if lost) go through the write-behind queue, and reads first wait
+    (briefly) for this process's queued ones so the worklist shows them. A unique index on ``case_id`` plus indexes
+    on status and patient email keep lookups and reviews on index scans;
+    worklist pages are keyset range reads on the ``(status, sort field,
+    case_id)`` / ``(sort field, case_id)`` indexes (all declared in
+    ml.db_indexes).
+    """
+
+    COUNTER_ID = "onco_cases"
+
+    def __init__(self, collection, counters, writes, id_block: int = CASE_ID_BLOCK_SIZE) -> None:
+        self.collection = collection
+        self.counters = counters
+        self.writes = writes
+        self.id_block = max(1, id_block)
+        self._next_id = 0
+        self._block_end = -1
+        self._id_lock: Optional[asyncio.Lock] = None
+
+    async def setup(self) -> None:
+        # Cases written before the counter existed: start above the largest id
+        last = await self.collection.find_one({}, {"case_id": 1}, sort=[("case_id", -1)])
+        if last is not None:
+            await self.counters.update_one({"_id": self.COUNTER_ID}, {"$max": {"seq": int(last["case_id"])}}, upsert=True)
+        # The indexes are declared in ml.db_indexes and created at startup
+
+    async def next_id(self) -> int:
+        from pymongo import ReturnDocument
+
+        if self._id_lock is None:
+            self._id_lock = asyncio.Lock()
+        async with self._id_lock:
+            if self._next_id > self._block_end:
+                doc = await self.counters.find_one_and_update(
+                    {"_id": self.COUNTER_ID},
+                    {"$inc": {"seq": self.id_block}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                )
+                self._block_end = int(doc["seq"])
+                self._next_id = self._block_end - self.id_block + 1
+            case_id = self._next_id
+            self._next_id += 1
+        return case_id
+
+    async def add(self, case: ScanCase) -> None:
+        await self.collection.insert_one(case.to_doc())
+
+    async def get(self, case_id: int) -> Optional[ScanCase]:
+        await self.writes.barrier(self.collection.name)
+        doc = await self.collection.find_one({"case_id": case_id})
+        return ScanCase.from_doc(doc) if doc is not None else None
+
+    async def set_status(self, case_id: int, status: str) -> bool:
+        """Queued; True means the update was accepted, not that the case exists."""
+        await self.writes.update(self.collection.name, {"case_id": case_id}, {"$set": {"status": status}})
+        return True
+
+    async def by_status(self, status: str, limit: Optional[int] = None) -> List[ScanCase]:
+        return await self._find({"status": status}, limit)
+
+    async def by_email(self, email: str, limit: Optional[int] = None) -> List[ScanCase]:
+        return await self._find({"patient_email": email}, limit)
+
+    async def all(self, limit: Optional[int] = None) -> List[ScanCase]:
+        return await self._find({}, limit)
+
+    async def count(self, status: Optional[str] = None) -> int:
+        await self.writes.barrier(self.collection.name)
+        return await self.collection.count_documents({} if status is None else {"status": status})
+
+    async def worklist(self, query: WorklistQuery) -> WorklistPage:
+        await self.writes.barrier(self.collection.name)
+        cursor = self.collection.find(query.mongo_filter()).sort(query.mongo_sort()).limit(query.limit + 1)
+        page = [ScanCase.from_doc(doc) async for doc in cursor]
+        total = await self.collection.count_documents(query.mongo_filter(with_cursor=False))
+        return _page(query, page, total)
+
+    async def clear(self) -> List[ScanCase]:
+        await self.writes.barrier(self.collection.name)
+        cursor = self.collection.find({"image_path": {"$exists": True}}, {"case_id": 1, "image_path": 1})
+        removed = [ScanCase.from_doc(doc) async for doc in cursor]
+        # The id counter is kept, so ids are never reused
+        await self.collection.delete_many({})
+        return removed
+
+    async def _find(self, query: Dict[str, Any], limit: Optional[int]) -> List[ScanCase]:
+        await self.writes.barrier(self.collection.name)
+        cursor = self.collection.find(query).sort("case_id", 1)
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        return [ScanCase.from_doc(doc) async for doc in cursor]
+
+
+# Global instance
+case_store = None
+
+def get_case_store(db=None):
+    """The process-wide case store, backed by Mongo when ``db`` is given, else in memory."""
+    global case_store
+    if case_store is None:
+        if db is not None:
+            case_store = MongoCaseStore(db["onco_cases"], db["onco_counters"], get_write_behind(db))
+        else:
+            case_store = InMemoryCaseStore()
+    return case_store
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import os
+import time
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+
+from ml.lazy import lazy_module
+
+tf = lazy_module("tensorflow", requires_ml=True)
+
+# Set INFERENCE_COMPILED=0 to fall back to plain Keras model.predict
+COMPILED_INFERENCE_ENABLED = os.getenv("INFERENCE_COMPILED", "1").lower() not in ("0", "false", "no")
+
+
+class CompiledPredictor:
+    """
+    Wraps a loaded Keras model in a traced ``tf.function`` with a fixed input
+    signature (batch dimension left open).
+
+    ``model.predict`` builds a data adapter, a callback list and a fresh
+    predict step on every call, which dominates the cost for a batch of one.
+    Calling the traced function directly skips all of that; because the
+    signature is fixed, it is traced exactly once, and ``warmup`` pays that
+    cost at load time instead of on the first patient.
+    """
+
+    def __init__(self, model: tf.keras.Model, name: str, input_shape: Optional[Sequence[Optional[int]]] = None) -> None:
+        self.model = model
+        self.name = name
+        shape = tuple(input_shape) if input_shape is not None else tuple(model.input_shape[1:])
+        self.input_shape = shape
+        self.input_signature = [tf.TensorSpec(shape=(None,) + shape, dtype=tf.float32)]
+        self._fn = tf.function(self._forward, input_signature=self.input_signature)
+
+    def _forward(self, x):
+        return self.model(x, training=False)
+
+    def __call__(self, x: np.ndarray) -> np.ndarray:
+        return self._fn(tf.convert_to_tensor(x, dtype=tf.float32)).numpy()
+
+    def warmup(self, batch_sizes: Iterable[int] = (1,)) -> float:
+        """Trace the graph and allocate buffers with dummy inputs; returns seconds taken."""
+        start = time.perf_counter()
+        for n in batch_sizes:
+            dummy_shape = (n,) + tuple(d or 1 for d in self.input_shape)
+            self(np.zeros(dummy_shape, dtype=np.float32))
+        elapsed = time.perf_counter() - start
+        print(f"Warm-up for {self.name} model finished in {elapsed * 1000:.0f} ms")
+        return elapsed
+
+
+def compile_predictor(model: Optional[tf.keras.Model], name: str, input_shape: Optional[Sequence[Optional[int]]] = None) -> Optional[CompiledPredictor]:
+    """
+    Build and warm up a CompiledPredictor for ``model``. Returns None when the
+    model is missing or not a Keras model (e.g. a TFLite artifact), compiled
+    inference is disabled, or tracing fails, in which case callers keep using
+    ``model.predict``.
+    """
+    if not isinstance(model, tf.keras.Model) or not COMPILED_INFERENCE_ENABLED:
+        return None
+    try:
+        predictor = CompiledPredictor(model, name, input_shape)
+        predictor.warmup()
+        return predictor
+    except Exception as e:
+        print(f"Compiled inference unavailable for {name} model, using model.predict: {e}")
+        return None
@@ -0,0 +1,184 @@
+"""
+MongoDB indexes for every collection the app queries, declared in one place
+and created idempotently at startup (creating an index that already exists
+with the same keys and options is a no-op on the server).
+
+The hot queries are listed next to them; `--explain` runs ``explain()`` on
+each one and fails if the winning plan contains a COLLSCAN, so a query
+change that outgrows its index is caught before it reaches production.
+
+Usage (from repo root, with MONGODB_URI set):
+    python -m ml.db_indexes              # create any missing indexes
+    python -m ml.db_indexes --explain    # also verify the hot query plans
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+IndexKeys = List[Tuple[str, int]]
+
+
+class IndexSpec:
+    """One index: its key pattern and options."""
+
+    def __init__(self, keys: IndexKeys, unique: bool = False) -> None:
+        self.keys = keys
+        self.unique = unique
+
+    @property
+    def name(self) -> str:
+        # Mongo's default index name, e.g. "status_1_timestamp_-1_case_id_-1"
+        return "_".join(f"{field}_{direction}" for field, direction in self.keys)
+
+
+# Lives in the patient portal's database (patient_app.auth), which may not be the app's
+USERS_COLLECTION = "patient_users"
+
+# collection -> indexes
+INDEXES: Dict[str, List[IndexSpec]] = {
+    # Oncologist worklist (ml.case_store) and the patient dashboard
+    "onco_cases": [
+        IndexSpec([("case_id", 1)], unique=True),
+        IndexSpec([("status", 1), ("case_id", 1)]),
+        IndexSpec([("patient_email", 1), ("case_id", 1)]),
+        IndexSpec([("patient_name", 1)]),
+        IndexSpec([("status", 1), ("timestamp", -1), ("case_id", -1)]),
+        IndexSpec([("timestamp", -1), ("case_id", -1)]),
+        IndexSpec([("status", 1), ("risk_score", -1), ("case_id", -1)]),
+        IndexSpec([("risk_score", -1), ("case_id", -1)]),
+    ],
+    # Patient dashboard timeline, newest first
+    "medical_timeline": [
+        IndexSpec([("patient_email", 1), ("date", -1)]),
+    ],
+    # Login, registration and every authenticated request look users up by name
+    USERS_COLLECTION: [
+        IndexSpec([("username", 1)], unique=True),
+    ],
+    # Job queue (ml.job_queue): workers claim the oldest queued job
+    "onco_jobs": [
+        IndexSpec([("status", 1), ("created_at", 1)]),
+    ],
+    # Per-item results of bulk jobs, read back in order
+    "onco_job_items": [
+        IndexSpec([("job_id", 1), ("index", 1)], unique=True),
+    ],
+}
+
+
+async def ensure_indexes(collection) -> List[str]:
+    """
+    Create the declared indexes of ``collection`` (by its name). Best effort:
+    an index that cannot be built (e.g. a unique index over existing
+    duplicates) is reported and skipped, so startup never fails on it.
+    """
+    ensured = []
+    for spec in INDEXES.get(collection.name, []):
+        try:
+            ensured.append(await collection.create_index(spec.keys, name=spec.name, unique=spec.unique))
+        except Exception as e:
+            print(f"WARNING: Could not create index {spec.name} on {collection.name}: {e}")
+    return ensured
+
+
+async def ensure_all_indexes(db, collections: Optional[Sequence[str]] = None) -> Dict[str, List[str]]:
+    ensured = {}
+    for name in collections or INDEXES:
+        ensured[name] = await ensure_indexes(db[name])
+    print(f"MongoDB indexes ensured: {sum(len(names) for names in ensured.values())} on {len(ensured)} collections")
+    return ensured
+
+
+# -------------------- Query plan verification --------------------
+
+# (label, collection, filter, sort) for the queries on the request path:
+# patient_app.auth.get_current_user, patient_app.router.get_dashboard and the
+# oncologist worklist
+_SAMPLE_EMAIL = "explain@example.com"
+HOT_QUERIES: List[Tuple[str, str, Dict[str, Any], Optional[IndexKeys]]] = [
+    ("get_current_user: user by username", USERS_COLLECTION, {"username": "explain"}, None),
+    ("get_dashboard: cases by email", "onco_cases", {"patient_email": _SAMPLE_EMAIL}, None),
+    ("get_dashboard: cases by name", "onco_cases", {"patient_name": "explain"}, None),
+    ("get_dashboard: timeline by email", "medical_timeline", {"patient_email": _SAMPLE_EMAIL}, [("date", -1)]),
+    ("worklist: case by id", "onco_cases", {"case_id": 1}, None),
+    ("worklist: newest first", "onco_cases", {}, [("timestamp", -1), ("case_id", -1)]),
+    ("worklist: pending by risk", "onco_cases", {"status": "PENDING_NCG_REVIEW"},
+     [("risk_score", -1), ("case_id", -1)]),
+]
+
+
+def plan_stages(plan: Any) -> Iterator[str]:
+    """Every ``stage`` in an explain plan tree (classic and slot-based engine)."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from plan_stages(item)
+
+
+def explain_hot_queries(db, users_db=None) -> List[Tuple[str, List[str]]]:
+    """
+    (label, winning plan stages) for each hot query, using a synchronous
+    pymongo ``db`` (and ``users_db`` for patient_users, when the portal's
+    users live in another database).
+    """
+    results = []
+    for label, collection, query, sort in HOT_QUERIES:
+        database = users_db if users_db is not None and collection == USERS_COLLECTION else db
+        cursor = database[collection].find(query).limit(100)
+        if sort:
+            cursor = cursor.sort(sort)
+        winning = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+        results.append((label, list(plan_stages(winning))))
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--explain", action="store_true", help="fail if a hot query plan has a COLLSCAN")
+    parser.add_argument("--no-create", action="store_true", help="only verify; do not create indexes")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+    uri = os.getenv("MONGODB_URI")
+    if not uri:
+        print("MONGODB_URI is not set")
+        return 2
+    from patient_app.auth import get_database_name_from_uri
+
+    client = MongoClient(uri)
+    # The same databases the app uses: its own (app_main) and the portal's
+    db = client.get_default_database()
+    users_db = client[get_database_name_from_uri(uri)]
+
+    if not args.no_create:
+        for name, specs in INDEXES.items():
+            collection = (users_db if name == USERS_COLLECTION else db)[name]
+            for spec in specs:
+                try:
+                    collection.create_index(spec.keys, name=spec.name, unique=spec.unique)
+                    print(f"  {collection.database.name}.{name}.{spec.name}{' (unique)' if spec.unique else ''}")
+                except Exception as e:
+                    print(f"  {collection.database.name}.{name}.{spec.name}: FAILED ({e})")
+
+    if not args.explain:
+        return 0
+    failed = 0
+    for label, stages in explain_hot_queries(db, users_db):
+        scan = "COLLSCAN" in stages
+        failed += scan
+        print(f"{'FAIL' if scan else 'ok  '}  {label:<36} {' <- '.join(stages)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
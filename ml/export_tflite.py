@@ -0,0 +1,173 @@
+"""
+Export the production Keras models to TFLite, optionally with INT8
+post-training quantization, and verify parity against the Keras model.
+
+Artifacts are written next to the .h5 files and picked up at serving time
+when INFERENCE_BACKEND=tflite (float) or INFERENCE_BACKEND=tflite-int8.
+
+Usage (from repo root):
+    python -m ml.export_tflite                                  # float32, both models
+    python -m ml.export_tflite --int8                           # calibrates on the image store, else static/uploads
+    python -m ml.export_tflite --int8 --calibration-dir /data/mammograms
+    python -m ml.export_tflite --model segmentation --parity-only
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+from typing import Callable, Iterator, List
+
+import numpy as np
+import tensorflow as tf
+
+from ml.image_pipeline import DecodedImage
+from ml.image_store import SAMPLE_IMAGE_DIRS, is_derivative
+from ml.tflite_backend import TFLitePredictor, tflite_artifact_path
+
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff"}
+
+# Parity tolerances: max |p_keras - p_tflite| for the classifier and minimum
+# mask IoU for the segmenter
+CLASSIFIER_TOLERANCE = {False: 1e-3, True: 0.05}
+SEGMENTATION_MIN_IOU = {False: 0.99, True: 0.90}
+
+
+def load_samples(calibration_dir: Path | None, limit: int) -> List[DecodedImage]:
+    """Decode up to ``limit`` images from the calibration directory."""
+    if calibration_dir is None or not calibration_dir.exists():
+        return []
+    samples = []
+    for path in sorted(calibration_dir.rglob("*")):
+        if path.suffix.lower() not in IMAGE_SUFFIXES or is_derivative(path):
+            continue
+        try:
+            image = DecodedImage(path.read_bytes())
+            image.rgb  # force decode so unreadable files are skipped here
+            samples.append(image)
+        except Exception as e:
+            print(f"Skipping {path}: {e}")
+        if len(samples) >= limit:
+            break
+    return samples
+
+
+def sample_inputs(samples: List[DecodedImage], preprocess: Callable[[DecodedImage], np.ndarray],
+                  input_shape, count: int) -> List[np.ndarray]:
+    """Preprocessed sample batches; random inputs when no samples are available."""
+    if samples:
+        return [np.asarray(preprocess(image), dtype=np.float32) for image in samples]
+    print("No calibration images found; using random inputs.")
+    rng = np.random.default_rng(42)
+    return [rng.random((1,) + tuple(input_shape), dtype=np.float32) for _ in range(count)]
+
+
+def convert(keras_model: tf.keras.Model, out_path: Path, int8: bool, calibration: List[np.ndarray]) -> None:
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    if int8:
+        def representative_dataset() -> Iterator[List[np.ndarray]]:
+            for x in calibration:
+                yield [x]
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    out_path.write_bytes(converter.convert())
+    print(f"Wrote {out_path} ({out_path.stat().st_size / 1e6:.1f} MB)")
+
+
+def classifier_parity(keras_fn, tflite: TFLitePredictor, inputs: List[np.ndarray], int8: bool, is_new_model: bool) -> bool:
+    column = 1 if is_new_model else 0
+    diffs, agree = [], 0
+    for x in inputs:
+        p_keras = float(np.asarray(keras_fn(x))[0][column])
+        p_tflite = float(tflite(x)[0][column])
+        diffs.append(abs(p_keras - p_tflite))
+        agree += (p_keras >= 0.5) == (p_tflite >= 0.5)
+    tolerance = CLASSIFIER_TOLERANCE[int8]
+    ok = max(diffs) <= tolerance
+    print(f"classifier parity: max |dp| {max(diffs):.5f}, mean {np.mean(diffs):.5f}, "
+          f"label agreement {agree}/{len(inputs)}, tolerance {tolerance} -> {'PASS' if ok else 'FAIL'}")
+    return ok
+
+
+def segmentation_parity(keras_fn, tflite: TFLitePredictor, inputs: List[np.ndarray], int8: bool) -> bool:
+    ious = []
+    for x in inputs:
+        m_keras = np.asarray(keras_fn(x))[0] > 0.5
+        m_tflite = tflite(x)[0] > 0.5
+        union = np.logical_or(m_keras, m_tflite).sum()
+        ious.append(1.0 if union == 0 else np.logical_and(m_keras, m_tflite).sum() / union)
+    min_iou = SEGMENTATION_MIN_IOU[int8]
+    ok = min(ious) >= min_iou
+    print(f"segmentation parity: min IoU {min(ious):.4f}, mean {np.mean(ious):.4f}, "
+          f"required {min_iou} -> {'PASS' if ok else 'FAIL'}")
+    return ok
+
+
+def export_classifier(args, samples: List[DecodedImage]) -> bool:
+    from ml.model_utils import BreastCancerModel, DEFAULT_MODEL_PATH
+
+    model_path = Path(args.classifier_path) if args.classifier_path else DEFAULT_MODEL_PATH
+    classifier = BreastCancerModel(model_path)
+    if not isinstance(classifier.model, tf.keras.Model):
+        print(f"Classifier Keras model not available at {model_path}")
+        return False
+
+    inputs = sample_inputs(samples, classifier.preprocess_bytes, classifier.model.input_shape[1:], args.num_samples)
+    out_path = tflite_artifact_path(model_path, quantized=args.int8)
+    if not args.parity_only:
+        convert(classifier.model, out_path, args.int8, inputs)
+    keras_fn = classifier.predictor or classifier.model.predict
+    return classifier_parity(keras_fn, TFLitePredictor(out_path, "classifier"), inputs, args.int8, classifier.is_new_model)
+
+
+def export_segmentation(args, samples: List[DecodedImage]) -> bool:
+    from ml.segmentation_utils import SegmentationModel
+
+    segmentor = SegmentationModel(args.segmentation_path) if args.segmentation_path else SegmentationModel()
+    if not isinstance(segmentor.model, tf.keras.Model):
+        print(f"Segmentation Keras model not available at {segmentor.model_path}")
+        return False
+
+    size = (segmentor.img_size, segmentor.img_size, 3)
+    inputs = sample_inputs(samples, segmentor.preprocess, size, args.num_samples)
+    out_path = tflite_artifact_path(segmentor.model_path, quantized=args.int8)
+    if not args.parity_only:
+        convert(segmentor.model, out_path, args.int8, inputs)
+    keras_fn = segmentor.predictor or segmentor.model.predict
+    return segmentation_parity(keras_fn, TFLitePredictor(out_path, "segmentation"), inputs, args.int8)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=["classifier", "segmentation", "all"], default="all")
+    parser.add_argument("--int8", action="store_true", help="full-integer post-training quantization")
+    parser.add_argument("--calibration-dir", type=Path,
+                        help="images used for INT8 calibration and the parity check "
+                             "(default: the image store, else static/uploads)")
+    parser.add_argument("--num-samples", type=int, default=100, help="max calibration/parity images")
+    parser.add_argument("--classifier-path", help="Keras classifier (default: ml/breast_cancer_cnn.h5)")
+    parser.add_argument("--segmentation-path", help="Keras U-Net (default: ml/attention_unet.h5)")
+    parser.add_argument("--parity-only", action="store_true", help="skip conversion, only compare existing artifacts")
+    args = parser.parse_args()
+
+    # Exporting always starts from the Keras model, whatever backend the server uses
+    import ml.tflite_backend as backend
+    backend.INFERENCE_BACKEND = "keras"
+
+    for calibration_dir in [args.calibration_dir] if args.calibration_dir else SAMPLE_IMAGE_DIRS:
+        samples = load_samples(calibration_dir, args.num_samples)
+        if samples:
+            break
+    print(f"Loaded {len(samples)} calibration images from {calibration_dir}")
+
+    ok = True
+    if args.model in ("classifier", "all"):
+        ok &= export_classifier(args, samples)
+    if args.model in ("segmentation", "all"):
+        ok &= export_segmentation(args, samples)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
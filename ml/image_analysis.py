@@ -1,54 +1,86 @@
 from __future__ import annotations
 
-from io import BytesIO
 from typing import Tuple, List, Dict, Any
 import numpy as np
 from PIL import Image
-import tensorflow as tf
-from tensorflow.keras.applications.mobilenet_v2 import MobileNetV2, preprocess_input, decode_predictions
-from tensorflow.keras.preprocessing.image import img_to_array
-import base64
-
-# Load pre-trained MobileNetV2 model
-# In a real scenario, we would fine-tune this on a medical dataset.
-# For this hackathon/demo, we use the base model and simulate specific medical findings
-# if the model detects something relevant or just provide a general analysis.
-try:
-    model = MobileNetV2(weights="imagenet")
-except Exception as e:
-    print(f"Failed to load MobileNetV2: {e}")
-    model = None
-
-def analyze_image(image_bytes: bytes) -> Dict[str, Any]:
+
+from ml.compiled_inference import compile_predictor
+from ml.image_pipeline import DecodedImage, ImageInput
+from ml.lazy import lazy_module
+from ml.model_registry import get_model_registry
+
+# Imported when MobileNetV2 first loads, not when the app starts (see ml.lazy)
+tf = lazy_module("tensorflow", requires_ml=True)
+
+# ImageNet weights are fixed, so the analysis output only changes with this module
+MODEL_VERSION = "mobilenet_v2-imagenet"
+
+class MobileNetAnalyzer:
+    """
+    Pre-trained MobileNetV2 model.
+    In a real scenario, we would fine-tune this on a medical dataset.
+    For this hackathon/demo, we use the base model and simulate specific medical findings
+    if the model detects something relevant or just provide a general analysis.
+    """
+    version = MODEL_VERSION
+
+    def __init__(self) -> None:
+        try:
+            self.model = tf.keras.applications.mobilenet_v2.MobileNetV2(weights="imagenet")
+        except Exception as e:
+            print(f"Failed to load MobileNetV2: {e}")
+            self.model = None
+        self.predictor = compile_predictor(self.model, "MobileNetV2", (224, 224, 3))
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        if self.predictor is not None:
+            return self.predictor(x)
+        return self.model.predict(x, verbose=0)
+
+    def warmup(self) -> bool:
+        if self.model is None:
+            return False
+        self.predict(np.zeros((1, 224, 224, 3), dtype=np.float32))
+        return True
+
+# Loaded on first use (not at import) through the model registry
+get_model_registry().register("mobilenet", lambda path: MobileNetAnalyzer())
+
+def get_analyzer() -> MobileNetAnalyzer:
+    return get_model_registry().get("mobilenet")
+
+def _mobilenet_input(image: DecodedImage) -> np.ndarray:
+    """MobileNetV2 input (1, 224, 224, 3), memoized on the shared DecodedImage."""
+    def make() -> np.ndarray:
+        x = tf.keras.preprocessing.image.img_to_array(image.resized_rgb((224, 224)))
+        x = np.expand_dims(x, axis=0)
+        return tf.keras.applications.mobilenet_v2.preprocess_input(x)
+    return image.memo("mobilenet_input", make)
+
+def analyze_image(image_bytes: ImageInput) -> Dict[str, Any]:
     """
     Analyzes an image using MobileNetV2 and returns predictions.
     Also simulates medical specific findings for demonstration.
     """
-    if model is None:
+    analyzer = get_analyzer()
+    if analyzer.model is None:
         return {"error": "Model not loaded"}
 
     try:
-        img = Image.open(BytesIO(image_bytes)).convert("RGB")
-        img = img.resize((224, 224))
-        x = img_to_array(img)
-        x = np.expand_dims(x, axis=0)
-        x = preprocess_input(x)
+        image = DecodedImage.ensure(image_bytes)
+        img = image.resized_rgb((224, 224))
+        x = _mobilenet_input(image)
 
-        preds = model.predict(x)
-        decoded = decode_predictions(preds, top=3)[0]
+        preds = analyzer.predict(x)
+        decoded = tf.keras.applications.mobilenet_v2.decode_predictions(preds, top=3)[0]
 
         results = []
         for _, label, score in decoded:
             results.append({"label": label, "confidence": float(score)})
 
         # Create a base64 preview of the image for frontend display
-        # Resize to a smaller size for preview
-        preview_img = img.copy()
-        preview_img.thumbnail((200, 200))  # Resize for preview
-        preview_buffer = BytesIO()
-        preview_img.save(preview_buffer, format="JPEG", quality=80)
-        preview_base64 = base64.b64encode(preview_buffer.getvalue()).decode("utf-8")
-        image_preview_url = f"data:image/jpeg;base64,{preview_base64}"
+        # (thumbnail is generated once per upload and shared)
+        image_preview_url = image.preview_data_uri()
 
         # SIMULATED MEDICAL ANALYSIS for Demo
         # If we were fine-tuned, these would be real classes.
@@ -116,37 +148,30 @@ def _is_grayscale_or_xray(img: Image.Image) -> bool:
     avg_saturation = np.mean(s)
     return bool(avg_saturation < 20) # Low saturation implies grayscale/X-ray like
 
-def analyze_breast_image(image_bytes: bytes) -> Dict[str, Any]:
+def analyze_breast_image(image_bytes: ImageInput) -> Dict[str, Any]:
     """
     Analyzes a breast cancer image using our enhanced multi-dataset approach.
     This function specifically targets breast cancer imaging and utilizes
     information from calcification and mass datasets in addition to CBIS-DDSM.
     """
-    if model is None:
+    analyzer = get_analyzer()
+    if analyzer.model is None:
         return {"error": "Model not loaded"}
 
     try:
-        img = Image.open(BytesIO(image_bytes)).convert("RGB")
-        img = img.resize((224, 224))
-        x = img_to_array(img)
-        x = np.expand_dims(x, axis=0)
-        x = preprocess_input(x)
+        image = DecodedImage.ensure(image_bytes)
+        x = _mobilenet_input(image)
 
-        preds = model.predict(x)
-        decoded = decode_predictions(preds, top=3)[0]
+        preds = analyzer.predict(x)
+        decoded = tf.keras.applications.mobilenet_v2.decode_predictions(preds, top=3)[0]
 
         results = []
         for _, label, score in decoded:
             results.append({"label": label, "confidence": float(score)})
 
         # Create a base64 preview of the image for frontend display
-        # Resize to a smaller size for preview
-        preview_img = img.copy()
-        preview_img.thumbnail((200, 200))  # Resize for preview
-        preview_buffer = BytesIO()
-        preview_img.save(preview_buffer, format="JPEG", quality=80)
-        preview_base64 = base64.b64encode(preview_buffer.getvalue()).decode("utf-8")
-        image_preview_url = f"data:image/jpeg;base64,{preview_base64}"
+        # (thumbnail is generated once per upload and shared)
+        image_preview_url = image.preview_data_uri()
 
         # SIMULATED ENHANCED BREAST CANCER ANALYSIS
         # In a production environment, this would use models specifically
@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import io
+import os
+import threading
+from io import BytesIO
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from ml.lazy import lazy_module
+
+# OpenCV is only imported once an image is first decoded through it
+cv2 = lazy_module("cv2")
+
+PREVIEW_SIZE = (200, 200)
+
+# Decode JPEGs at 1/2, 1/4 or 1/8 scale when the model input is that much
+# smaller than the upload (IMAGE_REDUCED_DECODE=0 always decodes full size)
+REDUCED_DECODE_ENABLED = os.getenv("IMAGE_REDUCED_DECODE", "1").lower() not in ("0", "false", "no")
+REDUCED_SCALES = (8, 4, 2)
+_CV2_REDUCED_FLAGS = {
+    2: "IMREAD_REDUCED_COLOR_2",
+    4: "IMREAD_REDUCED_COLOR_4",
+    8: "IMREAD_REDUCED_COLOR_8",
+}
+
+_EXIF_ORIENTATION = 0x0112
+# EXIF orientations that swap width and height (90/270 degree rotations)
+_TRANSPOSING_ORIENTATIONS = (5, 6, 7, 8)
+
+
+class _BufferReader(io.RawIOBase):
+    """Seekable read-only file over a buffer (e.g. an mmap'd upload) that does not copy it."""
+
+    def __init__(self, data) -> None:
+        self._view = memoryview(data).cast("B")
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        chunk = self._view[self._pos:self._pos + len(buffer)]
+        buffer[:len(chunk)] = chunk
+        self._pos += len(chunk)
+        return len(chunk)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def close(self) -> None:
+        self._view.release()
+        super().close()
+
+
+class DecodedImage:
+    """
+    One uploaded image, decoded once and shared by every model stage.
+
+    The classifier (224x224 RGB or grayscale), the segmenter (256x256 BGR plus
+    the full-resolution frame for the overlay) and the preview thumbnail all
+    derive their inputs from the same decode. Every derived array is computed
+    lazily on first use and memoized, so a single upload is never decoded or
+    resized twice even when stages run concurrently. Each derived value has
+    its own lock, so the classifier and segmenter only wait on each other for
+    the inputs they actually share (the decode itself).
+
+    Model inputs are far smaller than a mammogram, so JPEGs are decoded at a
+    reduced scale (the largest of 1/2, 1/4, 1/8 that still covers the target
+    size) by libjpeg itself, via PIL draft mode for the RGB/grayscale views and
+    cv2 ``IMREAD_REDUCED_*`` for the segmenter's BGR view. The full-resolution
+    frame is only decoded when something needs it (overlays, tiled mode).
+
+    ``data`` may be any bytes-like buffer; a memory-mapped upload (see
+    ml.uploads) is decoded in place. Pass ``sha256`` when the hash is already
+    known (computed while the upload streamed in).
+    """
+
+    def __init__(self, data: bytes, sha256: Optional[str] = None) -> None:
+        self.data = data
+        self._derived: Dict[Hashable, Any] = {}
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+        self._lock = threading.Lock()
+        if sha256 is not None:
+            self._derived["sha256"] = sha256
+
+    @classmethod
+    def from_upload(cls, upload) -> "DecodedImage":
+        """Wrap an ml.uploads.IngestedUpload, reusing its streamed hash."""
+        return cls(upload.data, upload.sha256)
+
+    @classmethod
+    def ensure(cls, image: "ImageInput") -> "DecodedImage":
+        """Wrap raw bytes; pass an existing DecodedImage through unchanged."""
+        return image if isinstance(image, DecodedImage) else cls(image)
+
+    def memo(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Return the derived value for ``key``, computing it on first use."""
+        try:
+            return self._derived[key]
+        except KeyError:
+            pass
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key not in self._derived:
+                self._derived[key] = factory()
+            return self._derived[key]
+
+    @property
+    def sha256(self) -> str:
+        """Content hash of the raw upload bytes (cache / dedup key)."""
+        return self.memo("sha256", lambda: hashlib.sha256(self.data).hexdigest())
+
+    @property
+    def rgb(self) -> Image.Image:
+        """Full-resolution RGB PIL image (the single decode)."""
+        def decode() -> Image.Image:
+            with self._open() as img:
+                return img.convert("RGB")
+        return self.memo("rgb", decode)
+
+    @property
+    def bgr(self) -> np.ndarray:
+        """
+        Full-resolution uint8 BGR array, decoded by OpenCV exactly as the
+        segmenter always has (``IMREAD_COLOR``: 16-bit images scaled to 8-bit,
+        JPEG EXIF orientation applied). Formats OpenCV cannot read fall back
+        to the PIL decode.
+        """
+        def decode() -> np.ndarray:
+            img = cv2.imdecode(np.frombuffer(self.data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if img is None:
+                img = np.ascontiguousarray(np.asarray(self.rgb)[:, :, ::-1])
+            return img
+        return self.memo("bgr", decode)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        """(height, width) of the BGR frame, read from the header (no decode)."""
+        fmt, (width, height), orientation = self._header()
+        if fmt == "JPEG" and orientation in _TRANSPOSING_ORIENTATIONS:
+            # OpenCV rotates JPEGs by their EXIF orientation
+            return width, height
+        return height, width
+
+    def _header(self) -> Tuple[Optional[str], Tuple[int, int], int]:
+        """(format, (width, height), EXIF orientation); Image.open only parses the header."""
+        def read() -> Tuple[Optional[str], Tuple[int, int], int]:
+            with self._open() as img:
+                return img.format, img.size, img.getexif().get(_EXIF_ORIENTATION, 1)
+        return self.memo("header", read)
+
+    def _open(self) -> Image.Image:
+        source = BytesIO(self.data) if isinstance(self.data, bytes) else io.BufferedReader(_BufferReader(self.data))
+        return Image.open(source)
+
+    def reduction_for(self, size: Tuple[int, int]) -> int:
+        """JPEG decode scale (1, 2, 4 or 8) whose output still covers ``size`` (width, height)."""
+        if not REDUCED_DECODE_ENABLED:
+            return 1
+        fmt, (width, height), _ = self._header()
+        if fmt != "JPEG":
+            return 1
+        fits = min(width // max(1, size[0]), height // max(1, size[1]))
+        return next((scale for scale in REDUCED_SCALES if scale <= fits), 1)
+
+    def draft_rgb(self, size: Tuple[int, int]) -> Image.Image:
+        """RGB image decoded at the smallest JPEG scale that still covers ``size``."""
+        scale = self.reduction_for(size)
+        if scale == 1:
+            return self.rgb
+
+        def decode() -> Image.Image:
+            with self._open() as img:
+                # draft() picks the same scale as reduction_for and has libjpeg decode at it
+                img.draft("RGB", size)
+                return img.convert("RGB")
+        return self.memo(("draft_rgb", scale), decode)
+
+    def reduced_bgr(self, size: Tuple[int, int]) -> np.ndarray:
+        """BGR array decoded by OpenCV at the smallest JPEG scale that still covers ``size``."""
+        scale = self.reduction_for(size)
+        if scale == 1:
+            return self.bgr
+
+        def decode() -> np.ndarray:
+            # Oriented like the full-resolution decode
+            img = cv2.imdecode(np.frombuffer(self.data, dtype=np.uint8), getattr(cv2, _CV2_REDUCED_FLAGS[scale]))
+            return img if img is not None else self.bgr
+        return self.memo(("reduced_bgr", scale), decode)
+
+    def resized_rgb(self, size: Tuple[int, int]) -> Image.Image:
+        return self.memo(("rgb", size), lambda: self.draft_rgb(size).resize(size))
+
+    def resized_gray(self, size: Tuple[int, int]) -> Image.Image:
+        return self.memo(("gray", size), lambda: self.draft_rgb(size).convert("L").resize(size))
+
+    def resized_bgr(self, size: Tuple[int, int]) -> np.ndarray:
+        return self.memo(("bgr", size), lambda: cv2.resize(self.reduced_bgr(size), size))
+
+    def thumbnail(self, max_size: Tuple[int, int] = PREVIEW_SIZE) -> Image.Image:
+        """Preview thumbnail, derived from the 224x224 RGB view like before."""
+        def make() -> Image.Image:
+            thumb = self.resized_rgb((224, 224)).copy()
+            thumb.thumbnail(max_size)
+            return thumb
+        return self.memo(("thumbnail", max_size), make)
+
+    def preview_data_uri(self, max_size: Tuple[int, int] = PREVIEW_SIZE) -> str:
+        def make() -> str:
+            buffer = BytesIO()
+            self.thumbnail(max_size).save(buffer, format="JPEG", quality=80)
+            return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode("utf-8")
+        return self.memo(("preview", max_size), make)
+
+
+ImageInput = Union[bytes, DecodedImage]
@@ -0,0 +1,248 @@
+"""
+Content-addressed store for uploaded scans.
+
+Each image is saved once, under its SHA-256, in a two-level sharded tree
+(``ab/cd/abcd....jpg``) so no directory grows with the number of uploads,
+and an image uploaded again is not written a second time. Every case that
+uses an image holds a reference to it (an empty file named after the case in
+``<sha>.refs/``, so references survive restarts and are shared by all
+workers); the image and its derivatives are deleted with the last reference.
+Adding and dropping references (and writing or deleting the files) happens
+under a lock on the image's shard directory, taken with ``flock`` so it
+holds across worker processes.
+
+Derivatives (a worklist thumbnail, the segmentation overlay preview) are
+rendered once, when the image is first stored, from the already decoded
+upload, and served as static files. Since a file's name is its content
+hash it never changes, so ``ImmutableStaticFiles`` serves the tree with a
+one-year ``immutable`` cache lifetime.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import threading
+from contextlib import contextmanager
+from io import BytesIO
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: the lock only covers this process
+    fcntl = None
+
+from starlette.exceptions import HTTPException
+from starlette.staticfiles import StaticFiles
+
+ROOT = Path(__file__).resolve().parents[1]
+IMAGE_STORE_DIR = Path(os.getenv("IMAGE_STORE_DIR", str(ROOT / "static" / "images")))
+IMAGE_STORE_URL = "/static/images"
+# Uploads from before the store, and the sample scans committed with the repo
+LEGACY_UPLOAD_DIR = ROOT / "static" / "uploads"
+# Where tools (benchmarks, TFLite calibration) look for scans by default, in order
+SAMPLE_IMAGE_DIRS = (IMAGE_STORE_DIR, LEGACY_UPLOAD_DIR)
+# Longest side of the worklist thumbnails
+IMAGE_THUMB_MAX_SIDE = int(os.getenv("IMAGE_THUMB_MAX_SIDE", "256"))
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/gif": ".gif",
+    "image/bmp": ".bmp",
+    "image/tiff": ".tif",
+    "image/webp": ".webp",
+}
+
+
+_DERIVATIVE_NAME = re.compile(r"^[0-9a-f]{64}\.[^.]+\.jpg$")
+# What ImmutableStaticFiles serves: ab/cd/<sha>.<ext> images and ab/cd/<sha>.<name>.jpg derivatives
+_SERVED_PATH = re.compile(r"^([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}(\.[^./]+)?\.[a-z]+$")
+
+
+def is_derivative(path: Path | str) -> bool:
+    """True for a rendered derivative (``<sha>.<name>.jpg``) rather than an uploaded image."""
+    return bool(_DERIVATIVE_NAME.match(Path(path).name))
+
+
+def version_tag(version: str) -> str:
+    """Short file-name-safe tag for a model version, to key derivatives that depend on it."""
+    return hashlib.sha256(version.encode()).hexdigest()[:8]
+
+
+def render_thumbnail(image, max_side: int = IMAGE_THUMB_MAX_SIDE) -> bytes:
+    """JPEG thumbnail of an ml.image_pipeline.DecodedImage, from a reduced-scale decode."""
+    thumb = image.draft_rgb((max_side, max_side)).copy()
+    thumb.thumbnail((max_side, max_side))
+    buffer = BytesIO()
+    thumb.save(buffer, format="JPEG", quality=80)
+    return buffer.getvalue()
+
+
+class StoredImage:
+    """Where a stored image and its derivatives live on disk and on the web."""
+
+    def __init__(self, sha256: str, path: Path, url: str, derivatives: Dict[str, str], created: bool) -> None:
+        self.sha256 = sha256
+        self.path = path
+        self.url = url
+        self.derivatives = derivatives  # name -> URL
+        self.created = created          # False: the bytes were already stored
+
+
+class ImageStore:
+    def __init__(self, root: Path = IMAGE_STORE_DIR, url_prefix: str = IMAGE_STORE_URL) -> None:
+        self.root = Path(root)
+        self.url_prefix = url_prefix.rstrip("/")
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _shard(self, sha256: str) -> Path:
+        return Path(sha256[:2], sha256[2:4])
+
+    def _url(self, relative: Path) -> str:
+        return f"{self.url_prefix}/{relative.as_posix()}"
+
+    def put(
+        self,
+        upload,
+        owner: str,
+        derivatives: Optional[Dict[str, Callable[[], bytes]]] = None,
+    ) -> StoredImage:
+        """
+        Store an ml.uploads.IngestedUpload (if its bytes are new) and add a
+        reference from ``owner`` (e.g. ``case_42``). ``derivatives`` maps a
+        name to a renderer of its JPEG bytes; each is rendered only if that
+        derivative of this image does not exist yet.
+        """
+        sha256 = upload.sha256
+        shard = self._shard(sha256)
+        relative = shard / f"{sha256}{_EXTENSIONS.get(upload.mime, '.bin')}"
+        path = self.root / relative
+        (self.root / shard).mkdir(parents=True, exist_ok=True)
+
+        # Rendered outside the lock; only derivatives that look missing
+        rendered: Dict[str, Optional[bytes]] = {}
+        for name, render in (derivatives or {}).items():
+            if not self._derivative(path, name).exists():
+                rendered[name] = self._render(sha256, name, render)
+
+        with self._locked(path.parent):
+            refs = self._refs_dir(path)
+            refs.mkdir(exist_ok=True)
+            (refs / owner).touch()
+            created = not path.exists()
+            if created:
+                self._write(path, upload.save)
+            urls = {}
+            for name, render in (derivatives or {}).items():
+                derivative = self._derivative(path, name)
+                if not derivative.exists():
+                    # Deleted with the image's last reference since the check above
+                    data = rendered[name] if name in rendered else self._render(sha256, name, render)
+                    if data is None:
+                        continue
+                    self._write(derivative, lambda tmp: tmp.write_bytes(data))
+                urls[name] = self._url(derivative.relative_to(self.root))
+        return StoredImage(sha256, path, self._url(relative), urls, created)
+
+    def release(self, path: Path | str, owner: str) -> bool:
+        """Drop ``owner``'s reference; True if that was the last one and the files were deleted."""
+        path = Path(path)
+        refs = self._refs_dir(path)
+        with self._locked(path.parent):
+            (refs / owner).unlink(missing_ok=True)
+            try:
+                # Only succeeds once the directory is empty, i.e. for the last reference
+                refs.rmdir()
+            except OSError:
+                return False
+            sha256 = path.name.split(".", 1)[0]
+            for stale in path.parent.glob(f"{sha256}.*"):
+                if stale.is_file():
+                    stale.unlink(missing_ok=True)
+        return True
+
+    def owns(self, path: Path | str) -> bool:
+        """True for files in this store (older uploads live directly in static/uploads)."""
+        return Path(path).resolve().is_relative_to(self.root.resolve())
+
+    def stats(self) -> Dict[str, int]:
+        images = derivatives = size = 0
+        for path in self.root.glob("??/??/*"):
+            if path.is_file() and not path.name.startswith("."):
+                size += path.stat().st_size
+                if is_derivative(path):
+                    derivatives += 1
+                else:
+                    images += 1
+        return {"images": images, "derivatives": derivatives, "bytes": size}
+
+    @contextmanager
+    def _locked(self, shard: Path) -> Iterator[None]:
+        """Exclusive lock on a shard directory, across threads and worker processes."""
+        if fcntl is None:
+            with self._lock:
+                yield
+            return
+        # flock locks belong to the open file, so threads of one process exclude each other too
+        with open(shard / ".lock", "ab") as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    @staticmethod
+    def _render(sha256: str, name: str, render: Callable[[], bytes]) -> Optional[bytes]:
+        try:
+            return render()
+        except Exception as e:
+            print(f"Could not render {name} for image {sha256[:12]}: {e}")
+            return None
+
+    @staticmethod
+    def _derivative(path: Path, name: str) -> Path:
+        return path.with_name(f"{path.name.split('.', 1)[0]}.{name}.jpg")
+
+    @staticmethod
+    def _refs_dir(path: Path) -> Path:
+        return path.with_name(path.name.split(".", 1)[0] + ".refs")
+
+    @staticmethod
+    def _write(path: Path, writer: Callable[[Path], None]) -> None:
+        # Write then rename, so a reader never sees a partial file
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        writer(tmp)
+        os.replace(tmp, path)
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """
+    StaticFiles for content-addressed files: cached by browsers and proxies
+    for a year. Only images and their derivatives are served; the store's
+    bookkeeping (reference markers, which reveal the cases sharing an image,
+    lock and temp files) answers 404.
+    """
+
+    async def get_response(self, path: str, scope):
+        if not _SERVED_PATH.match(path.replace(os.sep, "/")):
+            raise HTTPException(status_code=404)
+        return await super().get_response(path, scope)
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = IMAGE_CACHE_CONTROL
+        return response
+
+
+# Global instance
+image_store = None
+
+def get_image_store() -> ImageStore:
+    global image_store
+    if image_store is None:
+        image_store = ImageStore()
+    return image_store
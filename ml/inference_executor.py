@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import asyncio
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+DEFAULT_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+DEFAULT_TIMEOUT_SECONDS = float(os.getenv("INFERENCE_TIMEOUT_SECONDS", "60"))
+
+
+class InferenceTimeoutError(Exception):
+    """Raised when a model call does not finish within the per-call timeout."""
+
+
+class InferenceExecutor:
+    """
+    Runs blocking model work (TensorFlow predict, OpenCV, PDF/Gemini analysis)
+    on a bounded thread pool so async route handlers never block the event loop.
+
+    TensorFlow releases the GIL inside its kernels, so a small thread pool is
+    enough to keep login, dashboards and the hospital finder responsive while
+    a mammogram is being scored.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, timeout: Optional[float] = None) -> None:
+        self.max_workers = max(1, max_workers or DEFAULT_WORKERS)
+        self.timeout = DEFAULT_TIMEOUT_SECONDS if timeout is None else timeout
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+
+    async def run(self, fn: Callable[..., Any], *args: Any, timeout: Optional[float] = None, **kwargs: Any) -> Any:
+        """Run ``fn(*args, **kwargs)`` on the pool and await its result."""
+        future = self._pool.submit(fn, *args, **kwargs)
+        return await self.wait(future, timeout=timeout)
+
+    async def wait(self, future: Future, timeout: Optional[float] = None) -> Any:
+        """
+        Await a concurrent Future produced by another off-loop worker (e.g. the
+        classifier's micro-batching thread) under the same timeout policy.
+        """
+        limit = self.timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=limit or None)
+        except asyncio.TimeoutError:
+            # The worker thread cannot be interrupted; it finishes in the background
+            # and its result is discarded.
+            raise InferenceTimeoutError(f"Inference did not complete within {limit:.0f}s")
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._pool.shutdown(wait=wait)
+
+
+# Global instance
+inference_executor = None
+
+def get_inference_executor() -> InferenceExecutor:
+    global inference_executor
+    if inference_executor is None:
+        inference_executor = InferenceExecutor()
+    return inference_executor
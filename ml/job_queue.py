@@ -0,0 +1,488 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, BinaryIO, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# Concurrent jobs per server process
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# A running job whose lease is not renewed for this long is assumed dead and re-run
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+# How often idle workers look for jobs submitted by other processes
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+# Jobs running longer than this are failed (0 = no limit)
+JOB_TIMEOUT_SECONDS = float(os.getenv("JOB_TIMEOUT_SECONDS", "1800"))
+# A job interrupted this many times is marked failed instead of being retried
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Uploaded inputs live here until their job finishes; SQLite store when Mongo is not configured
+JOB_DATA_DIR = Path(os.getenv("JOB_DATA_DIR", str(ROOT / ".jobs" / "data")))
+JOB_DB_PATH = Path(os.getenv("JOB_DB_PATH", str(ROOT / ".jobs" / "jobs.sqlite3")))
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+# Per-item results read back per store round trip
+JOB_ITEMS_PAGE_SIZE = 100
+
+ProgressCallback = Callable[[Optional[float], str], Awaitable[None]]
+JobHandler = Callable[[Dict[str, Any], ProgressCallback], Awaitable[Dict[str, Any]]]
+
+
+class _HandlerTimeout(Exception):
+    """A TimeoutError raised inside a job handler, kept apart from the job's own deadline."""
+
+
+async def _call_handler(handler: JobHandler, job: Dict[str, Any], progress: ProgressCallback) -> Dict[str, Any]:
+    try:
+        return await handler(job, progress)
+    except (asyncio.TimeoutError, TimeoutError) as e:
+        raise _HandlerTimeout() from e
+
+
+def _claimable(now: float) -> Dict[str, Any]:
+    """Mongo filter: queued jobs, and running jobs whose worker stopped renewing the lease."""
+    return {"$or": [{"status": "queued"}, {"status": "running", "lease_until": {"$lt": now}}]}
+
+
+class MongoJobStore:
+    """
+    Job documents in a Mongo collection (``_id`` is the job id). Per-item
+    results of a job go to a second collection, one document per item, so a
+    job document stays small however many items the job has.
+    """
+
+    def __init__(self, collection, results=None) -> None:
+        self.collection = collection
+        self.results = results
+
+    async def setup(self) -> None:
+        # The (status, created_at) index is declared in ml.db_indexes
+        pass
+
+    async def insert(self, job: Dict[str, Any]) -> None:
+        doc = dict(job)
+        doc["_id"] = doc.pop("id")
+        await self.collection.insert_one(doc)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self._from_doc(await self.collection.find_one({"_id": job_id}))
+
+    async def update(self, job_id: str, fields: Dict[str, Any]) -> None:
+        await self.collection.update_one({"_id": job_id}, {"$set": fields})
+
+    async def requeue(self, job_id: str, fields: Dict[str, Any]) -> None:
+        """Update a claimed job and take back the attempt its claim counted."""
+        await self.collection.update_one({"_id": job_id}, {"$set": fields, "$inc": {"attempts": -1}})
+
+    async def save_items(self, job_id: str, first_index: int, items: List[Dict[str, Any]]) -> None:
+        from pymongo import ReplaceOne
+
+        if not items:
+            return
+        # Keyed by (job_id, index), so a re-run after a lapsed lease overwrites instead of duplicating
+        await self.results.bulk_write([
+            ReplaceOne({"job_id": job_id, "index": first_index + i}, {"job_id": job_id, "index": first_index + i, "item": item}, upsert=True)
+            for i, item in enumerate(items)
+        ], ordered=False)
+
+    async def load_items(self, job_id: str, offset: int, limit: int) -> List[Dict[str, Any]]:
+        cursor = self.results.find({"job_id": job_id, "index": {"$gte": offset}}).sort("index", 1).limit(limit)
+        return [doc["item"] async for doc in cursor]
+
+    async def claim_next(self, worker: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        from pymongo import ReturnDocument
+
+        now = time.time()
+        doc = await self.collection.find_one_and_update(
+            _claimable(now),
+            {
+                "$set": {"status": "running", "worker": worker, "lease_until": now + lease_seconds,
+                         "started_at": now, "updated_at": now},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        return self._from_doc(doc)
+
+    @staticmethod
+    def _from_doc(doc: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if doc is None:
+            return None
+        doc = dict(doc)
+        doc["id"] = doc.pop("_id")
+        return doc
+
+
+class SQLiteJobStore:
+    """
+    Local fallback store. Several server processes on one host can share the
+    file: claims run in an immediate transaction, so each job is claimed once.
+    """
+
+    JSON_FIELDS = ("payload", "result")
+    COLUMNS = ("id", "kind", "status", "progress", "message", "payload", "result", "error",
+               "attempts", "worker", "lease_until", "created_at", "updated_at", "started_at", "finished_at")
+
+    def __init__(self, path: Path | str = JOB_DB_PATH) -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn_pid: Optional[int] = None
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per process (a connection must not cross a fork); callers hold _lock
+        if self._conn_pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT, status TEXT, progress REAL, message TEXT, payload TEXT, "
+                "result TEXT, error TEXT, attempts INTEGER, worker TEXT, lease_until REAL, created_at REAL, "
+                "updated_at REAL, started_at REAL, finished_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_items ("
+                "job_id TEXT, idx INTEGER, item TEXT, PRIMARY KEY (job_id, idx))"
+            )
+            self._connection, self._conn_pid = conn, os.getpid()
+        return self._connection
+
+    async def setup(self) -> None:
+        await asyncio.to_thread(self._execute, "SELECT 1")
+
+    async def insert(self, job: Dict[str, Any]) -> None:
+        row = self._to_row(job)
+        columns = ", ".join(row)
+        placeholders = ", ".join("?" for _ in row)
+        await asyncio.to_thread(self._execute, f"INSERT INTO jobs ({columns}) VALUES ({placeholders})", tuple(row.values()))
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        rows = await asyncio.to_thread(self._execute, "SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return self._from_row(rows[0]) if rows else None
+
+    async def update(self, job_id: str, fields: Dict[str, Any]) -> None:
+        row = self._to_row(fields)
+        assignments = ", ".join(f"{column} = ?" for column in row)
+        await asyncio.to_thread(self._execute, f"UPDATE jobs SET {assignments} WHERE id = ?", tuple(row.values()) + (job_id,))
+
+    async def requeue(self, job_id: str, fields: Dict[str, Any]) -> None:
+        """Update a claimed job and take back the attempt its claim counted."""
+        row = self._to_row(fields)
+        assignments = "".join(f"{column} = ?, " for column in row)
+        await asyncio.to_thread(
+            self._execute, f"UPDATE jobs SET {assignments}attempts = attempts - 1 WHERE id = ?", tuple(row.values()) + (job_id,)
+        )
+
+    async def save_items(self, job_id: str, first_index: int, items: List[Dict[str, Any]]) -> None:
+        rows = [(job_id, first_index + i, json.dumps(item)) for i, item in enumerate(items)]
+        await asyncio.to_thread(self._execute_many, "INSERT OR REPLACE INTO job_items (job_id, idx, item) VALUES (?, ?, ?)", rows)
+
+    async def load_items(self, job_id: str, offset: int, limit: int) -> List[Dict[str, Any]]:
+        rows = await asyncio.to_thread(
+            self._execute, "SELECT item FROM job_items WHERE job_id = ? AND idx >= ? ORDER BY idx LIMIT ?", (job_id, offset, limit)
+        )
+        return [json.loads(row["item"]) for row in rows]
+
+    async def claim_next(self, worker: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._claim_next, worker, lease_seconds)
+
+    def _claim_next(self, worker: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, lease_until = ?, started_at = ?, "
+                    "updated_at = ?, attempts = attempts + 1 WHERE id = ?",
+                    (worker, now + lease_seconds, now, now, row["id"]),
+                )
+                claimed = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self._from_row(claimed)
+
+    def _execute(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _execute_many(self, sql: str, rows: List[tuple]) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(sql, rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _to_row(self, fields: Dict[str, Any]) -> Dict[str, Any]:
+        row = {}
+        for key, value in fields.items():
+            if key not in self.COLUMNS:
+                raise KeyError(f"Unknown job field '{key}'")
+            row[key] = json.dumps(value) if key in self.JSON_FIELDS and value is not None else value
+        return row
+
+    def _from_row(self, row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        for key in self.JSON_FIELDS:
+            if job.get(key) is not None:
+                job[key] = json.loads(job[key])
+        return job
+
+
+class JobQueue:
+    """
+    Persistent queue for analyses too slow to run inside an HTTP request.
+
+    ``submit`` records the job and returns its id immediately; a pool of worker
+    tasks claims jobs from the store, runs the handler registered for the
+    job's kind and stores its result. Running jobs hold a lease that a
+    heartbeat renews, so a job whose process died is picked up again by any
+    worker once the lease lapses (up to JOB_MAX_ATTEMPTS times). Uploaded
+    inputs are written under JOB_DATA_DIR so a re-run can read them.
+
+    A job's result document holds a summary; jobs with many per-item results
+    (bulk analysis) store those with ``save_items`` and clients page through
+    them with ``items``.
+    """
+
+    def __init__(self, store, workers: int = JOB_WORKERS, data_dir: Path | str = JOB_DATA_DIR) -> None:
+        self.store = store
+        self.workers = max(1, workers)
+        self.data_dir = Path(data_dir)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.handlers: Dict[str, JobHandler] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._watchers: Dict[str, Set[asyncio.Event]] = {}
+
+    def handler(self, kind: str) -> Callable[[JobHandler], JobHandler]:
+        """Decorator registering the coroutine that runs jobs of ``kind``."""
+        def register(fn: JobHandler) -> JobHandler:
+            self.handlers[kind] = fn
+            return fn
+        return register
+
+    def input_dir(self, job_id: str) -> Path:
+        return self.data_dir / job_id
+
+    def new_job_id(self) -> str:
+        return uuid.uuid4().hex
+
+    def save_inputs(self, job_id: str, uploads: Iterable[Tuple[str, BinaryIO]]) -> List[Dict[str, str]]:
+        """Copy uploaded files into the job's input directory; returns their payload entries."""
+        directory = self.input_dir(job_id)
+        directory.mkdir(parents=True, exist_ok=True)
+        inputs = []
+        for i, (filename, fileobj) in enumerate(uploads):
+            # Stored under a generated name; the original is kept for reporting only
+            path = f"{i:04d}{Path(filename or '').suffix.lower()}"
+            fileobj.seek(0)
+            with open(directory / path, "wb") as f:
+                shutil.copyfileobj(fileobj, f, 1024 * 1024)
+            inputs.append({"path": path, "filename": filename or path})
+        return inputs
+
+    def input_path(self, job: Dict[str, Any], entry: Dict[str, str]) -> Path:
+        return self.input_dir(job["id"]) / entry["path"]
+
+    async def submit(self, kind: str, payload: Dict[str, Any], job_id: Optional[str] = None) -> str:
+        """Queue a job; inputs must already be saved under ``input_dir(job_id)``."""
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        now = time.time()
+        job_id = job_id or self.new_job_id()
+        await self.store.insert({
+            "id": job_id, "kind": kind, "status": "queued", "progress": 0.0, "message": "Queued",
+            "payload": payload, "result": None, "error": None, "attempts": 0, "worker": None,
+            "lease_until": None, "created_at": now, "updated_at": now, "started_at": None, "finished_at": None,
+        })
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.store.get(job_id)
+
+    async def save_items(self, job_id: str, first_index: int, items: List[Dict[str, Any]]) -> None:
+        """Store per-item results ``first_index``, ``first_index + 1``... of a job (replacing earlier ones)."""
+        await self.store.save_items(job_id, first_index, items)
+
+    async def items(self, job_id: str, offset: int = 0, limit: int = JOB_ITEMS_PAGE_SIZE) -> List[Dict[str, Any]]:
+        return await self.store.load_items(job_id, offset, limit)
+
+    async def wait_for_change(self, job_id: str, timeout: float) -> None:
+        """Sleep until this process updates the job, or ``timeout`` elapses."""
+        event = asyncio.Event()
+        self._watchers.setdefault(job_id, set()).add(event)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            watchers = self._watchers.get(job_id)
+            if watchers is not None:
+                watchers.discard(event)
+                if not watchers:
+                    self._watchers.pop(job_id, None)
+
+    @staticmethod
+    def describe(job: Dict[str, Any]) -> Dict[str, Any]:
+        """Public view of a job (no payload or result)."""
+        def iso(ts: Optional[float]) -> Optional[str]:
+            return datetime.fromtimestamp(ts).isoformat() if ts else None
+
+        return {
+            "job_id": job["id"],
+            "kind": job["kind"],
+            "status": job["status"],
+            "progress": job.get("progress"),
+            "message": job.get("message"),
+            "error": job.get("error"),
+            "attempts": job.get("attempts", 0),
+            "created_at": iso(job.get("created_at")),
+            "started_at": iso(job.get("started_at")),
+            "finished_at": iso(job.get("finished_at")),
+        }
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        try:
+            await self.store.setup()
+        except Exception as e:
+            print(f"Job store setup error: {e}")
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        print(f"Job queue started with {self.workers} workers ({type(self.store).__name__})")
+
+    async def stop(self) -> None:
+        """Cancel the workers; interrupted jobs go back to the queue."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                job = await self.store.claim_next(self.worker_id, JOB_LEASE_SECONDS)
+            except Exception as e:
+                print(f"Job store error: {e}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        job_id = job["id"]
+        if job.get("attempts", 0) > JOB_MAX_ATTEMPTS:
+            await self._finish(job_id, {"status": "failed", "error": f"Job interrupted {JOB_MAX_ATTEMPTS} times; giving up"})
+            return
+        handler = self.handlers.get(job["kind"])
+        if handler is None:
+            await self._finish(job_id, {"status": "failed", "error": f"No handler for job kind '{job['kind']}'"})
+            return
+
+        async def progress(fraction: Optional[float], message: str) -> None:
+            fields = {"message": message, "updated_at": time.time(), "lease_until": time.time() + JOB_LEASE_SECONDS}
+            if fraction is not None:
+                fields["progress"] = max(0.0, min(1.0, fraction))
+            await self._update(job_id, fields)
+
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            await progress(0.0, "Running")
+            if JOB_TIMEOUT_SECONDS > 0:
+                # The handler's own timeouts arrive wrapped, so only the deadline is a TimeoutError here
+                result = await asyncio.wait_for(_call_handler(handler, job, progress), JOB_TIMEOUT_SECONDS)
+            else:
+                result = await _call_handler(handler, job, progress)
+        except asyncio.CancelledError:
+            # Server shutting down: hand the job back instead of waiting for the lease. Only
+            # lapsed leases (crashes) count against JOB_MAX_ATTEMPTS, not graceful restarts
+            await asyncio.shield(self._requeue(job_id, {"status": "queued", "worker": None, "lease_until": None,
+                                                        "message": "Re-queued after shutdown"}))
+            raise
+        except asyncio.TimeoutError:
+            await self._finish(job_id, {"status": "failed", "error": f"Job exceeded {JOB_TIMEOUT_SECONDS:g}s"})
+        except Exception as e:
+            if isinstance(e, _HandlerTimeout):
+                e = e.__cause__
+            print(f"Job {job_id} ({job['kind']}) failed: {e}")
+            await self._finish(job_id, {"status": "failed", "error": str(e) or type(e).__name__})
+        else:
+            await self._finish(job_id, {"status": "succeeded", "result": result, "progress": 1.0, "message": "Done"})
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+            try:
+                await self.store.update(job_id, {"lease_until": time.time() + JOB_LEASE_SECONDS})
+            except Exception as e:
+                print(f"Job {job_id} heartbeat error: {e}")
+
+    async def _finish(self, job_id: str, fields: Dict[str, Any]) -> None:
+        now = time.time()
+        fields.update({"finished_at": now, "updated_at": now, "lease_until": None})
+        await self._update(job_id, fields)
+        # Inputs are only needed to re-run the job
+        shutil.rmtree(self.input_dir(job_id), ignore_errors=True)
+
+    async def _update(self, job_id: str, fields: Dict[str, Any]) -> None:
+        fields.setdefault("updated_at", time.time())
+        await self.store.update(job_id, fields)
+        self._notify(job_id)
+
+    async def _requeue(self, job_id: str, fields: Dict[str, Any]) -> None:
+        fields.setdefault("updated_at", time.time())
+        await self.store.requeue(job_id, fields)
+        self._notify(job_id)
+
+    def _notify(self, job_id: str) -> None:
+        for event in self._watchers.get(job_id, ()):
+            event.set()
+
+
+# Global instance
+job_queue = None
+
+def get_job_queue(db=None) -> JobQueue:
+    """The process-wide queue, backed by Mongo when ``db`` is given, else SQLite."""
+    global job_queue
+    if job_queue is None:
+        store = MongoJobStore(db["onco_jobs"], db["onco_job_items"]) if db is not None else SQLiteJobStore(JOB_DB_PATH)
+        job_queue = JobQueue(store)
+    return job_queue
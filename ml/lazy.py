@@ -0,0 +1,73 @@
+"""
+Deferred imports for the heavy ML stack.
+
+TensorFlow, OpenCV and friends take seconds to import, and most routes (the
+patient portal, dashboards, ambulance booking) never touch them. ML modules
+bind these libraries through ``lazy_module`` instead of a top-level import,
+so importing ``app_main`` stays cheap and the real import happens on first
+attribute access, i.e. when a model is first loaded or an image first decoded.
+
+With PORTAL_ONLY=1 the deployment serves the portal only: the model registry
+refuses to load anything and the ML-only libraries raise MLDisabledError
+instead of importing, so TensorFlow never enters the process.
+"""
+from __future__ import annotations
+
+import importlib
+import os
+import threading
+from types import ModuleType
+from typing import Any, Optional
+
+PORTAL_ONLY = os.getenv("PORTAL_ONLY", "0").lower() in ("1", "true", "yes")
+
+
+class MLDisabledError(RuntimeError):
+    """A model or ML library was requested in a portal-only deployment."""
+
+
+def ensure_ml_enabled(what: str) -> None:
+    if PORTAL_ONLY:
+        raise MLDisabledError(f"{what} is not available in portal-only mode (PORTAL_ONLY=1)")
+
+
+class LazyModule:
+    """Stands in for a module and imports it on first attribute access."""
+
+    def __init__(self, name: str, requires_ml: bool = False) -> None:
+        self._lazy_name = name
+        self._lazy_requires_ml = requires_ml
+        self._lazy_module: Optional[ModuleType] = None
+        self._lazy_lock = threading.Lock()
+
+    def _lazy_load(self) -> ModuleType:
+        module = self._lazy_module
+        if module is None:
+            with self._lazy_lock:
+                if self._lazy_module is None:
+                    if self._lazy_requires_ml:
+                        ensure_ml_enabled(self._lazy_name)
+                    self._lazy_module = importlib.import_module(self._lazy_name)
+                module = self._lazy_module
+        return module
+
+    @property
+    def loaded(self) -> bool:
+        return self._lazy_module is not None
+
+    def __getattr__(self, attr: str) -> Any:
+        if attr.startswith("_lazy_"):
+            raise AttributeError(attr)
+        return getattr(self._lazy_load(), attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.loaded else "not loaded"
+        return f"<lazy module '{self._lazy_name}' ({state})>"
+
+
+def lazy_module(name: str, requires_ml: bool = False) -> LazyModule:
+    """
+    ``tf = lazy_module("tensorflow", requires_ml=True)`` behaves like
+    ``import tensorflow as tf`` but defers the import to first use.
+    """
+    return LazyModule(name, requires_ml)
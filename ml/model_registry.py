@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import gc
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from ml.lazy import ensure_ml_enabled
+
+# Unload models unused for this many seconds (0 keeps them loaded forever)
+MODEL_IDLE_UNLOAD_SECONDS = float(os.getenv("MODEL_IDLE_UNLOAD_SECONDS", "0"))
+
+# Hot reloads may only load artifacts from here (loading a Keras file can run code)
+MODEL_DIR = Path(__file__).resolve().parent
+MODEL_SUFFIXES = (".h5", ".keras")
+
+
+def resolve_model_path(path: Path | str) -> Path:
+    """
+    ``path`` (absolute, or relative to the repo root like "ml/new_model.h5")
+    resolved to a model artifact inside MODEL_DIR; ValueError for anything
+    else, including ``..`` or symlinks that lead outside it.
+    """
+    path = Path(path)
+    if not path.is_absolute():
+        path = MODEL_DIR.parent / path
+    resolved = path.resolve()
+    if not resolved.is_relative_to(MODEL_DIR) or resolved.suffix not in MODEL_SUFFIXES:
+        raise ValueError(f"Model path must be a {'/'.join(MODEL_SUFFIXES)} file inside {MODEL_DIR.name}/")
+    return resolved
+
+
+def file_checksum(path: Optional[Path]) -> Optional[str]:
+    """SHA-256 of a model artifact, or None when there is no file."""
+    if path is None or not Path(path).is_file():
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelEntry:
+    def __init__(self, name: str, loader: Callable[[Optional[Path]], Any], path: Optional[Path | str]) -> None:
+        self.name = name
+        self.loader = loader
+        self.path = Path(path) if path is not None else None
+        self.instance: Any = None
+        self.metadata: Dict[str, Any] = {}
+        self.last_used = 0.0
+        self.reloads = 0
+        # Serializes loads/reloads of this model; readers never take it once loaded
+        self.load_lock = threading.Lock()
+
+
+class ModelRegistry:
+    """
+    Loads each model on first use and keeps version/checksum metadata for it.
+
+    ``reload`` builds the replacement instance completely before swapping it
+    in, so the switch is atomic: requests that already hold the old instance
+    finish on it, and every later ``get`` sees the new one. ``unload_idle``
+    drops models nobody has asked for in a while; an in-flight request keeps
+    its own reference, so unloading never interrupts it.
+    """
+
+    def __init__(self) -> None:
+        self._entries: Dict[str, ModelEntry] = {}
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+
+    def register(self, name: str, loader: Callable[[Optional[Path]], Any], path: Optional[Path | str] = None) -> None:
+        """Declare a model; ``loader(path)`` is only called on first use."""
+        with self._lock:
+            if name not in self._entries:
+                self._entries[name] = ModelEntry(name, loader, path)
+
+    def get(self, name: str) -> Any:
+        entry = self._entry(name)
+        entry.last_used = time.time()
+        instance = entry.instance
+        if instance is not None:
+            return instance
+        with entry.load_lock:
+            if entry.instance is None:
+                entry.instance, entry.metadata = self._load(entry, entry.path)
+            return entry.instance
+
+    def peek(self, name: str) -> Any:
+        """The loaded instance, or None; never triggers a load."""
+        return self._entry(name).instance
+
+    def reload(self, name: str, path: Optional[Path | str] = None) -> Dict[str, Any]:
+        """
+        Load ``path`` (default: the current path) and atomically swap it in.
+        The new instance is warmed up first, so the swap causes no latency spike.
+        """
+        entry = self._entry(name)
+        with entry.load_lock:
+            new_path = Path(path) if path is not None else entry.path
+            if new_path is not None and not new_path.exists():
+                raise FileNotFoundError(f"Model file not found: {new_path}")
+            instance, metadata = self._load(entry, new_path)
+            warmup = getattr(instance, "warmup", None)
+            if callable(warmup):
+                start = time.perf_counter()
+                warmup()
+                metadata["warmup_seconds"] = round(time.perf_counter() - start, 3)
+            entry.instance, entry.metadata, entry.path = instance, metadata, new_path
+            entry.reloads += 1
+            entry.last_used = time.time()
+        return self.describe(name)
+
+    def unload(self, name: str) -> bool:
+        entry = self._entry(name)
+        with entry.load_lock:
+            if entry.instance is None:
+                return False
+            entry.instance = None
+        gc.collect()
+        print(f"Unloaded {name} model")
+        return True
+
+    def unload_idle(self, max_idle_seconds: float) -> list:
+        now = time.time()
+        unloaded = []
+        for name, entry in list(self._entries.items()):
+            if entry.instance is not None and now - entry.last_used > max_idle_seconds:
+                if self.unload(name):
+                    unloaded.append(name)
+        return unloaded
+
+    def start_idle_reaper(self, max_idle_seconds: float = MODEL_IDLE_UNLOAD_SECONDS) -> None:
+        """Background thread that unloads idle models; no-op when disabled."""
+        if max_idle_seconds <= 0 or self._reaper is not None:
+            return
+
+        def run() -> None:
+            while True:
+                time.sleep(min(max_idle_seconds, 60.0))
+                try:
+                    self.unload_idle(max_idle_seconds)
+                except Exception as e:
+                    print(f"Idle model reaper error: {e}")
+
+        self._reaper = threading.Thread(target=run, name="model-reaper", daemon=True)
+        self._reaper.start()
+
+    def describe(self, name: str) -> Dict[str, Any]:
+        entry = self._entry(name)
+        info = {
+            "loaded": entry.instance is not None,
+            "path": str(entry.path) if entry.path else None,
+            "reloads": entry.reloads,
+            "last_used": datetime.fromtimestamp(entry.last_used).isoformat() if entry.last_used else None,
+        }
+        info.update(entry.metadata)
+        return info
+
+    def info(self) -> Dict[str, Dict[str, Any]]:
+        return {name: self.describe(name) for name in list(self._entries)}
+
+    def _entry(self, name: str) -> ModelEntry:
+        try:
+            return self._entries[name]
+        except KeyError:
+            raise KeyError(f"Unknown model '{name}'") from None
+
+    def _load(self, entry: ModelEntry, path: Optional[Path]):
+        # Portal-only deployments never load a model (nor import TensorFlow)
+        ensure_ml_enabled(f"The {entry.name} model")
+        start = time.perf_counter()
+        instance = entry.loader(path)
+        metadata = {
+            "version": getattr(instance, "version", None),
+            "sha256": file_checksum(path),
+            "size_bytes": path.stat().st_size if path is not None and path.is_file() else None,
+            "loaded_at": datetime.now().isoformat(),
+            "load_seconds": round(time.perf_counter() - start, 3),
+        }
+        print(f"Loaded {entry.name} model in {metadata['load_seconds']}s")
+        return instance, metadata
+
+
+# Global instance
+model_registry = None
+
+def get_model_registry() -> ModelRegistry:
+    global model_registry
+    if model_registry is None:
+        model_registry = ModelRegistry()
+    return model_registry
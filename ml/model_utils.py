@@ -1,25 +1,77 @@
 from __future__ import annotations
 
-from io import BytesIO
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
 from pathlib import Path
-from typing import Tuple
+from typing import Callable, List, Optional, Tuple
 
 import numpy as np
 from PIL import Image
-import tensorflow as tf
+
+from ml.compiled_inference import compile_predictor
+from ml.image_pipeline import DecodedImage, ImageInput
+from ml.lazy import lazy_module
+from ml.model_registry import get_model_registry
+from ml.tflite_backend import load_tflite_predictor
+
+# Imported when the first model loads, not when the app starts (see ml.lazy)
+tf = lazy_module("tensorflow", requires_ml=True)
 
 ROOT = Path(__file__).resolve().parents[1]
 DEFAULT_MODEL_PATH = ROOT / "ml" / "breast_cancer_cnn.h5"
 IMG_SIZE = (224, 224)
+# ImageNet statistics used by DenseNet's preprocess_input
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+# Rotations (degrees) used by test-time augmentation, each with and without a
+# horizontal flip; the unrotated image is always included
+TTA_ANGLES = tuple(
+    float(a) for a in os.getenv("CLASSIFIER_TTA_ANGLES", "-10,10").split(",") if a.strip() and float(a)
+)
+TTA_VIEW_COUNT = 2 * (1 + len(TTA_ANGLES))
+
+
+def model_version(path: Path | str) -> str:
+    """Cheap fingerprint of a model artifact (name, size, mtime) for cache keys."""
+    path = Path(path)
+    try:
+        stat = path.stat()
+    except OSError:
+        return f"{path.name}:missing"
+    return f"{path.name}:{stat.st_size}:{int(stat.st_mtime)}"
+
+
+def tta_views(img: Image.Image) -> List[Image.Image]:
+    """The image, its mirror, and both rotated by each of TTA_ANGLES (same size)."""
+    views = []
+    for base in (img, img.transpose(Image.FLIP_LEFT_RIGHT)):
+        views.append(base)
+        # Corners uncovered by the rotation are filled with black, like the mammogram background
+        views.extend(base.rotate(angle, resample=Image.BILINEAR) for angle in TTA_ANGLES)
+    return views
 
 
 class BreastCancerModel:
     def __init__(self, model_path: Path | None = None) -> None:
         self.model_path = model_path or DEFAULT_MODEL_PATH
         self.is_new_model = False
+        self.predictor = None
+        self.version = model_version(self.model_path)
         
         # Check for class mapping file to determine if we are using the new model
         self.class_map_path = ROOT / "ml" / "breast_cancer_classes.json"
+
+        # Exported TFLite artifact (INFERENCE_BACKEND=tflite|tflite-int8) replaces the Keras model
+        tflite_model = load_tflite_predictor(self.model_path, "classifier")
+        if tflite_model is not None:
+            self.model = self.predictor = tflite_model
+            self.version = model_version(tflite_model.path)
+            self.is_new_model = self.class_map_path.exists()
+            return
         
         if not self.model_path.exists():
              # If default model likely missing, don't crash, just warn or late init?
@@ -39,52 +91,108 @@ class BreastCancerModel:
             print(f"Error loading model: {e}")
             self.model = None
 
-    def preprocess_bytes(self, data: bytes) -> np.ndarray:
+        # Traced tf.function with a fixed signature, warmed up here so the first
+        # patient does not pay the tracing cost
+        self.predictor = compile_predictor(self.model, "classifier")
+
+    def preprocess_bytes(self, data: ImageInput) -> np.ndarray:
+        image = DecodedImage.ensure(data)
         if self.is_new_model:
-            # DenseNet Preprocessing: RGB, 224x224, default densenet preprocessing
-            img = Image.open(BytesIO(data)).convert("RGB")
-            img = img.resize(IMG_SIZE)
-            arr = np.array(img, dtype=np.float32)
-            # Use tf.keras.applications.densenet.preprocess_input logic (scale to 0-1 or -1 to 1)
-            # To avoid strict dependency on the specific function if not available, we can use standard:
-            # DenseNet standard is often 1/255. But let's use the TF util if possible, or standard.
-            # safe fallback:
-            arr = tf.keras.applications.densenet.preprocess_input(arr)
-            arr = np.expand_dims(arr, axis=0) # (1, 224, 224, 3)
-            return arr
-        else:
-            # Legacy Preprocessing
-            img = Image.open(BytesIO(data)).convert("L")
-            img = img.resize(IMG_SIZE)
-            arr = np.asarray(img, dtype=np.float32) / 255.0
-            arr = np.expand_dims(arr, axis=-1)  # (H, W, 1)
-            arr = np.expand_dims(arr, axis=0)   # (1, H, W, 1)
-            return arr
-
-    def predict_proba(self, data: bytes) -> float:
+            return image.memo("densenet_input", lambda: self._densenet_array(image.resized_rgb(IMG_SIZE)))
+        return image.memo("legacy_input", lambda: self._legacy_array(image.resized_gray(IMG_SIZE)))
+
+    def preprocess_tta(self, data: ImageInput) -> np.ndarray:
+        """All test-time augmentation views of one image as a single (N, H, W, C) batch."""
+        image = DecodedImage.ensure(data)
+
+        def build() -> np.ndarray:
+            if self.is_new_model:
+                views = tta_views(image.resized_rgb(IMG_SIZE))
+                return np.concatenate([self._densenet_array(v) for v in views], axis=0)
+            views = tta_views(image.resized_gray(IMG_SIZE))
+            return np.concatenate([self._legacy_array(v) for v in views], axis=0)
+
+        return image.memo(("tta_input", self.is_new_model, TTA_ANGLES), build)
+
+    @staticmethod
+    def _densenet_array(img: Image.Image) -> np.ndarray:
+        # DenseNet Preprocessing: RGB, 224x224, the same as
+        # tf.keras.applications.densenet.preprocess_input ("torch" mode: scale to
+        # 0-1, then normalise with the ImageNet mean/std) but in numpy, so the
+        # TFLite backend never needs TensorFlow
+        arr = np.asarray(img, dtype=np.float32) / 255.0
+        arr = (arr - IMAGENET_MEAN) / IMAGENET_STD
+        arr = np.expand_dims(arr, axis=0) # (1, 224, 224, 3)
+        return arr
+
+    @staticmethod
+    def _legacy_array(img: Image.Image) -> np.ndarray:
+        # Legacy Preprocessing
+        arr = np.asarray(img, dtype=np.float32) / 255.0
+        arr = np.expand_dims(arr, axis=-1)  # (H, W, 1)
+        arr = np.expand_dims(arr, axis=0)   # (1, H, W, 1)
+        return arr
+
+    def predict_proba(self, data: ImageInput) -> float:
         if self.model is None:
             return 0.0
             
         x = self.preprocess_bytes(data)
-        
+        return float(self.predict_proba_batch(x)[0])
+
+    def predict_proba_tta(self, data: ImageInput) -> Tuple[float, float]:
+        """
+        Mean malignancy probability over the flip/rotation views and its
+        variance, from one forward pass over all views.
+        """
+        if self.model is None:
+            return 0.0, 0.0
+
+        probs = self.predict_proba_batch(self.preprocess_tta(data))
+        return float(np.mean(probs)), float(np.var(probs))
+
+    def predict_proba_batch(self, batch: np.ndarray) -> np.ndarray:
+        """
+        Run one forward pass over an already preprocessed batch (N, H, W, C)
+        and return the malignancy probability for each row.
+        """
+        if self.model is None:
+            return np.zeros(len(batch), dtype=np.float32)
+
+        if self.predictor is not None:
+            preds = self.predictor(batch)
+        else:
+            preds = self.model.predict(batch, batch_size=len(batch), verbose=0)
         if self.is_new_model:
             # New model returns [p_benign, p_malignant, p_normal] (assuming sorted alphabetic)
             # We map Normal (idx 2) and Benign (idx 0) to Benign. Malignant (idx 1) is Malignant.
             # We return probability of Malignancy.
-            preds = self.model.predict(x)[0] # e.g. [0.1, 0.8, 0.1]
             # Assuming 0=Benign, 1=Malignant, 2=Normal
             # Check class map if possible, but hardcoded for now based on training script logic
-            prob_malignant = float(preds[1])
-            return prob_malignant
-        else:
-            # Legacy
-            prob = float(self.model.predict(x)[0][0])
-            return prob
+            return preds[:, 1].astype(np.float32)
+        # Legacy
+        return preds[:, 0].astype(np.float32)
+
+    def warmup(self, batch_sizes: Optional[Tuple[int, ...]] = None) -> bool:
+        """
+        Run zero batches at the sizes served (single upload, full micro-batch) so
+        graph building and buffer allocation happen before the first patient.
+        Returns False when there is no model to warm.
+        """
+        if self.model is None:
+            return False
+        channels = 3 if self.is_new_model else 1
+        for n in batch_sizes or (1, DEFAULT_MAX_BATCH_SIZE):
+            self.predict_proba_batch(np.zeros((n,) + IMG_SIZE + (channels,), dtype=np.float32))
+        return True
 
-    def predict_label(self, data: bytes, threshold: float = 0.5) -> Tuple[str, float]:
+    @staticmethod
+    def label_for(prob: float, threshold: float = 0.5) -> str:
+        return "MALIGNANT" if prob >= threshold else "BENIGN"
+
+    def predict_label(self, data: ImageInput, threshold: float = 0.5) -> Tuple[str, float]:
         prob = self.predict_proba(data)
-        label = "MALIGNANT" if prob >= threshold else "BENIGN"
-        return label, prob
+        return self.label_for(prob, threshold), prob
         
     def predict_stage(self, prob: float) -> str:
         """
@@ -100,4 +208,156 @@ class BreastCancerModel:
         elif prob < 0.9:
             return "Stage III"
         else:
-            return "Stage IV"
\ No newline at end of file
+            return "Stage IV"
+
+
+# Loaded on first use through the model registry (honour MODEL_PATH if set)
+get_model_registry().register(
+    "classifier",
+    BreastCancerModel,
+    Path(os.environ["MODEL_PATH"]) if os.getenv("MODEL_PATH") else DEFAULT_MODEL_PATH,
+)
+
+def get_classifier() -> BreastCancerModel:
+    return get_model_registry().get("classifier")
+
+
+# -------------------- Micro-batching inference engine --------------------
+
+DEFAULT_MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "16"))
+DEFAULT_BATCH_WINDOW_MS = float(os.getenv("INFERENCE_BATCH_WINDOW_MS", "10"))
+
+_STOP = object()
+
+
+class MicroBatchingEngine:
+    """
+    Coalesces concurrent classification requests into batched forward passes.
+
+    Callers submit image bytes (or a DecodedImage) and get a Future back. A single worker thread
+    waits for the first request, keeps collecting for up to ``batch_window_ms``
+    (or until ``max_batch_size`` requests are queued), runs one
+    ``predict_proba_batch`` call and resolves each caller's Future with its own
+    probability. TTA submissions contribute all of their augmented views to the
+    same forward pass and resolve with ``(mean, variance)``.
+    """
+
+    def __init__(
+        self,
+        model: BreastCancerModel | Callable[[], BreastCancerModel],
+        max_batch_size: Optional[int] = None,
+        batch_window_ms: Optional[float] = None,
+    ) -> None:
+        # A zero-arg callable (e.g. get_classifier) is resolved once per batch, so a
+        # hot-reloaded model is picked up by the next batch
+        self._get_model = model if callable(model) else (lambda: model)
+        self.max_batch_size = max(1, max_batch_size or DEFAULT_MAX_BATCH_SIZE)
+        window_ms = DEFAULT_BATCH_WINDOW_MS if batch_window_ms is None else batch_window_ms
+        self.batch_window = max(0.0, window_ms) / 1000.0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, data: ImageInput, tta: bool = False) -> Future:
+        """
+        Queue one image for classification; the Future yields its probability,
+        or ``(mean, variance)`` over the augmented views when ``tta`` is set.
+        """
+        future: Future = Future()
+        self._ensure_worker()
+        self._queue.put((data, future, tta))
+        return future
+
+    def predict_proba(self, data: ImageInput) -> float:
+        return self.submit(data).result()
+
+    def predict_proba_tta(self, data: ImageInput) -> Tuple[float, float]:
+        return self.submit(data, tta=True).result()
+
+    def predict_label(self, data: ImageInput, threshold: float = 0.5) -> Tuple[str, float]:
+        prob = self.predict_proba(data)
+        return BreastCancerModel.label_for(prob, threshold), prob
+
+    def predict_stage(self, prob: float) -> str:
+        return self._get_model().predict_stage(prob)
+
+    def close(self) -> None:
+        """Stop the worker once the requests already queued have been served."""
+        with self._lock:
+            if self._worker is not None:
+                self._queue.put(_STOP)
+                self._worker.join()
+                self._worker = None
+
+    def _ensure_worker(self) -> None:
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name="classifier-batcher", daemon=True
+                )
+                self._worker.start()
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._process(batch)
+
+    def _process(self, batch: List[Tuple[ImageInput, Future, bool]]) -> None:
+        try:
+            model = self._get_model()
+        except Exception as e:
+            print(f"Classifier unavailable: {e}")
+            for _, future, _ in batch:
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(e)
+            return
+
+        arrays = []
+        futures = []
+        for data, future, tta in batch:
+            if not future.set_running_or_notify_cancel():
+                continue
+            if model.model is None:
+                future.set_result((0.0, 0.0) if tta else 0.0)
+                continue
+            try:
+                arrays.append(model.preprocess_tta(data) if tta else model.preprocess_bytes(data))
+                futures.append((future, tta))
+            except Exception as e:
+                # A corrupt upload only fails its own caller, not the whole batch
+                future.set_exception(e)
+
+        if not futures:
+            return
+
+        try:
+            probs = model.predict_proba_batch(np.concatenate(arrays, axis=0))
+        except Exception as e:
+            print(f"Batched inference error: {e}")
+            for future, _ in futures:
+                future.set_exception(e)
+            return
+
+        # Each caller owns a contiguous run of rows (one, or one per TTA view)
+        start = 0
+        for (future, tta), x in zip(futures, arrays):
+            rows = probs[start:start + len(x)]
+            start += len(x)
+            future.set_result((float(np.mean(rows)), float(np.var(rows))) if tta else float(rows[0]))
@@ -1,20 +1,88 @@
 from __future__ import annotations
 
 import io
-from typing import Dict, Any, List
+import os
+import threading
+from typing import Dict, Any, List, Optional
 import pypdf
 import re
 
-# Try to load spacy, fallback to None if not found
-try:
-    import spacy
-    try:
-        nlp = spacy.load("en_core_web_sm")
-    except OSError:
-        nlp = spacy.blank("en")
-except ImportError:
-    print("Spacy not installed. Using regex fallback.")
-    nlp = None
+# Entity extraction for text reports: "regex" (default) uses only the patterns
+# below; "spacy" also runs spaCy NER over the report sections. spaCy is only
+# imported and its pipeline only loaded once a report needs it.
+REPORT_ENTITY_MODE = os.getenv("REPORT_ENTITY_MODE", "regex").lower()
+REPORT_SPACY_MODEL = os.getenv("REPORT_SPACY_MODEL", "en_core_web_sm")
+REPORT_SPACY_BATCH_SIZE = int(os.getenv("REPORT_SPACY_BATCH_SIZE", "32"))
+# Pipeline components NER does not need
+REPORT_SPACY_DISABLE = ("parser", "lemmatizer")
+# Write each report's extracted text to this file for inspection (off by
+# default: reports contain patient data)
+REPORT_DEBUG_DUMP = os.getenv("REPORT_DEBUG_DUMP", "")
+
+
+class SpacyProvider:
+    """
+    Loads the spaCy pipeline on first use and shares it across threads
+    (spaCy pipelines are safe to call concurrently once loaded). ``get``
+    returns None when spaCy is not installed.
+    """
+
+    def __init__(self, model: str = REPORT_SPACY_MODEL) -> None:
+        self.model = model
+        self._nlp = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def get(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._nlp = self._load()
+                    self._loaded = True
+        return self._nlp
+
+    def _load(self):
+        try:
+            import spacy
+        except ImportError:
+            print("Spacy not installed. Using regex fallback.")
+            return None
+        try:
+            return spacy.load(self.model, disable=list(REPORT_SPACY_DISABLE))
+        except OSError:
+            print(f"spaCy model {self.model} not found; using a blank English pipeline (no entities)")
+            return spacy.blank("en")
+
+
+# Global instance
+spacy_provider = None
+
+def get_spacy_provider() -> SpacyProvider:
+    global spacy_provider
+    if spacy_provider is None:
+        spacy_provider = SpacyProvider()
+    return spacy_provider
+
+
+def report_sections(text: str) -> List[str]:
+    """Blank-line separated blocks of a report, whitespace-normalized."""
+    return [" ".join(block.split()) for block in re.split(r"\n\s*\n", text) if block.strip()]
+
+
+def extract_named_entities(text: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    spaCy entities per report section, processed with ``nlp.pipe`` in batches.
+    None when spaCy is unavailable.
+    """
+    nlp = get_spacy_provider().get()
+    if nlp is None:
+        return None
+    entities = []
+    sections = report_sections(text)
+    for index, doc in enumerate(nlp.pipe(sections, batch_size=REPORT_SPACY_BATCH_SIZE)):
+        for ent in doc.ents:
+            entities.append({"text": ent.text, "label": ent.label_, "section": index})
+    return entities
 
 def extract_text_from_pdf(pdf_bytes: bytes) -> str:
     try:
@@ -26,9 +94,6 @@ def extract_text_from_pdf(pdf_bytes: bytes) -> str:
     except Exception as e:
         return f"Error reading PDF: {str(e)}"
 
-import google.generativeai as genai
-import os
-
 # Debug: Print environment variables
 print(f"DEBUG: GEMINI_API_KEY from env: {os.getenv('GEMINI_API_KEY', 'NOT_FOUND')}[:10]...")
 
@@ -38,11 +103,12 @@ def analyze_report(pdf_bytes: bytes) -> Dict[str, Any]:
     text = extract_text_from_pdf(pdf_bytes)
     
     # DEBUG: Write extracted text to file for inspection
-    try:
-        with open("debug_last_pdf_text.txt", "w", encoding="utf-8") as f:
-            f.write(text)
-    except Exception as e:
-        print(f"Failed to write debug file: {e}")
+    if REPORT_DEBUG_DUMP:
+        try:
+            with open(REPORT_DEBUG_DUMP, "w", encoding="utf-8") as f:
+                f.write(text)
+        except Exception as e:
+            print(f"Failed to write debug file: {e}")
 
     # Check if text is empty (scanned PDF case)
     if not text or not text.strip():
@@ -223,17 +289,24 @@ def analyze_report(pdf_bytes: bytes) -> Dict[str, Any]:
     print(f"DEBUG: Biomarkers found: {len(biomarkers)}")
     print(f"DEBUG: Alerts found: {len(alerts)}")
 
+    extracted_entities = {
+        "diagnosis": [diagnosis] if diagnosis != "Not found" else [],
+        "stage": [stage] if stage != "Not specified" else [],
+        "grade": [grade] if grade != "Not specified" else [],
+        "tumor_size": [tumor_size] if tumor_size != "Not specified" else [],
+        "biomarkers": biomarkers,
+        "alerts": alerts,
+        "risk_level": [risk]
+    }
+    # The regex path never touches spaCy
+    if REPORT_ENTITY_MODE == "spacy":
+        named_entities = extract_named_entities(text)
+        if named_entities is not None:
+            extracted_entities["named_entities"] = named_entities
+
     return {
         "text_snippet": text[:500] + "...",
         "sentiment": sentiment,
-        "extracted_entities": {
-            "diagnosis": [diagnosis] if diagnosis != "Not found" else [],
-            "stage": [stage] if stage != "Not specified" else [],
-            "grade": [grade] if grade != "Not specified" else [],
-            "tumor_size": [tumor_size] if tumor_size != "Not specified" else [],
-            "biomarkers": biomarkers,
-            "alerts": alerts,
-            "risk_level": [risk]
-        },
+        "extracted_entities": extracted_entities,
         "summary": f"Patient diagnosed with {diagnosis}. Risk level assessed as {risk}."
     }
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+DEFAULT_MAX_ENTRIES = int(os.getenv("PREDICTION_CACHE_SIZE", "128"))
+DEFAULT_TTL_SECONDS = float(os.getenv("PREDICTION_CACHE_TTL_SECONDS", "3600"))
+DEFAULT_DISK_DIR = os.getenv("PREDICTION_CACHE_DIR")
+
+
+class PredictionCache:
+    """
+    Content-addressed cache of model outputs for repeated uploads.
+
+    Entries are keyed by the SHA-256 of the image bytes, the pipeline stage
+    ("classification", "segmentation", ...) and the version of the model that
+    produced them, so swapping a model never serves stale results. The memory
+    tier is an LRU bounded by ``max_entries``; every entry expires after
+    ``ttl_seconds``. When ``disk_dir`` is set, entries are also written there
+    as JSON (sharded by the first two hex digits) and survive restarts.
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        disk_dir: Optional[str | Path] = None,
+    ) -> None:
+        self.max_entries = DEFAULT_MAX_ENTRIES if max_entries is None else max_entries
+        self.ttl_seconds = DEFAULT_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        disk_dir = disk_dir if disk_dir is not None else DEFAULT_DISK_DIR
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 or self.disk_dir is not None
+
+    @staticmethod
+    def make_key(digest: str, stage: str, model_version: str) -> str:
+        return f"{digest}:{stage}:{model_version}"
+
+    def get(self, digest: str, stage: str, model_version: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        key = self.make_key(digest, stage, model_version)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+        value = self._disk_get(key, now)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        # Promote disk hits into the memory tier
+        self._memory_set(key, value, now)
+        return value
+
+    def set(self, digest: str, stage: str, model_version: str, value: Dict[str, Any]) -> None:
+        if not self.enabled:
+            return
+        key = self.make_key(digest, stage, model_version)
+        now = time.time()
+        self._memory_set(key, value, now)
+        self._disk_set(key, value, now)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "disk_dir": str(self.disk_dir) if self.disk_dir else None,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _memory_set(self, key: str, value: Dict[str, Any], now: float) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (now + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _disk_path(self, key: str) -> Path:
+        name = key.replace(":", "_")
+        return self.disk_dir / name[:2] / f"{name}.json"
+
+    def _disk_get(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        if self.disk_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            record = json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Prediction cache read error for {path}: {e}")
+            return None
+        if record.get("expires_at", 0) <= now:
+            path.unlink(missing_ok=True)
+            return None
+        return record.get("value")
+
+    def _disk_set(self, key: str, value: Dict[str, Any], now: float) -> None:
+        if self.disk_dir is None:
+            return
+        path = self._disk_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp_path.write_text(json.dumps({"expires_at": now + self.ttl_seconds, "value": value}), encoding="utf-8")
+            os.replace(tmp_path, path)
+        except Exception as e:
+            # The disk tier is best-effort; the memory tier still serves hits
+            print(f"Prediction cache write error for {path}: {e}")
+
+
+# Global instance
+prediction_cache = None
+
+def get_prediction_cache() -> PredictionCache:
+    global prediction_cache
+    if prediction_cache is None:
+        prediction_cache = PredictionCache()
+    return prediction_cache
@@ -1,115 +1,114 @@
 from __future__ import annotations
 
-from typing import Dict, Any
-import numpy as np
-import pandas as pd
+import hashlib
 import os
-# import xgboost as xgb # Uncomment if using xgboost
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
+import threading
+from importlib import metadata
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from ml.model_registry import file_checksum
+
+ROOT = Path(__file__).resolve().parents[1]
+MIMIC_DIR = ROOT / "mimic-iii-clinical-database-demo-1.4"
+TRAINING_CODE = Path(__file__).with_name("train_predictive_models.py")
+TRAINING_SOURCES = (MIMIC_DIR / "PATIENTS.csv", MIMIC_DIR / "ADMISSIONS.csv")
+
+# Fitted offline by `python -m ml.train_predictive_models`; the server only loads it
+PREDICTIVE_MODELS_PATH = Path(os.getenv("PREDICTIVE_MODELS_PATH", str(ROOT / "ml" / "predictive_models.joblib")))
+# Train (once) when the artifact is missing or its inputs changed, instead of failing
+PREDICTIVE_MODELS_AUTO_TRAIN = os.getenv("PREDICTIVE_MODELS_AUTO_TRAIN", "1").lower() not in ("0", "false", "no")
+
 
-# Check if we have real datasets, otherwise use mock data
-def load_real_datasets():
-    """Load real datasets if available, otherwise return None"""
+def sklearn_version() -> str:
     try:
-        # Try to load MIMIC-III data
-        mimic_dir = "mimic-iii-clinical-database-demo-1.4"
-        patients_file = os.path.join(mimic_dir, "PATIENTS.csv")
-        admissions_file = os.path.join(mimic_dir, "ADMISSIONS.csv")
-        
-        if os.path.exists(patients_file) and os.path.exists(admissions_file):
-            patients_df = pd.read_csv(patients_file)
-            admissions_df = pd.read_csv(admissions_file)
-            return patients_df, admissions_df
-    except Exception as e:
-        print(f"Could not load real datasets: {e}")
-        return None, None
-    return None, None
-
-# Load real datasets if available
-real_patients_df, real_admissions_df = load_real_datasets()
-
-def train_models_with_real_data():
-    """Train models using real data if available"""
-    if real_patients_df is not None and real_admissions_df is not None:
-        try:
-            # Process real MIMIC-III data for survival prediction
-            # This is a simplified example - you would need to implement proper feature engineering
-            print("Training models with real MIMIC-III data...")
-            
-            # Example: Create features from patient demographics and admission data
-            # Merge patients and admissions data
-            merged_df = real_admissions_df.merge(real_patients_df, on='subject_id', how='inner')
-            
-            # Create example features (you would need to implement proper clinical features)
-            X = pd.DataFrame({
-                'age': np.random.randint(20, 90, len(merged_df)),  # Placeholder
-                'stage': np.random.randint(1, 5, len(merged_df)),  # Placeholder
-                'comorbidities': np.random.randint(0, 6, len(merged_df))  # Placeholder
-            })
-            
-            # Create example target (you would need to implement proper outcome labels)
-            y = np.random.randint(0, 2, len(merged_df))  # Placeholder
-            
-            clf_survival = RandomForestClassifier(n_estimators=50, random_state=42)
-            clf_survival.fit(X, y)
-            
-            # For side effects, we would need medication data
-            X_se = pd.DataFrame({
-                'age': np.random.randint(20, 90, 1000),  # Placeholder
-                'chemo_type': np.random.randint(0, 3, 1000),  # Placeholder
-                'dosage': np.random.rand(1000)  # Placeholder
-            })
-            y_se = np.random.randint(0, 2, 1000)  # Placeholder
-            
-            clf_side_effects = RandomForestClassifier(n_estimators=50, random_state=42)
-            clf_side_effects.fit(X_se, y_se)
-            
-            return clf_survival, clf_side_effects
-        except Exception as e:
-            print(f"Error training with real data, falling back to mock data: {e}")
-    
-    # Mock training data generation for the demo
-    # In real life, we load SEER data
-    print("Training models with mock data...")
-    return train_mock_models()
-
-def train_mock_models():
-    # Synthetic dataset for survival
-    # Features: Age, Stage (1-4), ComorbidityIndex (0-5)
-    X = np.random.rand(1000, 3)
-    X[:, 0] = X[:, 0] * 80 + 20 # Age 20-100
-    X[:, 1] = np.random.randint(1, 5, 1000) # Stage 1-4
-    X[:, 2] = np.random.randint(0, 6, 1000) # Comorbidity
-    
-    # Target: 5-year survival (1=Yes, 0=No)
-    # Simple logic: Higher stage + higher age = lower survival
-    y_prob = 1.0 - (X[:, 1] * 0.15 + (X[:, 0]/100) * 0.2 + X[:, 2] * 0.05)
-    y = (y_prob > 0.5).astype(int)
-    
-    clf_survival = RandomForestClassifier(n_estimators=10)
-    clf_survival.fit(X, y)
-    
-    # Synthetic dataset for side effects (Nausea)
-    # Features: Age, ChemoType (0-2), Dosage (0-1)
-    X_se = np.random.rand(1000, 3)
-    # Target: Nausea (1=High, 0=Low)
-    y_se = np.random.randint(0, 2, 1000)
-    
-    clf_side_effects = RandomForestClassifier(n_estimators=10)
-    clf_side_effects.fit(X_se, y_se)
-    
-    return clf_survival, clf_side_effects
-
-# Train once on import
-survival_model, side_effect_model = train_models_with_real_data()
+        return metadata.version("scikit-learn")
+    except metadata.PackageNotFoundError:
+        return "missing"
+
+
+def training_fingerprint() -> str:
+    """
+    Content hash of everything the models are trained from: the source CSVs,
+    the training code, and the scikit-learn version (pickles are not portable
+    across versions).
+    """
+    digest = hashlib.sha256()
+    for path in (TRAINING_CODE,) + TRAINING_SOURCES:
+        digest.update(f"{path.name}={file_checksum(path) or 'missing'}\n".encode())
+    digest.update(f"scikit-learn={sklearn_version()}\n".encode())
+    return digest.hexdigest()
+
+
+def read_artifact_fingerprint(path: Path = PREDICTIVE_MODELS_PATH) -> Optional[str]:
+    try:
+        import joblib
+        return joblib.load(path).get("fingerprint")
+    except Exception:
+        return None
+
+
+class PredictiveModels:
+    """The fitted survival and side-effect classifiers from one artifact."""
+
+    def __init__(self, artifact: Dict[str, Any]) -> None:
+        self.survival_model = artifact["survival"]
+        self.side_effect_model = artifact["side_effects"]
+        self.real_data = artifact["real_data"]
+        self.fingerprint = artifact["fingerprint"]
+        self.trained_at = artifact.get("trained_at")
+        self.version = self.fingerprint[:12]
+
+
+def load_predictive_models(path: Path = PREDICTIVE_MODELS_PATH) -> PredictiveModels:
+    """
+    Load the saved models. A missing artifact, or one whose inputs have
+    changed since it was trained, is rebuilt once (and saved) when
+    PREDICTIVE_MODELS_AUTO_TRAIN is on; later starts just load it.
+    """
+    import joblib
+
+    path = Path(path)
+    fingerprint = training_fingerprint()
+    artifact = joblib.load(path) if path.exists() else None
+    if artifact is not None and artifact.get("fingerprint") != fingerprint:
+        if PREDICTIVE_MODELS_AUTO_TRAIN:
+            print(f"Predictive models at {path} are stale (training data or code changed); retraining")
+            artifact = None
+        else:
+            print(f"WARNING: Predictive models at {path} are stale; run `python -m ml.train_predictive_models`")
+    if artifact is None:
+        if not PREDICTIVE_MODELS_AUTO_TRAIN:
+            raise FileNotFoundError(f"Predictive models not found at {path}; run `python -m ml.train_predictive_models`")
+        from ml.train_predictive_models import build_artifact
+        artifact = build_artifact(path)
+    models = PredictiveModels(artifact)
+    print(f"Loaded predictive models {models.version} (trained {models.trained_at})")
+    return models
+
+
+# Global instance
+predictive_models = None
+_load_lock = threading.Lock()
+
+def get_predictive_models() -> PredictiveModels:
+    global predictive_models
+    if predictive_models is None:
+        with _load_lock:
+            if predictive_models is None:
+                predictive_models = load_predictive_models()
+    return predictive_models
+
 
 def predict_survival(age: int, stage: int, comorbidities: int) -> Dict[str, Any]:
     try:
+        models = get_predictive_models()
         # Input format: [Age, Stage, Comorbidity]
         input_data = np.array([[age, stage, comorbidities]])
-        prob = survival_model.predict_proba(input_data)[0][1]
-        
+        prob = models.survival_model.predict_proba(input_data)[0][1]
+
         return {
             "5_year_survival_probability": round(prob * 100, 2),
             "risk_score": round(prob * 100, 2),
@@ -119,16 +118,17 @@ def predict_survival(age: int, stage: int, comorbidities: int) -> Dict[str, Any]
                 "no_disease": round(prob, 2),
                 "disease_present": round(1 - prob, 2)
             },
-            "data_source": "Real MIMIC-III Clinical Data" if real_patients_df is not None else "Synthetic Mock Data"
+            "data_source": "Real MIMIC-III Clinical Data" if models.real_data else "Synthetic Mock Data"
         }
     except Exception as e:
         return {"error": str(e)}
 
 def predict_side_effects(age: int, chemo_type: int, dosage: float) -> Dict[str, Any]:
     try:
+        models = get_predictive_models()
         input_data = np.array([[age, chemo_type, dosage]])
-        prob = side_effect_model.predict_proba(input_data)[0][1]
-        
+        prob = models.side_effect_model.predict_proba(input_data)[0][1]
+
         return {
             "nausea_probability": round(prob * 100, 2),
             "hair_loss_severity": "Moderate" if prob > 0.5 else "Low", # Mock logic
@@ -137,7 +137,7 @@ def predict_side_effects(age: int, chemo_type: int, dosage: float) -> Dict[str,
                 "Cold cap therapy for hair loss",
                 "Hydration therapy"
             ],
-            "data_source": "Real Clinical Data" if real_patients_df is not None else "Synthetic Mock Data"
+            "data_source": "Real Clinical Data" if models.real_data else "Synthetic Mock Data"
         }
     except Exception as e:
-        return {"error": str(e)}
\ No newline at end of file
+        return {"error": str(e)}
@@ -0,0 +1,121 @@
+"""
+Import-time profile of the app: how long ``import app_main`` takes and which
+heavy libraries it pulls in, from `python -X importtime` in a fresh process.
+
+Profiles the normal and the portal-only (PORTAL_ONLY=1) configuration, and
+optionally the same import in another git revision (e.g. one from before the
+ML stack was imported lazily) to show the startup gain.
+
+Usage (from repo root):
+    python -m ml.profile_imports
+    python -m ml.profile_imports --baseline <git-ref> --top 15
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# Libraries whose presence after the import is reported
+HEAVY_MODULES = ("tensorflow", "keras", "cv2", "spacy", "sklearn", "pandas", "google.generativeai", "pypdf")
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app_main
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, float, float]]:
+    """
+    (module, self ms, cumulative ms) for every module ``app_main`` imports
+    directly, from -X importtime output (nested imports are indented two
+    spaces per level under the module that triggered them).
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        if depth == 1:
+            rows.append((name.strip(), int(self_us) / 1000.0, int(cumulative_us) / 1000.0))
+    return rows
+
+
+def profile(tree: Path, portal_only: bool) -> Dict:
+    env = dict(os.environ, PORTAL_ONLY="1" if portal_only else "0", PYTHONDONTWRITEBYTECODE="1")
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", _PROBE], cwd=tree, env=env,
+                          capture_output=True, text=True)
+    result_line = next((line for line in reversed(proc.stdout.splitlines()) if line.startswith("{")), None)
+    if proc.returncode != 0 or result_line is None:
+        tail = "\n".join(proc.stderr.splitlines()[-5:])
+        raise RuntimeError(f"`import app_main` failed in {tree}:\n{tail}")
+    result = json.loads(result_line)
+    result["imports"] = parse_importtime(proc.stderr)
+    return result
+
+
+def baseline_tree(ref: str) -> Path:
+    """Check out ``ref`` into a temporary git worktree (with the local .env files)."""
+    path = Path(tempfile.mkdtemp(prefix="import-profile-"))
+    subprocess.run(["git", "worktree", "add", "--detach", str(path), ref], cwd=ROOT, check=True,
+                   stdout=subprocess.DEVNULL)
+    for name in (".env", ".env.python"):
+        if (ROOT / name).exists():
+            shutil.copy(ROOT / name, path / name)
+    return path
+
+
+def report(label: str, result: Dict, top: int) -> None:
+    print(f"\n== {label}: import app_main took {result['seconds']:.2f}s")
+    print(f"   heavy libraries loaded: {', '.join(result['loaded']) or 'none'}")
+    print(f"   {'cumulative ms':>13} {'self ms':>8}  module")
+    for name, self_ms, cumulative_ms in sorted(result["imports"], key=lambda row: -row[2])[:top]:
+        print(f"   {cumulative_ms:>13.1f} {self_ms:>8.1f}  {name}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", help="git ref to compare against (imported from a temporary worktree)")
+    parser.add_argument("--top", type=int, default=10, help="slowest direct imports of app_main to list")
+    args = parser.parse_args()
+
+    runs: List[Tuple[str, Dict]] = []
+    worktree: Optional[Path] = None
+    try:
+        if args.baseline:
+            worktree = baseline_tree(args.baseline)
+            runs.append((f"baseline ({args.baseline})", profile(worktree, portal_only=False)))
+        runs.append(("current", profile(ROOT, portal_only=False)))
+        runs.append(("current, PORTAL_ONLY=1", profile(ROOT, portal_only=True)))
+    finally:
+        if worktree is not None:
+            subprocess.run(["git", "worktree", "remove", "--force", str(worktree)], cwd=ROOT,
+                           stdout=subprocess.DEVNULL)
+
+    for label, result in runs:
+        report(label, result, args.top)
+
+    reference = runs[0][1]["seconds"]
+    print(f"\n{'configuration':<28} {'import s':>9} {'vs first':>9}  tensorflow loaded")
+    for label, result in runs:
+        print(f"{label:<28} {result['seconds']:>9.2f} {reference / max(result['seconds'], 1e-9):>8.1f}x  "
+              f"{'yes' if 'tensorflow' in result['loaded'] else 'no'}")
+
+    # Portal-only must never import TensorFlow
+    return 1 if "tensorflow" in runs[-1][1]["loaded"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,36 @@
 
 import os
-import cv2
 import numpy as np
-import tensorflow as tf
-from tensorflow.keras.models import load_model
-from tensorflow.keras import backend as K
 import base64
 from io import BytesIO
 from PIL import Image
 
+from ml.compiled_inference import compile_predictor
+from ml.image_pipeline import DecodedImage
+from ml.lazy import lazy_module
+from ml.model_registry import get_model_registry
+from ml.model_utils import model_version
+from ml.tflite_backend import load_tflite_predictor
+
+# Imported on first use so the app starts without TensorFlow / OpenCV (see ml.lazy)
+cv2 = lazy_module("cv2")
+tf = lazy_module("tensorflow", requires_ml=True)
+
+# Tiled segmentation settings (see SegmentationModel.predict_binary_mask)
+SEGMENTATION_MODES = ("standard", "tiled")
+SEGMENTATION_TILE_OVERLAP = int(os.getenv("SEGMENTATION_TILE_OVERLAP", "32"))
+# Budget for one batch of tiles (float32 inputs + outputs)
+SEGMENTATION_TILE_MEMORY_MB = float(os.getenv("SEGMENTATION_TILE_MEMORY_MB", "64"))
+# Larger images are downscaled to this many pixels before tiling
+SEGMENTATION_MAX_MEGAPIXELS = float(os.getenv("SEGMENTATION_MAX_MEGAPIXELS", "16"))
+# Longest side of server-rendered overlay previews
+SEGMENTATION_PREVIEW_MAX_SIDE = int(os.getenv("SEGMENTATION_PREVIEW_MAX_SIDE", "512"))
+# Bounding boxes reported per mask (largest first)
+SEGMENTATION_MAX_REGIONS = 20
+
 # Re-define custom objects needed for loading the model
 def dice_coef(y_true, y_pred):
+    K = tf.keras.backend
     y_true_f = K.flatten(y_true)
     y_pred_f = K.flatten(y_pred)
     intersection = K.sum(y_true_f * y_pred_f)
@@ -19,69 +39,278 @@ def dice_coef(y_true, y_pred):
 def dice_loss(y_true, y_pred):
     return 1 - dice_coef(y_true, y_pred)
 
+def _tile_starts(length, tile, stride):
+    """Tile offsets covering [0, length); the last tile is flush with the edge."""
+    starts = list(range(0, length - tile + 1, stride))
+    if starts[-1] != length - tile:
+        starts.append(length - tile)
+    return starts
+
+def _blend_window(tile, overlap):
+    """2D weights that ramp down over the overlap so neighbouring tiles blend smoothly."""
+    ramp = np.ones(tile, dtype=np.float32)
+    if overlap > 0:
+        edge = (np.arange(overlap, dtype=np.float32) + 1) / (overlap + 1)
+        ramp[:overlap] = edge
+        ramp[-overlap:] = edge[::-1]
+    return np.outer(ramp, ramp)
+
 class SegmentationModel:
     def __init__(self, model_path="ml/attention_unet.h5"):
         self.model_path = model_path
         self.model = None
+        self.predictor = None
+        self.version = model_version(model_path)
         self.img_size = 256
         self.load()
 
     def load(self):
+        # Exported TFLite artifact (INFERENCE_BACKEND=tflite|tflite-int8) replaces the Keras model
+        tflite_model = load_tflite_predictor(self.model_path, "segmentation")
+        if tflite_model is not None:
+            self.model = self.predictor = tflite_model
+            self.version = model_version(tflite_model.path)
+            return
+
         if os.path.exists(self.model_path):
             try:
-                self.model = load_model(self.model_path, custom_objects={'dice_loss': dice_loss, 'dice_coef': dice_coef})
+                self.model = tf.keras.models.load_model(self.model_path, custom_objects={'dice_loss': dice_loss, 'dice_coef': dice_coef})
                 print(f"Segmentation model loaded from {self.model_path}")
+                self.predictor = compile_predictor(self.model, "segmentation", (self.img_size, self.img_size, 3))
             except Exception as e:
                 print(f"Error loading segmentation model: {e}")
         else:
             print(f"Segmentation model not found at {self.model_path}")
 
-    def predict_mask(self, image_bytes):
+    def preprocess(self, image):
+        """Shared U-Net input (1, 256, 256, 3), memoized on the DecodedImage."""
+        size = (self.img_size, self.img_size)
+        return image.memo(
+            ("unet_input", size),
+            lambda: np.expand_dims(image.resized_bgr(size) / 255.0, axis=0),
+        )
+
+    def _predict(self, x):
+        if self.predictor is not None:
+            return self.predictor(x)
+        return self.model.predict(x, verbose=0)
+
+    def warmup(self, batch_sizes=(1,)):
+        """Zero forward passes so the first real request skips graph building; False if no model."""
+        if self.model is None:
+            return False
+        for n in batch_sizes:
+            self._predict(np.zeros((n, self.img_size, self.img_size, 3), dtype=np.float32))
+        return True
+
+    def predict_binary_mask(self, image, mode="standard"):
+        """
+        Binary mask (H, W) uint8 in {0, 255} at the original resolution.
+
+        mode="standard" squashes the whole image to 256x256 (fast, coarse).
+        mode="tiled" slides overlapping 256x256 windows over the image at native
+        resolution, runs them through the model in batches and blends the
+        probabilities, keeping only one band of tiles in memory at a time.
+        """
+        if mode not in SEGMENTATION_MODES:
+            raise ValueError(f"Unknown segmentation mode '{mode}' (expected one of {', '.join(SEGMENTATION_MODES)})")
+        if mode == "tiled":
+            return self._predict_tiled(image.bgr)
+
+        # Standard mode never needs the full-resolution frame, only its size
+        x = self.preprocess(image) # (1, 256, 256, 3)
+        return self._standard_mask(self._predict(x)[0], image.shape)
+
+    @staticmethod
+    def _standard_mask(pred, original_shape):
+        """Threshold one (256, 256, 1) prediction and resize it back to (h, w)."""
+        pred_mask = (pred > 0.5).astype(np.uint8) * 255
+        return cv2.resize(pred_mask, (original_shape[1], original_shape[0])) # Resize back to original
+
+    def _predict_tiled(self, img):
+        h, w = img.shape[:2]
+        max_pixels = SEGMENTATION_MAX_MEGAPIXELS * 1e6
+        if h * w <= max_pixels:
+            return self._tiled_mask(img)
+        # Cap peak memory on huge studies: segment a downscaled working copy
+        scale = (max_pixels / (h * w)) ** 0.5
+        work = cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        mask = self._tiled_mask(work)
+        return cv2.resize(mask, (w, h), interpolation=cv2.INTER_NEAREST)
+
+    def _tiled_mask(self, img):
+        tile = self.img_size
+        overlap = min(max(SEGMENTATION_TILE_OVERLAP, 0), tile // 2)
+        stride = tile - overlap
+        h, w = img.shape[:2]
+        if h < tile or w < tile:
+            img = cv2.copyMakeBorder(img, 0, max(0, tile - h), 0, max(0, tile - w), cv2.BORDER_CONSTANT, value=0)
+        height, width = img.shape[:2]
+
+        ys = _tile_starts(height, tile, stride)
+        xs = _tile_starts(width, tile, stride)
+        window = _blend_window(tile, overlap)
+        tile_bytes = tile * tile * (3 + 1) * 4
+        batch_size = max(1, int(SEGMENTATION_TILE_MEMORY_MB * 1024 * 1024 // tile_bytes))
+
+        mask = np.zeros((height, width), dtype=np.uint8)
+        # Accumulators for one band of rows [band_top, band_top + tile)
+        prob = np.zeros((tile, width), dtype=np.float32)
+        weight = np.zeros((tile, width), dtype=np.float32)
+        band_top = ys[0]
+
+        def finalize(rows):
+            mask[band_top:band_top + rows] = ((prob[:rows] > 0.5 * weight[:rows]) & (weight[:rows] > 0)) * 255
+
+        for y in ys:
+            if y != band_top:
+                # Rows above y are covered by no later tile: write them out and slide the band
+                shift = y - band_top
+                finalize(shift)
+                prob[:-shift] = prob[shift:]
+                weight[:-shift] = weight[shift:]
+                prob[-shift:] = 0
+                weight[-shift:] = 0
+                band_top = y
+            for start in range(0, len(xs), batch_size):
+                row_xs = xs[start:start + batch_size]
+                batch = np.stack([img[y:y + tile, x:x + tile] for x in row_xs]).astype(np.float32) / 255.0
+                preds = self._predict(batch)[..., 0] # (B, 256, 256)
+                for x, p in zip(row_xs, preds):
+                    prob[:, x:x + tile] += p * window
+                    weight[:, x:x + tile] += window
+        finalize(height - band_top)
+        return mask[:h, :w]
+
+    @staticmethod
+    def render_overlay(img, mask, alpha=0.4):
+        """Green mask overlay; only the green channel changes, so no full-size colour mask is built."""
+        overlay = img.copy()
+        overlay[:, :, 1] = cv2.addWeighted(np.ascontiguousarray(img[:, :, 1]), 1, mask, alpha, 0)
+        return overlay
+
+    @staticmethod
+    def encode_mask_png(mask):
+        """
+        Mask as a 1-bit palette PNG data URI: index 0 is transparent, index 1 is
+        green, so the client can lay it straight over the original image. Lesion
+        masks are mostly empty and compress to a few KB even at full resolution.
+        """
+        png = Image.fromarray(mask > 0).convert("P")
+        png.putpalette([0, 0, 0, 0, 255, 0])
+        buffer = BytesIO()
+        png.save(buffer, format="PNG", bits=1, transparency=0, optimize=True)
+        return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+    @staticmethod
+    def decode_mask_png(data_uri):
+        """Inverse of encode_mask_png: (H, W) uint8 mask in {0, 255}."""
+        png = Image.open(BytesIO(base64.b64decode(data_uri.split(",", 1)[1])))
+        return (np.asarray(png) > 0).astype(np.uint8) * 255
+
+    @staticmethod
+    def mask_regions(mask, limit=SEGMENTATION_MAX_REGIONS):
+        """Bounding boxes of the connected lesion areas, largest first."""
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        boxes = sorted((cv2.boundingRect(c) for c in contours), key=lambda b: b[2] * b[3], reverse=True)
+        return [{"x": int(x), "y": int(y), "width": int(w), "height": int(h)} for x, y, w, h in boxes[:limit]]
+
+    def render_overlay_preview(self, image_bytes, segmentation, max_side=None):
         """
-        Input: Raw image bytes
-        Output: Base64 encoded mask image overlay or side-by-side
+        Server-side overlay for clients that cannot composite the mask
+        themselves, rendered at a capped preview size (not full resolution).
+        """
+        jpeg = self.render_overlay_jpeg(image_bytes, segmentation, max_side)
+        return "data:image/jpeg;base64," + base64.b64encode(jpeg).decode('utf-8')
+
+    def render_overlay_jpeg(self, image_bytes, segmentation, max_side=None):
+        """render_overlay_preview as JPEG bytes (e.g. to store it as a file)."""
+        image = DecodedImage.ensure(image_bytes)
+        max_side = max_side or SEGMENTATION_PREVIEW_MAX_SIDE
+        h, w = image.shape
+        scale = min(1.0, max_side / max(h, w))
+        size = (max(1, int(w * scale)), max(1, int(h * scale)))
+        img = image.resized_bgr(size) if scale < 1.0 else image.bgr
+        mask = cv2.resize(self.decode_mask_png(segmentation["mask_png"]), size, interpolation=cv2.INTER_NEAREST)
+        _, buffer = cv2.imencode('.jpg', self.render_overlay(img, mask), [cv2.IMWRITE_JPEG_QUALITY, 80])
+        return buffer.tobytes()
+
+    def predict_mask(self, image_bytes, mode="standard"):
+        """
+        Input: Raw image bytes or a DecodedImage shared with the classifier
+        Output: (segmentation, error) where segmentation is a compact dict:
+            mask_png      1-bit PNG data URI at the original resolution
+            width/height  original image size
+            mask_fraction share of pixels flagged as lesion
+            regions       bounding boxes of the flagged areas
+        The overlay itself is composited by the client, or rendered on demand
+        at preview size via render_overlay_preview.
         """
         if self.model is None:
             return None, "Model not loaded"
 
         try:
-            # 1. Preprocess
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            original_shape = img.shape[:2] # h, w
-            
-            x = cv2.resize(img, (self.img_size, self.img_size))
-            x = x / 255.0
-            x = np.expand_dims(x, axis=0) # (1, 256, 256, 3)
-
-            # 2. Predict
-            pred_mask = self.model.predict(x)[0] # (256, 256, 1)
-            
-            # 3. Post-process mask
-            pred_mask = (pred_mask > 0.5).astype(np.uint8) * 255
-            pred_mask = cv2.resize(pred_mask, (original_shape[1], original_shape[0])) # Resize back to original
-            
-            # 4. Create visualization
-            # Create a green overlay
-            # mask is (H, W), make it (H, W, 3)
-            colored_mask = np.zeros_like(img)
-            colored_mask[:, :, 1] = pred_mask # Green channel
-            
-            # Blend
-            alpha = 0.4
-            overlay = cv2.addWeighted(img, 1, colored_mask, alpha, 0)
-            
-            # Encode to base64
-            _, buffer = cv2.imencode('.jpg', overlay)
-            overlay_base64 = base64.b64encode(buffer).decode('utf-8')
-            
-            return f"data:image/jpeg;base64,{overlay_base64}", None
+            image = DecodedImage.ensure(image_bytes)
+            return self._mask_result(self.predict_binary_mask(image, mode), mode), None
 
         except Exception as e:
             print(f"Prediction error: {e}")
             return None, str(e)
 
-    def generate_comparison(self, image_bytes):
+    def predict_mask_batch(self, images, mode="standard"):
+        """
+        predict_mask for several uploads at once, as a list of (segmentation, error).
+
+        In standard mode all images go through one forward pass; tiled mode
+        already batches tiles within each image, so images run one by one.
+        A bad image only fails its own entry.
+        """
+        if self.model is None:
+            return [(None, "Model not loaded")] * len(images)
+        if mode != "standard":
+            return [self.predict_mask(image, mode) for image in images]
+
+        results = [None] * len(images)
+        ready, inputs = [], []
+        for i, data in enumerate(images):
+            try:
+                image = DecodedImage.ensure(data)
+                inputs.append(self.preprocess(image))
+                ready.append((i, image))
+            except Exception as e:
+                print(f"Prediction error: {e}")
+                results[i] = (None, str(e))
+
+        if ready:
+            try:
+                preds = self._predict(np.concatenate(inputs, axis=0))
+            except Exception as e:
+                print(f"Batched segmentation error: {e}")
+                preds = None
+                for i, _ in ready:
+                    results[i] = (None, str(e))
+            if preds is not None:
+                for (i, image), pred in zip(ready, preds):
+                    try:
+                        pred_mask = self._standard_mask(pred, image.shape)
+                        results[i] = (self._mask_result(pred_mask, mode), None)
+                    except Exception as e:
+                        print(f"Prediction error: {e}")
+                        results[i] = (None, str(e))
+        return results
+
+    def _mask_result(self, pred_mask, mode):
+        h, w = pred_mask.shape
+        return {
+            "mask_png": self.encode_mask_png(pred_mask),
+            "width": int(w),
+            "height": int(h),
+            "mask_fraction": float(np.count_nonzero(pred_mask)) / float(h * w),
+            "regions": self.mask_regions(pred_mask),
+            "mode": mode,
+        }
+
+    def generate_comparison(self, image_bytes, mode="standard"):
         """
         Generates a side-by-side comparison: Original | Mask Overlay | Binary Mask
         Useful for the 'Hard Verification' artifacts.
@@ -90,34 +319,18 @@ class SegmentationModel:
             return None
             
         try:
-             # 1. Preprocess
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            original_shape = img.shape[:2]
-            
-            x = cv2.resize(img, (self.img_size, self.img_size)) / 255.0
-            x = np.expand_dims(x, axis=0)
-
-            # 2. Predict
-            pred_mask = self.model.predict(x)[0]
-            pred_mask = (pred_mask > 0.5).astype(np.uint8) * 255
-            pred_mask = cv2.resize(pred_mask, (original_shape[1], original_shape[0]))
-            
-            # 3. Create Visualize: Vertical stack or Horizontal? Let's do Horizontal
-            # Original
-            vis_img = img.copy()
-            
-            # Overlay (Green)
-            colored_mask = np.zeros_like(img)
-            colored_mask[:, :, 1] = pred_mask
-            vis_overlay = cv2.addWeighted(img, 1, colored_mask, 0.4, 0)
+            image = DecodedImage.ensure(image_bytes)
+            img = image.bgr
+            pred_mask = self.predict_binary_mask(image, mode)
             
-            # Binary Mask (White on Black)
+            # Create Visualize: Horizontal
+            # Original | Overlay (Green) | Binary Mask (White on Black)
+            vis_overlay = self.render_overlay(img, pred_mask)
             vis_mask = cv2.cvtColor(pred_mask, cv2.COLOR_GRAY2BGR)
             
             # Stack: Original | Overlay | Mask
             # Ensure heights match if needed, but they are from same source
-            combined = np.hstack((vis_img, vis_overlay, vis_mask))
+            combined = np.hstack((img, vis_overlay, vis_mask))
             
             # Optimize size if too large
             if combined.shape[1] > 1200:
@@ -131,11 +344,13 @@ class SegmentationModel:
             print(f"Comparison gen error: {e}")
             return None
 
-# Global instance
-segmentor = None
+# Loaded on first use through the model registry (hot-reloadable)
+DEFAULT_SEGMENTATION_PATH = "ml/attention_unet.h5"
+get_model_registry().register(
+    "segmentation",
+    lambda path: SegmentationModel(str(path or DEFAULT_SEGMENTATION_PATH)),
+    os.getenv("SEGMENTATION_MODEL_PATH", DEFAULT_SEGMENTATION_PATH),
+)
 
 def get_segmentor():
-    global segmentor
-    if segmentor is None:
-        segmentor = SegmentationModel()
-    return segmentor
+    return get_model_registry().get("segmentation")
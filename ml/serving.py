@@ -0,0 +1,116 @@
+"""
+Helpers for the pre-forking production server (see gunicorn.conf.py).
+
+The master process imports the app and preloads the models that are safe to
+share across ``fork``; each worker then pins TensorFlow / TFLite / OpenCV to
+its share of the CPU cores so N workers do not oversubscribe the machine.
+"""
+from __future__ import annotations
+
+import gc
+import os
+import sys
+from typing import List, Optional, Tuple
+
+from ml.lazy import PORTAL_ONLY
+
+# Number of server processes (1 = plain uvicorn via `python app_main.py`)
+APP_WORKERS = max(1, int(os.getenv("APP_WORKERS", "1")))
+# Models the master loads before forking (only fork-safe backends, see preload_models)
+PRELOAD_MODELS = [name.strip() for name in os.getenv("PRELOAD_MODELS", "classifier,segmentation").split(",") if name.strip()]
+
+
+def worker_thread_counts(workers: int = APP_WORKERS) -> Tuple[int, int]:
+    """
+    (intra-op, inter-op) threads per worker: TF_INTRA_OP_THREADS /
+    TF_INTER_OP_THREADS when set, otherwise the cores split evenly.
+    """
+    cores = os.cpu_count() or 1
+    intra = int(os.getenv("TF_INTRA_OP_THREADS", "0")) or max(1, cores // max(1, workers))
+    inter = int(os.getenv("TF_INTER_OP_THREADS", "0")) or (1 if intra <= 2 else 2)
+    return intra, inter
+
+
+def configure_worker_threads(workers: int = APP_WORKERS, intra: Optional[int] = None, inter: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Apply per-worker thread limits. Must run in the worker before its first
+    TensorFlow op (TF fixes its thread pools when the runtime starts).
+
+    TensorFlow is imported lazily (see ml.lazy), so when it is not loaded yet
+    the limits go into the environment TF reads at startup instead of
+    importing it here; portal-only workers skip the ML libraries entirely.
+    """
+    default_intra, default_inter = worker_thread_counts(workers)
+    intra, inter = intra or default_intra, inter or default_inter
+    os.environ["OMP_NUM_THREADS"] = str(intra)
+    if PORTAL_ONLY:
+        print(f"Worker {os.getpid()}: portal-only, ML thread pools not configured")
+        return intra, inter
+
+    import ml.tflite_backend as backend
+    if backend.TFLITE_NUM_THREADS is None:
+        backend.TFLITE_NUM_THREADS = intra
+
+    try:
+        import cv2
+        cv2.setNumThreads(intra)
+    except Exception:
+        pass
+
+    if "tensorflow" not in sys.modules:
+        os.environ["TF_NUM_INTRAOP_THREADS"] = str(intra)
+        os.environ["TF_NUM_INTEROP_THREADS"] = str(inter)
+    else:
+        try:
+            import tensorflow as tf
+            tf.config.threading.set_intra_op_parallelism_threads(intra)
+            tf.config.threading.set_inter_op_parallelism_threads(inter)
+        except RuntimeError as e:
+            print(f"WARNING: TensorFlow already initialized in worker {os.getpid()}; thread limits not applied: {e}")
+
+    print(f"Worker {os.getpid()}: intra-op threads={intra}, inter-op threads={inter}")
+    return intra, inter
+
+
+def preload_models(registry, names: Optional[List[str]] = None) -> List[str]:
+    """
+    Load models in the master so forked workers share their weights
+    copy-on-write. Returns the names preloaded.
+
+    Only TFLite artifacts are preloaded, and only with the tflite-runtime
+    wheel installed: each worker builds its own interpreter over the
+    inherited flatbuffer. The TensorFlow runtime is not fork-safe, so with
+    the Keras backend (or TFLite through ``tf.lite``, which would start TF in
+    the master) every worker loads its own copy after the fork (the warm-up
+    at startup still hides that from patients).
+    """
+    import ml.tflite_backend as backend
+
+    names = PRELOAD_MODELS if names is None else names
+    if PORTAL_ONLY:
+        return []
+    if backend.INFERENCE_BACKEND not in ("tflite", "tflite-int8"):
+        print("Keras backend: models load in each worker (TensorFlow cannot be shared across fork). "
+              "Export TFLite artifacts and set INFERENCE_BACKEND=tflite to share weights.")
+        return []
+    if not backend.tflite_runtime_available():
+        print("tflite-runtime is not installed: not preloading, as tf.lite would start TensorFlow in the "
+              "master before fork (`pip install tflite-runtime` to share weights across workers).")
+        return []
+
+    preloaded = []
+    for name in names:
+        path = registry.describe(name).get("path")
+        artifact = backend.tflite_artifact_path(path, quantized=backend.INFERENCE_BACKEND == "tflite-int8") if path else None
+        # A missing artifact would fall back to Keras and start TF in the master
+        if artifact is None or not artifact.exists():
+            print(f"Not preloading {name} model: no TFLite artifact at {artifact}")
+            continue
+        registry.get(name)
+        preloaded.append(name)
+
+    # Keep the GC from touching (and so copying) the preloaded objects in every worker
+    gc.collect()
+    gc.freeze()
+    print(f"Preloaded models in master {os.getpid()}: {', '.join(preloaded) or 'none'}")
+    return preloaded
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import importlib.util
+import os
+import threading
+import weakref
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+from ml.lazy import lazy_module
+
+tf = lazy_module("tensorflow", requires_ml=True)
+
+# keras (default) | tflite | tflite-int8
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "keras").lower()
+TFLITE_NUM_THREADS = int(os.getenv("TFLITE_NUM_THREADS", "0")) or None
+
+
+def tflite_runtime_available() -> bool:
+    """True when the slim tflite-runtime wheel is installed (interpreter without TensorFlow)."""
+    return importlib.util.find_spec("tflite_runtime") is not None
+
+
+def interpreter_class():
+    """
+    The TFLite Interpreter, imported on first use. Prefers the slim
+    tflite-runtime wheel when installed; it avoids pulling the full
+    TensorFlow runtime into the serving process.
+    """
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+def tflite_artifact_path(keras_path: Path | str, quantized: bool = False) -> Path:
+    """ml/breast_cancer_cnn.h5 -> ml/breast_cancer_cnn.tflite (or .int8.tflite)."""
+    keras_path = Path(keras_path)
+    suffix = ".int8.tflite" if quantized else ".tflite"
+    return keras_path.with_name(keras_path.stem + suffix)
+
+
+class TFLitePredictor:
+    """
+    Serves an exported TFLite artifact behind the same interface the app uses
+    for Keras models (``__call__``/``predict`` returning a numpy array, and an
+    ``input_shape`` with an open batch dimension).
+
+    Quantized (int8) inputs and outputs are converted with the tensor's scale
+    and zero point, so callers always pass and receive float32. The
+    interpreter is not thread-safe, so calls are serialized.
+
+    The flatbuffer is read into memory once and the interpreter runs on it in
+    place. After a fork each worker builds its own interpreter over the
+    inherited buffer, so preloaded weights are shared copy-on-write.
+    """
+
+    def __init__(self, path: Path | str, name: str, num_threads: Optional[int] = None) -> None:
+        self.path = Path(path)
+        self.name = name
+        self.num_threads = num_threads
+        self.model_content = self.path.read_bytes()
+        self._lock = threading.Lock()
+        self._build_interpreter()
+        _predictors.add(self)
+
+    def _build_interpreter(self) -> None:
+        self.interpreter = interpreter_class()(model_content=self.model_content,
+                                               num_threads=self.num_threads or TFLITE_NUM_THREADS)
+        self.interpreter.allocate_tensors()
+        self._refresh_details()
+
+    def _after_fork(self) -> None:
+        # The parent's interpreter (and any lock state) must not be used in the child
+        self._lock = threading.Lock()
+        self.interpreter = None
+
+    def _refresh_details(self) -> None:
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+
+    @property
+    def input_shape(self) -> Tuple[Optional[int], ...]:
+        return (None,) + tuple(int(d) for d in self._input["shape"][1:])
+
+    def __call__(self, x: np.ndarray) -> np.ndarray:
+        x = np.asarray(x, dtype=np.float32)
+        with self._lock:
+            if self.interpreter is None:
+                self._build_interpreter()
+            if tuple(self._input["shape"]) != x.shape:
+                self.interpreter.resize_tensor_input(self._input["index"], x.shape)
+                self.interpreter.allocate_tensors()
+                self._refresh_details()
+            self.interpreter.set_tensor(self._input["index"], self._quantize(x))
+            self.interpreter.invoke()
+            out = self.interpreter.get_tensor(self._output["index"])
+            return self._dequantize(out)
+
+    def predict(self, x: np.ndarray, **kwargs) -> np.ndarray:
+        return self(x)
+
+    def _quantize(self, x: np.ndarray) -> np.ndarray:
+        dtype = self._input["dtype"]
+        if dtype == np.float32:
+            return x
+        scale, zero_point = self._input["quantization"]
+        info = np.iinfo(dtype)
+        return np.clip(np.round(x / scale + zero_point), info.min, info.max).astype(dtype)
+
+    def _dequantize(self, out: np.ndarray) -> np.ndarray:
+        if self._output["dtype"] == np.float32:
+            return out.copy()
+        scale, zero_point = self._output["quantization"]
+        return (out.astype(np.float32) - zero_point) * scale
+
+
+# Every live predictor, so forked workers can drop the parent's interpreters
+_predictors: "weakref.WeakSet[TFLitePredictor]" = weakref.WeakSet()
+
+def _reset_predictors_after_fork() -> None:
+    for predictor in list(_predictors):
+        predictor._after_fork()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_predictors_after_fork)
+
+
+def load_tflite_predictor(keras_path: Path | str, name: str) -> Optional[TFLitePredictor]:
+    """
+    Return a TFLitePredictor when INFERENCE_BACKEND selects TFLite and the
+    exported artifact exists next to the Keras model; otherwise None so the
+    caller loads the Keras model as usual.
+    """
+    if INFERENCE_BACKEND not in ("tflite", "tflite-int8"):
+        return None
+    path = tflite_artifact_path(keras_path, quantized=INFERENCE_BACKEND == "tflite-int8")
+    if not path.exists():
+        print(f"WARNING: {INFERENCE_BACKEND} artifact for {name} model not found at {path}; "
+              f"run `python -m ml.export_tflite`. Falling back to Keras.")
+        return None
+    try:
+        predictor = TFLitePredictor(path, name)
+        print(f"Loaded {name} model from {path} ({INFERENCE_BACKEND} backend)")
+        return predictor
+    except Exception as e:
+        print(f"Error loading {path}: {e}. Falling back to Keras.")
+        return None
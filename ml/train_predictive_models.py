@@ -0,0 +1,169 @@
+"""
+Fit the survival and side-effect models offline and save them as a joblib
+artifact that the server only loads (see ml.predictive_models).
+
+The artifact records a fingerprint of its inputs (the MIMIC-III CSVs, this
+training code and the scikit-learn version), so retraining is skipped while
+none of them has changed. Training is seeded, so the same inputs always give
+the same models.
+
+Usage (from repo root):
+    python -m ml.train_predictive_models            # retrain only if the inputs changed
+    python -m ml.train_predictive_models --force
+"""
+from __future__ import annotations
+
+import argparse
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import joblib
+import numpy as np
+import pandas as pd
+# import xgboost as xgb # Uncomment if using xgboost
+from sklearn.ensemble import RandomForestClassifier
+
+from ml.predictive_models import (
+    MIMIC_DIR,
+    PREDICTIVE_MODELS_PATH,
+    read_artifact_fingerprint,
+    sklearn_version,
+    training_fingerprint,
+)
+
+RANDOM_SEED = 42
+
+
+# Check if we have real datasets, otherwise use mock data
+def load_real_datasets() -> Tuple[Optional[pd.DataFrame], Optional[pd.DataFrame]]:
+    """Load real datasets if available, otherwise return None"""
+    try:
+        # Try to load MIMIC-III data
+        patients_file = MIMIC_DIR / "PATIENTS.csv"
+        admissions_file = MIMIC_DIR / "ADMISSIONS.csv"
+
+        if patients_file.exists() and admissions_file.exists():
+            return pd.read_csv(patients_file), pd.read_csv(admissions_file)
+    except Exception as e:
+        print(f"Could not load real datasets: {e}")
+    return None, None
+
+
+def train_models_with_real_data(patients_df: pd.DataFrame, admissions_df: pd.DataFrame, rng: np.random.Generator):
+    """Train models using real MIMIC-III data"""
+    # Process real MIMIC-III data for survival prediction
+    # This is a simplified example - you would need to implement proper feature engineering
+    print("Training models with real MIMIC-III data...")
+
+    # Example: Create features from patient demographics and admission data
+    # Merge patients and admissions data
+    merged_df = admissions_df.merge(patients_df, on='subject_id', how='inner')
+
+    # Create example features (you would need to implement proper clinical features)
+    X = pd.DataFrame({
+        'age': rng.integers(20, 90, len(merged_df)),  # Placeholder
+        'stage': rng.integers(1, 5, len(merged_df)),  # Placeholder
+        'comorbidities': rng.integers(0, 6, len(merged_df))  # Placeholder
+    })
+
+    # Create example target (you would need to implement proper outcome labels)
+    y = rng.integers(0, 2, len(merged_df))  # Placeholder
+
+    clf_survival = RandomForestClassifier(n_estimators=50, random_state=RANDOM_SEED)
+    clf_survival.fit(X, y)
+
+    # For side effects, we would need medication data
+    X_se = pd.DataFrame({
+        'age': rng.integers(20, 90, 1000),  # Placeholder
+        'chemo_type': rng.integers(0, 3, 1000),  # Placeholder
+        'dosage': rng.random(1000)  # Placeholder
+    })
+    y_se = rng.integers(0, 2, 1000)  # Placeholder
+
+    clf_side_effects = RandomForestClassifier(n_estimators=50, random_state=RANDOM_SEED)
+    clf_side_effects.fit(X_se, y_se)
+
+    return clf_survival, clf_side_effects
+
+
+def train_mock_models(rng: np.random.Generator):
+    # Mock training data generation for the demo
+    # In real life, we load SEER data
+    print("Training models with mock data...")
+    # Synthetic dataset for survival
+    # Features: Age, Stage (1-4), ComorbidityIndex (0-5)
+    X = rng.random((1000, 3))
+    X[:, 0] = X[:, 0] * 80 + 20 # Age 20-100
+    X[:, 1] = rng.integers(1, 5, 1000) # Stage 1-4
+    X[:, 2] = rng.integers(0, 6, 1000) # Comorbidity
+
+    # Target: 5-year survival (1=Yes, 0=No)
+    # Simple logic: Higher stage + higher age = lower survival
+    y_prob = 1.0 - (X[:, 1] * 0.15 + (X[:, 0]/100) * 0.2 + X[:, 2] * 0.05)
+    y = (y_prob > 0.5).astype(int)
+
+    clf_survival = RandomForestClassifier(n_estimators=10, random_state=RANDOM_SEED)
+    clf_survival.fit(X, y)
+
+    # Synthetic dataset for side effects (Nausea)
+    # Features: Age, ChemoType (0-2), Dosage (0-1)
+    X_se = rng.random((1000, 3))
+    # Target: Nausea (1=High, 0=Low)
+    y_se = rng.integers(0, 2, 1000)
+
+    clf_side_effects = RandomForestClassifier(n_estimators=10, random_state=RANDOM_SEED)
+    clf_side_effects.fit(X_se, y_se)
+
+    return clf_survival, clf_side_effects
+
+
+def build_artifact(path: Path = PREDICTIVE_MODELS_PATH) -> Dict[str, Any]:
+    """Train both models and save them, with the input fingerprint, to ``path``."""
+    fingerprint = training_fingerprint()
+    rng = np.random.default_rng(RANDOM_SEED)
+    patients_df, admissions_df = load_real_datasets()
+    real_data = False
+    models = None
+    if patients_df is not None and admissions_df is not None:
+        try:
+            models = train_models_with_real_data(patients_df, admissions_df, rng)
+            real_data = True
+        except Exception as e:
+            print(f"Error training with real data, falling back to mock data: {e}")
+    if models is None:
+        models = train_mock_models(np.random.default_rng(RANDOM_SEED))
+
+    artifact = {
+        "survival": models[0],
+        "side_effects": models[1],
+        "real_data": real_data,
+        "fingerprint": fingerprint,
+        "sklearn_version": sklearn_version(),
+        "trained_at": datetime.now().isoformat(),
+    }
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write then rename, so concurrent readers never see a partial file
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    joblib.dump(artifact, tmp)
+    os.replace(tmp, path)
+    print(f"Saved predictive models to {path} (fingerprint {fingerprint[:12]})")
+    return artifact
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", type=Path, default=PREDICTIVE_MODELS_PATH)
+    parser.add_argument("--force", action="store_true", help="retrain even if the inputs are unchanged")
+    args = parser.parse_args()
+
+    if not args.force and read_artifact_fingerprint(args.output) == training_fingerprint():
+        print(f"{args.output} is up to date; nothing to do (use --force to retrain)")
+        return
+    build_artifact(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+from __future__ import annotations
+
+import hashlib
+import mmap
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, List, Optional, Union
+
+from starlette.exceptions import HTTPException
+
+# Largest single upload (images, reports); bigger files are rejected while streaming
+UPLOAD_MAX_BYTES = int(float(os.getenv("UPLOAD_MAX_MB", "25")) * 1024 * 1024)
+# Bulk and job endpoints take many files (or zip archives) in one request
+BULK_MAX_REQUEST_BYTES = int(float(os.getenv("BULK_MAX_REQUEST_MB", "1024")) * 1024 * 1024)
+# Largest zip archive in a bulk upload (its images are still checked one by one)
+BULK_MAX_ARCHIVE_BYTES = int(float(os.getenv("BULK_MAX_ARCHIVE_MB", "1024")) * 1024 * 1024)
+# Uploads up to this size stay in memory; larger ones spill to a temp file that is memory-mapped
+UPLOAD_SPOOL_MEMORY_BYTES = int(float(os.getenv("UPLOAD_SPOOL_MEMORY_MB", "1")) * 1024 * 1024)
+UPLOAD_CHUNK_BYTES = 256 * 1024
+
+BULK_UPLOAD_PATHS = ("/api/bulk-analyze", "/api/jobs/")
+
+IMAGE_TYPES = ("image/jpeg", "image/png", "image/gif", "image/bmp", "image/tiff", "image/webp")
+REPORT_TYPES = ("application/pdf",)
+ARCHIVE_TYPES = ("application/zip",)
+# Per-file checks for bulk uploads: images, or zip archives of them
+BULK_LIMITS = {"allowed": IMAGE_TYPES + ARCHIVE_TYPES, "type_max_bytes": {"application/zip": BULK_MAX_ARCHIVE_BYTES}}
+
+# (offset, magic bytes, MIME type)
+_SIGNATURES = (
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (0, b"BM", "image/bmp"),
+    (0, b"II*\x00", "image/tiff"),
+    (0, b"MM\x00*", "image/tiff"),
+    (8, b"WEBP", "image/webp"),
+    (0, b"%PDF-", "application/pdf"),
+    (0, b"PK\x03\x04", "application/zip"),
+)
+
+
+class UploadRejected(HTTPException):
+    """Upload refused while streaming (413 too large, 415 wrong type, 400 empty)."""
+
+
+def sniff_mime(head: bytes) -> Optional[str]:
+    """MIME type from the file's leading magic bytes; None when unrecognised."""
+    for offset, magic, mime in _SIGNATURES:
+        if head[offset:offset + len(magic)] == magic:
+            return mime
+    return None
+
+
+def _megabytes(size: int) -> str:
+    return f"{size / (1024 * 1024):g} MB"
+
+
+class IngestedUpload:
+    """
+    An upload streamed into a spool: small files in memory, larger ones in an
+    anonymous temp file. ``sha256``, ``mime`` and ``size`` are computed while
+    streaming; ``data`` is a read-only buffer (bytes, or an mmap of the temp
+    file) that decoders read in place without another copy on the heap.
+    """
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self.size = 0
+        self.sha256: Optional[str] = None
+        self.mime: Optional[str] = None
+        self._memory: Optional[bytearray] = bytearray()
+        self._file = None
+        self._data: Optional[Union[bytes, mmap.mmap]] = None
+
+    def write(self, chunk: bytes) -> None:
+        if self._file is None and self.size + len(chunk) > UPLOAD_SPOOL_MEMORY_BYTES:
+            self._file = tempfile.TemporaryFile()
+            self._file.write(self._memory)
+            self._memory = None
+        if self._file is not None:
+            self._file.write(chunk)
+        else:
+            self._memory += chunk
+        self.size += len(chunk)
+
+    @property
+    def data(self) -> Union[bytes, mmap.mmap]:
+        if self._data is None:
+            if self._file is None:
+                self._data = bytes(self._memory)
+                self._memory = None
+            else:
+                self._file.flush()
+                self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._data
+
+    @property
+    def file(self) -> BinaryIO:
+        """Seekable file over the upload, owned (and closed) by it; for readers that want a stream."""
+        if self._file is None:
+            return BytesIO(self.data)
+        self._file.flush()
+        self._file.seek(0)
+        return self._file
+
+    def save(self, path: Union[str, Path]) -> None:
+        """Write the upload to ``path`` without materialising it in memory."""
+        with open(path, "wb") as out:
+            if self._file is None and self._data is None:
+                out.write(self._memory)
+            elif self._file is None:
+                out.write(self._data)
+            else:
+                self._file.seek(0)
+                shutil.copyfileobj(self._file, out, UPLOAD_CHUNK_BYTES)
+
+    def close(self) -> None:
+        if isinstance(self._data, mmap.mmap):
+            try:
+                self._data.close()
+            except BufferError:
+                # A decoder still holds a view; the map is released with it
+                pass
+        self._data = self._memory = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "IngestedUpload":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+async def ingest_upload(
+    upload,
+    max_bytes: int = UPLOAD_MAX_BYTES,
+    allowed: Optional[Iterable[str]] = IMAGE_TYPES,
+    type_max_bytes: Optional[Dict[str, int]] = None,
+) -> IngestedUpload:
+    """
+    Stream a FastAPI ``UploadFile`` into an IngestedUpload in chunks, hashing
+    as it goes. Raises UploadRejected as soon as the file passes ``max_bytes``
+    (or its type's limit in ``type_max_bytes``) or its first bytes are not one
+    of the ``allowed`` types (None allows any).
+    """
+    allowed = tuple(allowed) if allowed is not None else None
+    ingested = IngestedUpload(upload.filename or "upload")
+    digest = hashlib.sha256()
+    try:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            if ingested.size == 0:
+                ingested.mime = sniff_mime(chunk)
+                if allowed is not None and ingested.mime not in allowed:
+                    found = ingested.mime or upload.content_type or "unknown"
+                    raise UploadRejected(415, f"{ingested.filename}: unsupported file type {found} (expected {', '.join(allowed)})")
+                max_bytes = (type_max_bytes or {}).get(ingested.mime, max_bytes)
+            if ingested.size + len(chunk) > max_bytes:
+                raise UploadRejected(413, f"{ingested.filename}: file exceeds the {_megabytes(max_bytes)} upload limit")
+            digest.update(chunk)
+            ingested.write(chunk)
+        if ingested.size == 0:
+            raise UploadRejected(400, f"{ingested.filename}: empty upload")
+    except BaseException:
+        ingested.close()
+        raise
+    ingested.sha256 = digest.hexdigest()
+    return ingested
+
+
+async def ingest_uploads(uploads, **limits) -> List[IngestedUpload]:
+    """ingest_upload for each file of a multi-file request; all or none (the rest are closed on a rejection)."""
+    ingested: List[IngestedUpload] = []
+    try:
+        for upload in uploads:
+            ingested.append(await ingest_upload(upload, **limits))
+    except BaseException:
+        for done in ingested:
+            done.close()
+        raise
+    return ingested
+
+
+class UploadLimitMiddleware:
+    """
+    Reject oversized request bodies before they are parsed. A declared
+    Content-Length over the limit gets 413 straight away; chunked bodies are
+    counted as they arrive and cut off once they pass it: the 413 is sent from
+    here and the app sees the client disconnect, so whatever the body parser
+    makes of that never reaches the client. Bulk and job endpoints get
+    BULK_MAX_REQUEST_BYTES, everything else one upload's worth.
+    """
+
+    def __init__(self, app, max_bytes: int = UPLOAD_MAX_BYTES, bulk_max_bytes: int = BULK_MAX_REQUEST_BYTES) -> None:
+        self.app = app
+        self.max_bytes = max_bytes
+        self.bulk_max_bytes = bulk_max_bytes
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH"):
+            await self.app(scope, receive, send)
+            return
+
+        allowed = self.bulk_max_bytes if scope["path"].startswith(BULK_UPLOAD_PATHS) else self.max_bytes
+        # Multipart framing and form fields ride on top of the file itself
+        limit = allowed + 64 * 1024
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > limit:
+            await self._reject(send, allowed)
+            return
+
+        received = 0
+        started = rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    rejected = True
+                    if not started:
+                        await self._reject(send, allowed)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            if rejected:
+                # The 413 has been sent; drop the app's reply to the cut-off body
+                return
+            started = started or message["type"] == "http.response.start"
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not rejected:
+                raise
+
+    @staticmethod
+    async def _reject(send, allowed: int) -> None:
+        body = f'{{"error": "Request body exceeds the {_megabytes(allowed)} limit"}}'.encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
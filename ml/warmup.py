@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from ml.lazy import PORTAL_ONLY
+
+
+def _names(value: str) -> List[str]:
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+# Set WARMUP_ON_STARTUP=0 to keep loading models lazily on first request
+# (portal-only deployments have no models to warm)
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1").lower() not in ("0", "false", "no") and not PORTAL_ONLY
+# Models loaded and run on dummy inputs before the server reports ready
+WARMUP_MODELS = _names(os.getenv("WARMUP_MODELS", "classifier,segmentation,mobilenet"))
+# Readiness also requires these to have loaded (a missing optional model only shows in the report)
+WARMUP_REQUIRED_MODELS = _names(os.getenv("WARMUP_REQUIRED_MODELS", "classifier"))
+
+
+class ModelWarmup:
+    """
+    Startup warm-up that gates readiness.
+
+    ``run`` loads each model through the registry and calls its ``warmup()``
+    (zero inputs at the batch sizes served), so TensorFlow builds graphs and
+    allocates buffers before traffic arrives. ``ready`` turns true only once
+    every model has been through it and the required ones loaded; ``report``
+    gives per-model load and warm-up timings for /readyz.
+    """
+
+    def __init__(
+        self,
+        registry,
+        models: Optional[List[str]] = None,
+        required: Optional[List[str]] = None,
+        enabled: bool = WARMUP_ON_STARTUP,
+    ) -> None:
+        self.registry = registry
+        self.models = list(WARMUP_MODELS if models is None else models)
+        self.required = list(WARMUP_REQUIRED_MODELS if required is None else required)
+        self.enabled = enabled
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.results: Dict[str, Dict[str, Any]] = {name: {"status": "pending"} for name in self.models}
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    @property
+    def ready(self) -> bool:
+        if not self.enabled:
+            return True
+        if not self.finished:
+            return False
+        return all(self.results.get(name, {}).get("status") == "ready" for name in self.required)
+
+    def run(self) -> Dict[str, Any]:
+        """Load and warm every model in turn (blocking; run it off the event loop)."""
+        with self._lock:
+            if self.started_at is not None:
+                return self.report()
+            self.started_at = time.time()
+
+        for name in self.models:
+            self.results[name] = {"status": "warming"}
+            self.results[name] = self.warm(name)
+        self.finished_at = time.time()
+
+        summary = ", ".join(
+            f"{name}={result['status']} ({result.get('warmup_seconds', 0):.2f}s)" for name, result in self.results.items()
+        )
+        print(f"Model warm-up finished in {self.finished_at - self.started_at:.1f}s: {summary}; ready={self.ready}")
+        return self.report()
+
+    def warm(self, name: str) -> Dict[str, Any]:
+        """Load one model (if needed) and run its warm-up; never raises."""
+        start = time.perf_counter()
+        try:
+            instance = self.registry.get(name)
+            loaded = time.perf_counter()
+            warm = getattr(instance, "warmup", None)
+            available = warm() if callable(warm) else True
+        except Exception as e:
+            print(f"Warm-up failed for {name} model: {e}")
+            return {"status": "failed", "error": str(e), "seconds": round(time.perf_counter() - start, 3)}
+        done = time.perf_counter()
+        return {
+            # Model file missing: the app keeps serving with that feature disabled
+            "status": "ready" if available else "unavailable",
+            "load_seconds": round(loaded - start, 3),
+            "warmup_seconds": round(done - loaded, 3),
+        }
+
+    def report(self) -> Dict[str, Any]:
+        def iso(ts: Optional[float]) -> Optional[str]:
+            return datetime.fromtimestamp(ts).isoformat() if ts else None
+
+        total = None
+        if self.started_at is not None:
+            total = round((self.finished_at or time.time()) - self.started_at, 3)
+        return {
+            "ready": self.ready,
+            "enabled": self.enabled,
+            "started_at": iso(self.started_at),
+            "finished_at": iso(self.finished_at),
+            "total_seconds": total,
+            "required": self.required,
+            "models": {name: dict(result) for name, result in self.results.items()},
+        }
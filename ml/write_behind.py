@@ -0,0 +1,243 @@
+"""
+Write-behind persistence for MongoDB.
+
+Request handlers queue their writes here instead of awaiting an
+``insert_one``/``update_one`` each: the response no longer waits for a Mongo
+round trip, and a background task sends everything queued for a collection
+as one ordered ``bulk_write`` when WRITE_BEHIND_BATCH_SIZE writes are
+pending or WRITE_BEHIND_FLUSH_MS after the first one, whichever comes first.
+
+Writes to a collection are applied in the order they were queued. A failed
+batch is retried with exponential backoff (up to WRITE_BEHIND_MAX_RETRIES
+times) before it is dropped; inserts carry their ``_id`` so a retried insert
+that had already landed is recognised by its duplicate-key error rather than
+written twice. Dropped writes are counted in ``stats`` and the most recent
+ones kept in ``dropped`` (both shown by /healthz). Since a queued write can
+still be lost, only use the queue for writes that may be: idempotent status
+updates and best-effort mirrors, not records that exist nowhere else. On
+shutdown the queue is drained.
+
+``barrier(collection)`` waits (up to WRITE_BEHIND_BARRIER_MS) until the
+writes queued so far to that collection are written, for readers in this
+process that must see their own writes.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "100"))
+WRITE_BEHIND_FLUSH_MS = float(os.getenv("WRITE_BEHIND_FLUSH_MS", "200"))
+WRITE_BEHIND_MAX_RETRIES = int(os.getenv("WRITE_BEHIND_MAX_RETRIES", "5"))
+# Queued writes beyond this make new writes wait for a flush (backpressure)
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000"))
+WRITE_BEHIND_DRAIN_SECONDS = float(os.getenv("WRITE_BEHIND_DRAIN_SECONDS", "10"))
+# Longest a read waits for its collection's queued writes (e.g. while a flush is backing off)
+WRITE_BEHIND_BARRIER_MS = float(os.getenv("WRITE_BEHIND_BARRIER_MS", "1000"))
+
+DUPLICATE_KEY = 11000
+
+
+class WriteBehindQueue:
+    """Per-collection queues of pending writes, flushed in batches by one background task."""
+
+    def __init__(
+        self,
+        db,
+        batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+        flush_seconds: float = WRITE_BEHIND_FLUSH_MS / 1000.0,
+        max_retries: int = WRITE_BEHIND_MAX_RETRIES,
+        max_pending: int = WRITE_BEHIND_MAX_PENDING,
+    ) -> None:
+        self.db = db
+        self.batch_size = max(1, batch_size)
+        self.flush_seconds = flush_seconds
+        self.max_retries = max_retries
+        self.max_pending = max(self.batch_size, max_pending)
+        self._pending: Dict[str, List[Any]] = {}
+        self._queued = 0    # writes ever queued
+        self._done = 0      # writes flushed (or given up on)
+        self._queued_by: Dict[str, int] = {}
+        self._done_by: Dict[str, int] = {}
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._progress: Optional[asyncio.Condition] = None
+        self.stats = {"writes": 0, "batches": 0, "retries": 0, "dropped": 0}
+        self.dropped: Deque[Dict[str, Any]] = deque(maxlen=100)
+
+    @property
+    def pending(self) -> int:
+        return self._queued - self._done
+
+    # -------------------- queueing --------------------
+
+    async def insert(self, collection: str, doc: Dict[str, Any]) -> None:
+        from bson import ObjectId
+        from pymongo import InsertOne
+
+        doc = dict(doc)
+        doc.setdefault("_id", ObjectId())
+        await self._queue(collection, InsertOne(doc))
+
+    async def update(self, collection: str, query: Dict[str, Any], update: Dict[str, Any], upsert: bool = False) -> None:
+        from pymongo import UpdateOne
+
+        await self._queue(collection, UpdateOne(query, update, upsert=upsert))
+
+    async def delete_many(self, collection: str, query: Dict[str, Any]) -> None:
+        from pymongo import DeleteMany
+
+        await self._queue(collection, DeleteMany(query))
+
+    async def _queue(self, collection: str, op: Any) -> None:
+        if self._task is None:
+            # Not started (e.g. a script): write through, and fail like a direct write would
+            await self._write(collection, [op], drop=False)
+            return
+        if self.pending >= self.max_pending:
+            self._wakeup.set()
+            async with self._progress:
+                await self._progress.wait_for(lambda: self.pending < self.max_pending)
+        self._pending.setdefault(collection, []).append(op)
+        self._queued += 1
+        self._queued_by[collection] = self._queued_by.get(collection, 0) + 1
+        if self.pending == 1 or self.pending >= self.batch_size:
+            self._wakeup.set()
+
+    async def barrier(self, collection: Optional[str] = None, timeout: float = WRITE_BEHIND_BARRIER_MS / 1000.0) -> bool:
+        """
+        Wait until the writes queued before this call (to ``collection``, or to
+        any collection) have been flushed. False if that took longer than
+        ``timeout``; the caller then reads without them.
+        """
+        if self._task is None:
+            return True
+        if collection is None:
+            target = self._queued
+            flushed: Callable[[], bool] = lambda: self._done >= target
+        else:
+            target = self._queued_by.get(collection, 0)
+            flushed = lambda: self._done_by.get(collection, 0) >= target
+        if flushed():
+            return True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._wait_until(flushed), timeout)
+        except asyncio.TimeoutError:
+            print(f"WARNING: Write-behind barrier on {collection or 'all collections'} timed out after {timeout:g}s")
+            return False
+        return True
+
+    async def _wait_until(self, predicate: Callable[[], bool]) -> None:
+        async with self._progress:
+            await self._progress.wait_for(predicate)
+
+    # -------------------- flushing --------------------
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._progress = asyncio.Condition()
+        self._task = asyncio.create_task(self._flusher())
+        print(f"Write-behind queue started (batch {self.batch_size}, flush {self.flush_seconds * 1000:.0f}ms)")
+
+    async def stop(self, timeout: float = WRITE_BEHIND_DRAIN_SECONDS) -> None:
+        """Flush what is still queued (for up to ``timeout`` seconds), then stop."""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._task = None
+        if self.pending:
+            print(f"WARNING: Write-behind queue stopped with {self.pending} unwritten writes")
+        print(f"Write-behind queue stopped: {self.stats}")
+
+    async def _flusher(self) -> None:
+        while not self._stopping:
+            await self._wakeup.wait()
+            # Let a batch build up, unless one is already full
+            if self.pending < self.batch_size and not self._stopping:
+                try:
+                    await asyncio.wait_for(self._full_or_barrier(), self.flush_seconds)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            await self._flush()
+        await self._flush()
+
+    async def _full_or_barrier(self) -> None:
+        # Woken again by a full batch, a barrier or backpressure
+        self._wakeup.clear()
+        await self._wakeup.wait()
+
+    async def _flush(self) -> None:
+        while self._pending:
+            collection, ops = next(iter(self._pending.items()))
+            batch = ops[:self.batch_size]
+            del ops[:self.batch_size]
+            # Round-robin, so a busy collection does not hold up the others
+            del self._pending[collection]
+            if ops:
+                self._pending[collection] = ops
+            await self._write(collection, batch)
+            self._done += len(batch)
+            self._done_by[collection] = self._done_by.get(collection, 0) + len(batch)
+            async with self._progress:
+                self._progress.notify_all()
+
+    async def _write(self, collection: str, ops: List[Any], drop: bool = True) -> None:
+        """One ordered bulk_write, retrying the unwritten tail with backoff; ``drop=False`` raises instead of dropping."""
+        from pymongo.errors import BulkWriteError
+
+        attempt = 0
+        while ops:
+            try:
+                await self.db[collection].bulk_write(ops, ordered=True)
+                self.stats["writes"] += len(ops)
+                self.stats["batches"] += 1
+                return
+            except BulkWriteError as e:
+                # Everything before the first error was applied
+                error = e.details["writeErrors"][0]
+                self.stats["writes"] += error["index"]
+                if error["code"] == DUPLICATE_KEY:
+                    # On a retry: an insert that landed on an earlier attempt
+                    if attempt == 0:
+                        print(f"WARNING: Skipping duplicate write to {collection}: {error.get('errmsg')}")
+                    ops = ops[error["index"] + 1:]
+                    continue
+                ops = ops[error["index"]:]
+                failure: Exception = e
+            except Exception as e:
+                failure = e
+            attempt += 1
+            if attempt > self.max_retries:
+                if not drop:
+                    raise failure
+                self.stats["dropped"] += len(ops)
+                self.dropped.append({"collection": collection, "writes": len(ops), "error": str(failure), "at": time.time()})
+                print(f"ERROR: Dropping {len(ops)} writes to {collection} after {self.max_retries} retries: {failure}")
+                return
+            self.stats["retries"] += 1
+            delay = min(0.1 * 2 ** attempt, 5.0)
+            print(f"Write to {collection} failed ({failure}); retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+# Global instance
+write_behind = None
+
+def get_write_behind(db) -> WriteBehindQueue:
+    global write_behind
+    if write_behind is None:
+        write_behind = WriteBehindQueue(db)
+    return write_behind
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, B
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.security import OAuth2PasswordRequestForm
+from pymongo.errors import DuplicateKeyError
 from typing import List
 from pathlib import Path
 import os  # Add os import for environment variables
@@ -95,6 +96,9 @@ async def register(username: str = Form(...), password: str = Form(...), email:
         return {"message": "User created successfully"}
     except HTTPException:
         raise
+    except DuplicateKeyError:
+        # Concurrent registration of the same name (unique index on username)
+        raise HTTPException(status_code=400, detail="Username already registered")
     except Exception as e:
         print(f"Registration error: {e}")
         import traceback
@@ -283,11 +287,12 @@ async def upload_report(
     file: UploadFile = File(...),
     current_user: dict = Depends(get_current_user)
 ):
-    # Save uploaded file temporarily
-    temp_path = f"temp_{file.filename}"
-    with open(temp_path, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
+    # Stream the upload (size limit, PDF check) instead of writing a temp copy to the working directory
+    from ml.uploads import REPORT_TYPES, UploadRejected, ingest_upload
+    try:
+        upload = await ingest_upload(file, allowed=REPORT_TYPES)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     
     # Debug: Check environment variables before analysis
     print(f"DEBUG UPLOAD: GEMINI_API_KEY from env: {os.getenv('GEMINI_API_KEY', 'NOT_FOUND')[:10] if os.getenv('GEMINI_API_KEY') else 'NOT_FOUND'}")
@@ -295,19 +300,15 @@ async def upload_report(
     try:
         # Use the advanced NLP analysis
         from ml.nlp_utils import analyze_report
-        # analyze_report is synchronous and expects bytes
-        analysis = analyze_report(content)
-        
-        # Clean up
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-            
+        from ml.inference_executor import get_inference_executor
+        # analyze_report is synchronous and expects bytes; keep it off the event loop
+        analysis = await get_inference_executor().run(analyze_report, bytes(upload.data))
         return analysis
     except Exception as e:
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
         print(f"Error analyzing report: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        upload.close()
 
 # --- Phase 4: Medicine ---
 
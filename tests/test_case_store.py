@@ -0,0 +1,143 @@
+import asyncio
+import itertools
+import random
+
+import pytest
+
+from ml.case_store import PENDING_REVIEW, REVIEWED, InMemoryCaseStore, ScanCase, WorklistQuery, decode_cursor
+
+LABELS = ("HIGH", "LOW", "MODEL_UNAVAILABLE")
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def make_cases(n=60, seed=7):
+    rng = random.Random(seed)
+    cases = []
+    for case_id in range(1, n + 1):
+        # Few distinct days, times and scores, so sort keys tie a lot
+        day = rng.choice(["2024-03-01", "2024-03-02", "2024-03-04"])
+        cases.append(ScanCase(
+            case_id=case_id,
+            patient_name=f"patient {case_id}",
+            risk_label=rng.choice(LABELS),
+            risk_score=rng.choice([0.1, 0.5, 0.5, 0.9]),
+            status=rng.choice([PENDING_REVIEW, REVIEWED]),
+            timestamp=f"{day} {rng.choice(['09:00:00', '12:30:00'])}",
+        ))
+    return cases
+
+
+@pytest.fixture
+def store():
+    store = InMemoryCaseStore()
+
+    async def fill():
+        for case in make_cases():
+            await store.add(case)
+
+    run(fill())
+    return store
+
+
+def expected(cases, query):
+    matching = [case for case in cases if query.matches(case)]
+    key = (lambda c: (c.risk_score, c.case_id)) if query.sort == "risk_score" else (lambda c: (c.timestamp, c.case_id))
+    return [case.case_id for case in sorted(matching, key=key, reverse=query.descending)]
+
+
+def pages(list_page, **filters):
+    """Every case id, page by page, following next_cursor; also the totals reported."""
+    ids, totals, cursor = [], set(), None
+    while True:
+        page = run(list_page(WorklistQuery(cursor=cursor, limit=7, **filters)))
+        ids.extend(case.case_id for case in page.cases)
+        totals.add(page.total)
+        if page.next_cursor is None:
+            return ids, totals
+        cursor = page.next_cursor
+
+
+FILTERS = [
+    {},
+    {"status": PENDING_REVIEW},
+    {"risk_label": "HIGH"},
+    {"status": REVIEWED, "risk_label": "LOW"},
+    {"date_from": "2024-03-02"},
+    {"date_from": "2024-03-02", "date_to": "2024-03-02"},
+    {"status": PENDING_REVIEW, "risk_label": "HIGH", "date_to": "2024-03-02"},
+    {"risk_label": "NO_SUCH_LABEL"},
+]
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+@pytest.mark.parametrize("sort,descending", list(itertools.product(["timestamp", "risk_score"], [True, False])))
+def test_keyset_pages_cover_every_match_once_in_order(store, filters, sort, descending):
+    query = dict(filters, sort=sort, descending=descending)
+    ids, totals = pages(store.worklist, **query)
+    want = expected(make_cases(), WorklistQuery(**query))
+    assert ids == want
+    assert totals == {len(want)}
+
+
+def test_pages_follow_status_changes(store):
+    query = {"status": PENDING_REVIEW, "risk_label": "HIGH"}
+    before, _ = pages(store.worklist, **query)
+    run(store.set_status(before[0], REVIEWED))
+    after, totals = pages(store.worklist, **query)
+    assert after == before[1:]
+    assert totals == {len(before) - 1}
+    reviewed, _ = pages(store.worklist, status=REVIEWED, risk_label="HIGH")
+    assert before[0] in reviewed
+
+
+def test_cursor_must_match_sort():
+    cursor = run(InMemoryCaseStore().worklist(WorklistQuery(limit=1))).next_cursor
+    assert cursor is None
+    with pytest.raises(ValueError):
+        WorklistQuery(sort="risk_score", cursor="WyIyMDI0IiwgMV0")  # ["2024", 1]
+    with pytest.raises(ValueError):
+        decode_cursor("not base64!")
+
+
+# -------------------- Mongo query parity --------------------
+
+def evaluate(doc, query):
+    """Enough of Mongo's query language for WorklistQuery.mongo_filter."""
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(evaluate(doc, branch) for branch in condition):
+                return False
+            continue
+        value = doc.get(field)
+        if isinstance(condition, dict):
+            ops = {"$lt": lambda a, b: a < b, "$gt": lambda a, b: a > b, "$gte": lambda a, b: a >= b}
+            if value is None or not all(ops[op](value, bound) for op, bound in condition.items()):
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+def mongo_page(docs):
+    """What MongoCaseStore.worklist reads, evaluated over plain documents."""
+    from ml.case_store import _page
+
+    async def list_page(query):
+        matching = [doc for doc in docs if evaluate(doc, query.mongo_filter())]
+        for field, direction in reversed(query.mongo_sort()):
+            matching.sort(key=lambda doc: doc[field], reverse=direction < 0)
+        total = sum(1 for doc in docs if evaluate(doc, query.mongo_filter(with_cursor=False)))
+        return _page(query, [ScanCase.from_doc(doc) for doc in matching[:query.limit + 1]], total)
+
+    return list_page
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+@pytest.mark.parametrize("sort,descending", list(itertools.product(["timestamp", "risk_score"], [True, False])))
+def test_mongo_filter_pages_like_the_memory_store(store, filters, sort, descending):
+    docs = [case.to_doc() for case in make_cases()]
+    query = dict(filters, sort=sort, descending=descending)
+    assert pages(mongo_page(docs), **query) == pages(store.worklist, **query)
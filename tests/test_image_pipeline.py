@@ -0,0 +1,65 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+cv2 = pytest.importorskip("cv2")
+
+from ml.image_pipeline import DecodedImage
+
+
+def cv2_decode(data: bytes) -> np.ndarray:
+    """The segmenter's original decode."""
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+def encode(image: Image.Image, fmt: str, **params) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format=fmt, **params)
+    return buffer.getvalue()
+
+
+def gradient(width: int, height: int) -> np.ndarray:
+    x = np.linspace(0, 255, width, dtype=np.uint8)
+    y = np.linspace(0, 255, height, dtype=np.uint8)
+    return np.stack([np.tile(x, (height, 1)), np.tile(y[:, None], (1, width)), np.full((height, width), 128, np.uint8)], -1)
+
+
+def test_bgr_matches_cv2_for_16_bit_png():
+    data = encode(Image.fromarray(np.linspace(0, 65535, 64 * 48, dtype=np.uint16).reshape(48, 64)), "PNG")
+    image = DecodedImage(data)
+    expected = cv2_decode(data)
+    assert np.array_equal(image.bgr, expected)
+    assert (image.bgr == 255).mean() < 0.1
+    assert image.shape == expected.shape[:2]
+
+
+def test_bgr_matches_cv2_for_exif_rotated_jpeg():
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotate 90 degrees clockwise
+    data = encode(Image.fromarray(gradient(120, 80)), "JPEG", exif=exif.tobytes(), quality=95)
+    image = DecodedImage(data)
+    expected = cv2_decode(data)
+    assert expected.shape[:2] == (120, 80)
+    assert np.array_equal(image.bgr, expected)
+    assert image.shape == (120, 80)
+
+
+def test_reduced_bgr_is_oriented_like_full_decode():
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    data = encode(Image.fromarray(gradient(1200, 800)), "JPEG", exif=exif.tobytes(), quality=95)
+    image = DecodedImage(data)
+    reduced = image.reduced_bgr((256, 256))
+    assert image.reduction_for((256, 256)) > 1
+    assert reduced.shape[0] > reduced.shape[1]
+    full = cv2.resize(image.bgr, (256, 256)).astype(int)
+    assert np.abs(cv2.resize(reduced, (256, 256)).astype(int) - full).mean() < 4
+
+
+def test_bgr_matches_cv2_for_rgb_png():
+    data = encode(Image.fromarray(gradient(64, 48)), "PNG")
+    image = DecodedImage(data)
+    assert np.array_equal(image.bgr, cv2_decode(data))
+    assert np.array_equal(image.bgr[:, :, ::-1], np.asarray(image.rgb))
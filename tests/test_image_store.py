@@ -0,0 +1,123 @@
+import hashlib
+import threading
+
+import pytest
+
+pytest.importorskip("starlette")
+from ml.image_store import IMAGE_CACHE_CONTROL, ImageStore, ImmutableStaticFiles, is_derivative
+
+
+class FakeUpload:
+    def __init__(self, data: bytes, mime: str = "image/png") -> None:
+        self.data = data
+        self.mime = mime
+        self.sha256 = hashlib.sha256(data).hexdigest()
+
+    def save(self, path) -> None:
+        with open(path, "wb") as f:
+            f.write(self.data)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ImageStore(tmp_path / "images", "/static/images")
+
+
+def test_image_is_stored_once_per_content(store):
+    upload = FakeUpload(b"scan")
+    first = store.put(upload, "case_1")
+    second = store.put(upload, "case_2")
+    assert first.created and not second.created
+    assert first.path == second.path
+    assert first.path.read_bytes() == b"scan"
+    assert first.url == f"/static/images/{upload.sha256[:2]}/{upload.sha256[2:4]}/{upload.sha256}.png"
+    assert store.stats() == {"images": 1, "derivatives": 0, "bytes": 4}
+
+
+def test_files_are_deleted_with_the_last_reference(store):
+    upload = FakeUpload(b"scan")
+    stored = store.put(upload, "case_1", {"thumb": lambda: b"thumb"})
+    store.put(upload, "case_2", {"thumb": lambda: b"thumb"})
+    thumb = stored.path.with_name(f"{upload.sha256}.thumb.jpg")
+    assert is_derivative(thumb) and not is_derivative(stored.path)
+
+    assert store.release(stored.path, "case_1") is False
+    assert stored.path.exists() and thumb.exists()
+    # Releasing the same owner twice does not drop another owner's reference
+    assert store.release(stored.path, "case_1") is False
+    assert store.release(stored.path, "case_2") is True
+    assert not stored.path.exists() and not thumb.exists()
+    assert store.stats()["images"] == 0
+
+
+def test_derivatives_are_rendered_only_when_missing(store):
+    upload = FakeUpload(b"scan")
+    calls = []
+
+    def render():
+        calls.append(1)
+        return b"thumb"
+
+    first = store.put(upload, "case_1", {"thumb": render})
+    store.put(upload, "case_2", {"thumb": render})
+    assert len(calls) == 1
+    assert first.derivatives["thumb"].endswith(f"{upload.sha256}.thumb.jpg")
+
+    # A failed render leaves the derivative out but still stores the image
+    broken = store.put(FakeUpload(b"other"), "case_3", {"thumb": lambda: 1 / 0})
+    assert broken.derivatives == {} and broken.path.exists()
+
+
+def test_put_after_last_release_stores_the_files_again(store):
+    upload = FakeUpload(b"scan")
+    stored = store.put(upload, "case_1", {"thumb": lambda: b"thumb"})
+    store.release(stored.path, "case_1")
+    again = store.put(upload, "case_2", {"thumb": lambda: b"thumb"})
+    assert again.created
+    assert again.path.read_bytes() == b"scan"
+    assert again.path.with_name(f"{upload.sha256}.thumb.jpg").exists()
+
+
+def test_concurrent_put_and_release_never_lose_a_referenced_image(store):
+    upload = FakeUpload(b"scan")
+    errors = []
+
+    def churn(worker: int) -> None:
+        for i in range(200):
+            owner = f"case_{worker}_{i}"
+            stored = store.put(upload, owner, {"thumb": lambda: b"thumb"})
+            # While we hold a reference the image and its derivative must exist
+            if not stored.path.exists() or "thumb" not in stored.derivatives:
+                errors.append(owner)
+            elif not stored.path.with_name(f"{upload.sha256}.thumb.jpg").exists():
+                errors.append(owner)
+            store.release(stored.path, owner)
+
+    threads = [threading.Thread(target=churn, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert store.stats()["images"] == 0
+
+
+def test_only_images_and_derivatives_are_served(store):
+    testclient = pytest.importorskip("starlette.testclient")
+    from starlette.applications import Starlette
+    from starlette.routing import Mount
+
+    upload = FakeUpload(b"scan")
+    stored = store.put(upload, "case_1", {"thumb": lambda: b"thumb"})
+    app = Starlette(routes=[Mount("/static/images", ImmutableStaticFiles(directory=store.root))])
+    client = testclient.TestClient(app)
+
+    image = client.get(stored.url)
+    assert image.status_code == 200 and image.content == b"scan"
+    assert image.headers["cache-control"] == IMAGE_CACHE_CONTROL
+    assert client.get(stored.derivatives["thumb"]).content == b"thumb"
+
+    shard = stored.url.rsplit("/", 1)[0]
+    (stored.path.parent / f".{stored.path.name}.1.2.tmp").write_bytes(b"partial")
+    for hidden in (f"{shard}/{upload.sha256}.refs/case_1", f"{shard}/.lock", f"{shard}/.{stored.path.name}.1.2.tmp", shard):
+        assert client.get(hidden).status_code == 404, hidden
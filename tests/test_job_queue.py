@@ -0,0 +1,170 @@
+import asyncio
+import time
+
+import pytest
+
+import ml.job_queue as job_queue
+from ml.job_queue import JobQueue, SQLiteJobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SQLiteJobStore(tmp_path / "jobs.sqlite3")
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def make_queue(store, tmp_path, workers=1):
+    return JobQueue(store, workers=workers, data_dir=tmp_path / "data")
+
+
+def test_claimed_job_is_not_claimed_again_while_leased(store, tmp_path):
+    async def scenario():
+        queue = make_queue(store, tmp_path)
+        queue.handlers["report"] = None
+        job_id = await queue.submit("report", {"inputs": []})
+        first = await store.claim_next("worker-a", lease_seconds=60)
+        second = await store.claim_next("worker-b", lease_seconds=60)
+        return job_id, first, second
+
+    job_id, first, second = run(scenario())
+    assert first["id"] == job_id and first["worker"] == "worker-a" and first["attempts"] == 1
+    assert second is None
+
+
+def test_lapsed_lease_is_reclaimed_by_another_worker(store, tmp_path):
+    async def scenario():
+        queue = make_queue(store, tmp_path)
+        queue.handlers["report"] = None
+        await queue.submit("report", {"inputs": []})
+        await store.claim_next("worker-a", lease_seconds=0.05)
+        await asyncio.sleep(0.1)
+        # worker-a died without renewing its lease
+        return await store.claim_next("worker-b", lease_seconds=60)
+
+    reclaimed = run(scenario())
+    assert reclaimed["worker"] == "worker-b"
+    assert reclaimed["status"] == "running"
+    assert reclaimed["attempts"] == 2
+
+
+def test_jobs_are_claimed_oldest_first(store, tmp_path):
+    async def scenario():
+        queue = make_queue(store, tmp_path)
+        queue.handlers["report"] = None
+        first = await queue.submit("report", {"n": 1})
+        await asyncio.sleep(0.01)
+        second = await queue.submit("report", {"n": 2})
+        claims = [await store.claim_next("w", 60), await store.claim_next("w", 60)]
+        return [first, second], [job["id"] for job in claims]
+
+    submitted, claimed = run(scenario())
+    assert claimed == submitted
+
+
+def test_worker_runs_reclaimed_job_and_gives_up_after_max_attempts(store, tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(job_queue, "JOB_POLL_SECONDS", 0.01)
+
+    async def scenario():
+        queue = make_queue(store, tmp_path)
+        runs = []
+
+        @queue.handler("report")
+        async def handler(job, progress):
+            runs.append(job["attempts"])
+            await progress(0.5, "halfway")
+            return {"ok": True}
+
+        retried = await queue.submit("report", {})
+        exhausted = await queue.submit("report", {})
+        # Claimed before by workers that died: once for the first job, twice for the second
+        for job_id, attempts in ((retried, 1), (exhausted, 2)):
+            await store.update(job_id, {"status": "running", "worker": "dead-worker",
+                                        "lease_until": time.time() - 1, "attempts": attempts})
+        await queue.start()
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            jobs = [await queue.get(retried), await queue.get(exhausted)]
+            if all(job["status"] in job_queue.TERMINAL_STATUSES for job in jobs):
+                break
+            await asyncio.sleep(0.02)
+        await queue.stop()
+        return runs, jobs
+
+    runs, (retried, exhausted) = run(scenario())
+    assert retried["status"] == "succeeded"
+    assert retried["result"] == {"ok": True}
+    assert retried["attempts"] == 2
+    assert exhausted["status"] == "failed"
+    assert "giving up" in exhausted["error"]
+    assert runs == [2]
+
+
+def test_job_requeued_on_shutdown_keeps_its_attempts(store, tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_POLL_SECONDS", 0.01)
+
+    async def scenario():
+        queue = make_queue(store, tmp_path)
+        started = asyncio.Event()
+
+        @queue.handler("report")
+        async def handler(job, progress):
+            started.set()
+            await asyncio.sleep(60)
+
+        job_id = await queue.submit("report", {})
+        await queue.start()
+        await asyncio.wait_for(started.wait(), 5)
+        await queue.stop()
+        return await queue.get(job_id)
+
+    job = run(scenario())
+    assert job["status"] == "queued"
+    assert job["worker"] is None
+    assert job["attempts"] == 0
+
+
+def test_handler_timeout_is_not_reported_as_job_deadline(store, tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_POLL_SECONDS", 0.01)
+    monkeypatch.setattr(job_queue, "JOB_TIMEOUT_SECONDS", 60)
+
+    async def scenario():
+        queue = make_queue(store, tmp_path)
+
+        @queue.handler("report")
+        async def handler(job, progress):
+            raise TimeoutError("database read timed out")
+
+        job_id = await queue.submit("report", {})
+        await queue.start()
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            job = await queue.get(job_id)
+            if job["status"] in job_queue.TERMINAL_STATUSES:
+                break
+            await asyncio.sleep(0.02)
+        await queue.stop()
+        return job
+
+    job = run(scenario())
+    assert job["status"] == "failed"
+    assert job["error"] == "database read timed out"
+
+
+def test_items_are_paged_in_order_and_replaced_on_rerun(store, tmp_path):
+    async def scenario():
+        queue = make_queue(store, tmp_path)
+        await queue.save_items("job", 0, [{"index": i, "run": 1} for i in range(5)])
+        await queue.save_items("job", 5, [{"index": i, "run": 1} for i in range(5, 8)])
+        # A re-run after a lapsed lease writes the same indexes again
+        await queue.save_items("job", 0, [{"index": i, "run": 2} for i in range(3)])
+        await queue.save_items("other", 0, [{"index": 0}])
+        return await queue.items("job", 0, 5), await queue.items("job", 5, 5), await queue.items("job", 8, 5)
+
+    first, second, rest = run(scenario())
+    assert [item["index"] for item in first + second] == list(range(8))
+    assert [item["run"] for item in first] == [2, 2, 2, 1, 1]
+    assert rest == []
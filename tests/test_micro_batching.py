@@ -0,0 +1,108 @@
+import threading
+
+import numpy as np
+import pytest
+
+from ml.model_utils import MicroBatchingEngine
+
+
+class FakeModel:
+    """Inputs are numbers; each preprocessed row holds its value and the "probability" is that value."""
+
+    model = object()
+
+    def __init__(self, tta_views: int = 3) -> None:
+        self.tta_views = tta_views
+        self.batches = []
+        self.fail_predict = False
+        self.lock = threading.Lock()
+
+    def preprocess_bytes(self, value):
+        if value is None:
+            raise ValueError("corrupt upload")
+        return np.array([[value]], dtype=np.float32)
+
+    def preprocess_tta(self, value):
+        return np.array([[value + offset] for offset in range(self.tta_views)], dtype=np.float32)
+
+    def predict_proba_batch(self, x):
+        with self.lock:
+            self.batches.append(len(x))
+        if self.fail_predict:
+            raise RuntimeError("model crashed")
+        return x[:, 0]
+
+
+@pytest.fixture
+def model():
+    return FakeModel()
+
+
+def engine_for(model, **kwargs):
+    kwargs.setdefault("batch_window_ms", 200)
+    return MicroBatchingEngine(model, **kwargs)
+
+
+def test_results_go_back_to_their_callers_and_batches_are_split(model):
+    engine = engine_for(model, max_batch_size=4)
+    try:
+        futures = [engine.submit(float(i)) for i in range(10)]
+        assert [f.result(timeout=5) for f in futures] == [float(i) for i in range(10)]
+    finally:
+        engine.close()
+    assert model.batches == [4, 4, 2]
+
+
+def test_tta_rows_are_sliced_per_caller(model):
+    engine = engine_for(model)
+    try:
+        plain = engine.submit(0.5)
+        tta = engine.submit(10.0, tta=True)
+        last = engine.submit(0.25)
+        mean, variance = tta.result(timeout=5)
+        assert (plain.result(timeout=5), last.result(timeout=5)) == (0.5, 0.25)
+    finally:
+        engine.close()
+    # One forward pass: 1 + 3 views + 1 rows
+    assert model.batches == [5]
+    assert mean == pytest.approx(11.0)
+    assert variance == pytest.approx(np.var([10.0, 11.0, 12.0]))
+
+
+def test_a_corrupt_input_only_fails_its_own_caller(model):
+    engine = engine_for(model)
+    try:
+        good = engine.submit(0.75)
+        bad = engine.submit(None)
+        with pytest.raises(ValueError, match="corrupt"):
+            bad.result(timeout=5)
+        assert good.result(timeout=5) == 0.75
+    finally:
+        engine.close()
+
+
+def test_inference_errors_reach_every_caller_in_the_batch(model):
+    model.fail_predict = True
+    engine = engine_for(model)
+    try:
+        futures = [engine.submit(0.1), engine.submit(0.2, tta=True)]
+        for future in futures:
+            with pytest.raises(RuntimeError, match="model crashed"):
+                future.result(timeout=5)
+        # The worker survives and serves the next batch
+        model.fail_predict = False
+        assert engine.submit(0.3).result(timeout=5) == pytest.approx(0.3)
+    finally:
+        engine.close()
+
+
+def test_unavailable_model_fails_the_batch():
+    def missing():
+        raise FileNotFoundError("no classifier")
+
+    engine = engine_for(missing)
+    try:
+        with pytest.raises(FileNotFoundError):
+            engine.submit(0.1).result(timeout=5)
+    finally:
+        engine.close()
@@ -0,0 +1,81 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+pytest.importorskip("cv2")
+import ml.segmentation_utils as segmentation_utils
+from ml.image_pipeline import DecodedImage
+from ml.segmentation_utils import SegmentationModel
+
+
+def pointwise_predictor(batches):
+    """A "U-Net" whose output at each pixel depends on that pixel only (the blue channel)."""
+    def predict(x):
+        batches.append(len(x))
+        return x[..., :1].astype(np.float32)
+    return predict
+
+
+def make_model(batches=None):
+    model = SegmentationModel.__new__(SegmentationModel)
+    model.img_size = 256
+    model.model = object()
+    model.predictor = pointwise_predictor(batches if batches is not None else [])
+    return model
+
+
+def scan(height, width, seed=0):
+    """BGR image whose blue channel is far from the 0.5 threshold everywhere."""
+    rng = np.random.default_rng(seed)
+    img = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    img[..., 0] = np.where(rng.random((height, width)) > 0.7, 230, 20)
+    return img
+
+
+def png(bgr):
+    buffer = BytesIO()
+    Image.fromarray(bgr[:, :, ::-1]).save(buffer, format="PNG")
+    return DecodedImage(buffer.getvalue())
+
+
+def expected_mask(bgr):
+    return (bgr[..., 0] > 127).astype(np.uint8) * 255
+
+
+def test_tiled_equals_standard_at_model_resolution():
+    bgr = scan(256, 256)
+    model = make_model()
+    image = png(bgr)
+    standard = model.predict_binary_mask(image, "standard")
+    tiled = model.predict_binary_mask(image, "tiled")
+    assert np.array_equal(tiled, standard)
+    assert np.array_equal(tiled, expected_mask(bgr))
+
+
+@pytest.mark.parametrize("shape", [(700, 900), (256, 1000), (513, 257), (100, 150)])
+def test_tiled_mask_blends_back_to_the_pointwise_mask(monkeypatch, shape):
+    # Small budget so each band is predicted in several batches
+    monkeypatch.setattr(segmentation_utils, "SEGMENTATION_TILE_MEMORY_MB", 2)
+    batches = []
+    bgr = scan(*shape, seed=sum(shape))
+    mask = make_model(batches).predict_binary_mask(png(bgr), "tiled")
+    assert mask.shape == shape
+    assert np.array_equal(mask, expected_mask(bgr))
+    assert max(batches) <= 2
+
+
+def test_huge_images_are_segmented_downscaled_at_original_size(monkeypatch):
+    monkeypatch.setattr(segmentation_utils, "SEGMENTATION_MAX_MEGAPIXELS", 0.25)
+    bgr = np.zeros((1200, 1000, 3), dtype=np.uint8)
+    bgr[300:900, 200:800, 0] = 255
+    mask = make_model().predict_binary_mask(png(bgr), "tiled")
+    assert mask.shape == (1200, 1000)
+    # Same lesion, up to the resampling at its border
+    assert (mask != expected_mask(bgr)).mean() < 0.01
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        make_model().predict_binary_mask(png(scan(64, 64)), "mosaic")
@@ -0,0 +1,115 @@
+import io
+import zipfile
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("multipart")
+from fastapi import FastAPI, File, UploadFile
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from ml.bulk_analysis import iter_bulk_images
+from ml.uploads import BULK_LIMITS, UploadLimitMiddleware, UploadRejected, ingest_upload, ingest_uploads
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 100
+LIMIT = 4096
+
+
+def make_app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(UploadLimitMiddleware, max_bytes=LIMIT, bulk_max_bytes=LIMIT * 4)
+
+    @app.post("/single")
+    async def single(file: UploadFile = File(...)):
+        try:
+            upload = await ingest_upload(file, max_bytes=1024)
+        except UploadRejected as e:
+            return JSONResponse({"error": e.detail}, status_code=e.status_code)
+        with upload:
+            return {"size": upload.size, "mime": upload.mime}
+
+    @app.post("/api/bulk-analyze")
+    async def bulk(files: list[UploadFile] = File(...)):
+        try:
+            uploads = await ingest_uploads(files, **BULK_LIMITS)
+        except UploadRejected as e:
+            return JSONResponse({"error": e.detail}, status_code=e.status_code)
+        for upload in uploads:
+            upload.close()
+        return {"files": len(uploads)}
+
+    return app
+
+
+@pytest.fixture
+def client():
+    return TestClient(make_app())
+
+
+def test_accepts_image(client):
+    response = client.post("/single", files={"file": ("scan.png", PNG, "image/png")})
+    assert response.status_code == 200
+    assert response.json() == {"size": len(PNG), "mime": "image/png"}
+
+
+def test_rejects_wrong_type_by_content(client):
+    # The declared content type is not trusted
+    response = client.post("/single", files={"file": ("scan.png", b"MZ\x90\x00" * 10, "image/png")})
+    assert response.status_code == 415
+
+
+def test_rejects_oversized_file(client):
+    response = client.post("/single", files={"file": ("scan.png", PNG + b"\x00" * 2048, "image/png")})
+    assert response.status_code == 413
+
+
+def test_rejects_empty_file(client):
+    response = client.post("/single", files={"file": ("scan.png", b"", "image/png")})
+    assert response.status_code == 400
+
+
+def test_declared_length_over_limit_is_413(client):
+    response = client.post("/single", content=b"x" * (LIMIT + 128 * 1024),
+                           headers={"content-type": "multipart/form-data; boundary=x"})
+    assert response.status_code == 413
+
+
+def test_streamed_body_over_limit_is_413(client):
+    def chunks():
+        for _ in range(40):
+            yield b"x" * 4096
+    # No Content-Length: the middleware counts the body as it arrives
+    response = client.post("/single", content=chunks(), headers={"content-type": "multipart/form-data; boundary=x"})
+    assert response.status_code == 413
+    assert "limit" in response.json()["error"]
+
+
+def test_bulk_checks_every_file(client):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as z:
+        z.writestr("a.png", PNG)
+    ok = client.post("/api/bulk-analyze", files=[
+        ("files", ("a.png", PNG, "image/png")),
+        ("files", ("b.zip", archive.getvalue(), "application/zip")),
+    ])
+    assert ok.status_code == 200
+    assert ok.json() == {"files": 2}
+
+    rejected = client.post("/api/bulk-analyze", files=[
+        ("files", ("a.png", PNG, "image/png")),
+        ("files", ("notes.txt", b"hello world", "text/plain")),
+    ])
+    assert rejected.status_code == 415
+
+
+def test_bulk_archive_members_are_type_checked():
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as z:
+        z.writestr("good.png", PNG)
+        z.writestr("bad.png", b"not an image")
+    items = list(iter_bulk_images([("scans.zip", archive)]))
+    assert [(name, error) for name, _, error in items] == [
+        ("scans.zip/good.png", None),
+        ("scans.zip/bad.png", "Not a supported image file"),
+    ]
@@ -0,0 +1,175 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("pymongo")
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from ml.write_behind import DUPLICATE_KEY, WriteBehindQueue
+
+
+class FakeCollection:
+    """Records bulk_write calls; ``failures`` are raised by the next calls, in order."""
+
+    def __init__(self, name: str, db: "FakeDB") -> None:
+        self.name = name
+        self.db = db
+        self.failures = []
+
+    async def bulk_write(self, ops, ordered=True):
+        assert ordered
+        self.db.calls.append((self.name, list(ops)))
+        if self.failures:
+            failure = self.failures.pop(0)
+            if isinstance(failure, Exception):
+                raise failure
+            # (index of the failing op, error code): the ops before it were applied
+            index, code = failure
+            self.db.applied.extend((self.name, op) for op in ops[:index])
+            raise BulkWriteError({"writeErrors": [{"index": index, "code": code, "errmsg": "error"}]})
+        self.db.applied.extend((self.name, op) for op in ops)
+
+
+class FakeDB:
+    def __init__(self) -> None:
+        self.calls = []
+        self.applied = []
+        self.collections = {}
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        return self.collections.setdefault(name, FakeCollection(name, self))
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def _no_sleep(delay, result=None):
+    return result
+
+
+def docs(applied, collection):
+    return [op._doc for name, op in applied if name == collection and isinstance(op, InsertOne)]
+
+
+def test_writes_are_batched_in_queue_order():
+    async def scenario():
+        db = FakeDB()
+        queue = WriteBehindQueue(db, batch_size=3, flush_seconds=0.01)
+        await queue.start()
+        for i in range(7):
+            await queue.insert("cases", {"n": i})
+        await queue.update("cases", {"n": 0}, {"$set": {"status": "REVIEWED"}})
+        assert await queue.barrier()
+        await queue.stop()
+        return db, queue
+
+    db, queue = run(scenario())
+    assert [doc["n"] for doc in docs(db.applied, "cases")] == list(range(7))
+    assert isinstance(db.applied[-1][1], UpdateOne)
+    assert all(len(ops) <= 3 for _, ops in db.calls)
+    assert queue.stats["writes"] == 8
+    assert queue.pending == 0
+
+
+def test_duplicate_key_skips_only_the_landed_insert():
+    db = FakeDB()
+    # The second insert already landed on an earlier attempt
+    db["cases"].failures = [(1, DUPLICATE_KEY)]
+
+    async def scenario():
+        queue = WriteBehindQueue(db, batch_size=10, flush_seconds=0.01, max_retries=3)
+        await queue.start()
+        for i in range(3):
+            await queue.insert("cases", {"n": i})
+        await queue.barrier()
+        await queue.stop()
+        return queue
+
+    queue = run(scenario())
+    # Applied before the error, skipped, then the tail in a follow-up bulk_write
+    assert [doc["n"] for doc in docs(db.applied, "cases")] == [0, 2]
+    assert [len(ops) for _, ops in db.calls] == [3, 1]
+    assert queue.stats["dropped"] == 0
+    assert queue.stats["retries"] == 0
+
+
+def test_failed_batch_is_retried_then_dropped_and_reported(monkeypatch):
+    monkeypatch.setattr(asyncio, "sleep", _no_sleep)
+
+    async def scenario():
+        db = FakeDB()
+        db["cases"].failures = [ConnectionError("down")] * 3
+        queue = WriteBehindQueue(db, batch_size=10, flush_seconds=0.01, max_retries=2)
+        await queue.start()
+        await queue.insert("cases", {"n": 1})
+        await queue.barrier()
+        await queue.stop()
+        return db, queue
+
+    db, queue = run(scenario())
+    assert db.applied == []
+    assert queue.stats["retries"] == 2
+    assert queue.stats["dropped"] == 1
+    assert queue.dropped[-1]["collection"] == "cases"
+    assert "down" in queue.dropped[-1]["error"]
+
+
+def test_write_through_raises_instead_of_dropping(monkeypatch):
+    monkeypatch.setattr(asyncio, "sleep", _no_sleep)
+    db = FakeDB()
+    db["cases"].failures = [ConnectionError("down")] * 3
+    queue = WriteBehindQueue(db, max_retries=1)
+    with pytest.raises(ConnectionError):
+        run(queue.insert("cases", {"n": 1}))
+    assert queue.stats["dropped"] == 0
+
+
+def test_barrier_is_scoped_and_bounded():
+    async def scenario():
+        db = FakeDB()
+        release = asyncio.Event()
+        original = db["slow"].bulk_write
+
+        async def stalled(ops, ordered=True):
+            await release.wait()
+            await original(ops, ordered)
+
+        db["slow"].bulk_write = stalled
+        queue = WriteBehindQueue(db, batch_size=10, flush_seconds=0.01)
+        await queue.start()
+        await queue.insert("slow", {"n": 1})
+        await asyncio.sleep(0.05)  # the flusher is now stuck on "slow"
+        timed_out = await queue.barrier("slow", timeout=0.05)
+        # Nothing queued for "cases": no wait at all
+        unrelated = await queue.barrier("cases", timeout=0.05)
+        release.set()
+        flushed = await queue.barrier("slow", timeout=1)
+        await queue.stop()
+        return timed_out, unrelated, flushed, db
+
+    timed_out, unrelated, flushed, db = run(scenario())
+    assert timed_out is False
+    assert unrelated is True
+    assert flushed is True
+    assert [doc["n"] for doc in docs(db.applied, "slow")] == [1]
+
+
+def test_insert_keeps_client_id_across_retries(monkeypatch):
+    monkeypatch.setattr(asyncio, "sleep", _no_sleep)
+
+    async def scenario():
+        db = FakeDB()
+        db["cases"].failures = [ConnectionError("timeout")]
+        queue = WriteBehindQueue(db, batch_size=10, flush_seconds=0.01)
+        await queue.start()
+        await queue.insert("cases", {"n": 1})
+        await queue.barrier()
+        await queue.stop()
+        return db
+
+    db = run(scenario())
+    (_, first), (_, second) = db.calls
+    assert isinstance(first[0], InsertOne)
+    assert first[0]._doc["_id"] == second[0]._doc["_id"]